@@ -0,0 +1,307 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+''' Throughput benchmarks, with machine-readable output.
+
+    Run `python -m o11c.benchmark --help` for the options. The output is
+    a JSON object with a `meta` section describing the machine and a flat
+    list of `results`, one per measurement, so that runs from different
+    releases can be compared with a few lines of code.
+'''
+
+
+import argparse
+import bisect
+import heapq
+import json
+import platform
+import random
+import sys
+import time
+
+from .containers import sorted as containers
+from .iterators import MinIter
+
+
+SET_CLASSES = ['SortedSet', 'RangeSet', 'AutoSet']
+MAP_CLASSES = ['SortedMap', 'RangeMap', 'DeltaMap', 'DenseMap', 'AutoMap']
+INT_KEY_CLASSES = {'RangeSet', 'RangeMap', 'DeltaMap', 'DenseMap'}
+MERGE_CLASSES = {'MinIter': MinIter, 'heapq.merge': heapq.merge}
+
+ALGOS = ['cfbs', 'sorted']
+SIZES = [10 ** i for i in range(1, 8)]
+MERGE_WAYS = [2, 3, 16, 256]
+KEY_TYPES = ['int', 'str', 'tuple']
+DISTRIBUTIONS = ['uniform', 'clustered', 'runs']
+OPERATIONS = ['construct', 'freeze', 'contains_hit', 'contains_miss', 'getitem_hit', 'getitem_miss', 'iterate', 'to_raw', 'from_raw', 'merge']
+
+
+def int_keys(sz, dist, rng):
+    ''' Return `sz` distinct sorted ints.
+    '''
+    if dist == 'uniform':
+        rv = rng.sample(range(sz * 8), sz)
+        rv.sort()
+    elif dist == 'clustered':
+        # Clusters of 10ish nearby keys with big gaps between clusters.
+        rv = []
+        base = 0
+        while len(rv) < sz:
+            base += rng.randrange(100, 1000)
+            for _ in range(rng.randrange(1, 20)):
+                base += rng.randrange(1, 4)
+                rv.append(base)
+        del rv[sz:]
+    elif dist == 'runs':
+        # Runs of 1000ish consecutive keys.
+        rv = []
+        base = 0
+        while len(rv) < sz:
+            base += rng.randrange(2, 100)
+            n = rng.randrange(1, 2000)
+            rv.extend(range(base, base + n))
+            base += n
+        del rv[sz:]
+    else:
+        raise ValueError('Unknown distribution: %r' % dist)
+    return rv
+
+
+def miss_keys(keys, count, rng):
+    ''' Return `count` ints from the gaps in (or just around) sorted `keys`.
+    '''
+    rv = []
+    while len(rv) < count:
+        k = rng.randrange(keys[0] - 1, keys[-1] + 2)
+        i = bisect.bisect_left(keys, k)
+        if i == len(keys) or keys[i] != k:
+            rv.append(k)
+    return rv
+
+
+def convert_key(key, key_type):
+    # Must preserve order.
+    if key_type == 'int':
+        return key
+    if key_type == 'str':
+        return 'k%015d' % key
+    if key_type == 'tuple':
+        return (key >> 16, key & 0xffff)
+    raise ValueError('Unknown key type: %r' % key_type)
+
+
+def best_time(fn, repeat):
+    rv = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        rv = min(rv, time.perf_counter() - start)
+    return rv
+
+
+def bench_one(cls_name, algo, sz, key_type, dist, operations, *, lookups, repeat, rng):
+    ''' Yield a result dict for each operation on one kind of container.
+    '''
+    cls = getattr(containers, cls_name)
+    is_map = cls_name in MAP_CLASSES
+    raw_keys = int_keys(sz, dist, rng)
+    keys = [convert_key(k, key_type) for k in raw_keys]
+    if is_map:
+        # Values go up with the keys, so runs of keys are DeltaMap runs too.
+        data = list(zip(keys, raw_keys))
+    else:
+        data = keys
+    hits = [rng.choice(keys) for _ in range(lookups)]
+    misses = [convert_key(k, key_type) for k in miss_keys(raw_keys, lookups, rng)]
+    frozen = cls(data, algo=algo)
+
+    def construct():
+        cls(data, freeze=False, algo=algo)
+
+    def freeze():
+        # Only the _freeze call is timed, but each run needs a new container.
+        c = cls(data, freeze=False, algo=algo)
+        start = time.perf_counter()
+        c._freeze()
+        return time.perf_counter() - start
+
+    def contains_hit():
+        for k in hits:
+            k in frozen
+
+    def contains_miss():
+        for k in misses:
+            k in frozen
+
+    def getitem_hit():
+        for k in hits:
+            frozen[k]
+
+    def getitem_miss():
+        for k in misses:
+            try:
+                frozen[k]
+            except KeyError:
+                pass
+
+    def iterate():
+        for _ in frozen:
+            pass
+
+    raw = frozen._to_raw()
+
+    def to_raw():
+        frozen._to_raw()
+
+    def from_raw():
+        cls._from_raw(*raw, algo=frozen._algo)
+
+    timers = {
+        'construct': construct,
+        'contains_hit': contains_hit,
+        'contains_miss': contains_miss,
+        'getitem_hit': getitem_hit,
+        'getitem_miss': getitem_miss,
+        'iterate': iterate,
+        'to_raw': to_raw,
+        'from_raw': from_raw,
+    }
+    for op in operations:
+        if op == 'merge' or (op.startswith('getitem_') and not is_map):
+            continue
+        count = lookups if op.endswith(('_hit', '_miss')) else sz
+        if op == 'freeze':
+            seconds = min(freeze() for _ in range(repeat))
+        else:
+            seconds = best_time(timers[op], repeat)
+        yield {
+            'class': cls_name,
+            'algo': algo,
+            'size': sz,
+            'key_type': key_type,
+            'distribution': dist,
+            'operation': op,
+            'count': count,
+            'seconds': seconds,
+            'seconds_per_item': seconds / count if count else None,
+        }
+
+
+def bench_merge(cls_name, sz, key_type, dist, merge_ways, *, repeat, rng):
+    ''' Yield a result dict for merging `sz` keys dealt out to each number of streams.
+    '''
+    merge = MERGE_CLASSES[cls_name]
+    keys = [convert_key(k, key_type) for k in int_keys(sz, dist, rng)]
+    for ways in merge_ways:
+        streams = [[] for _ in range(ways)]
+        for k in keys:
+            streams[rng.randrange(ways)].append(k)
+
+        def merge_all():
+            for _ in merge(*streams):
+                pass
+
+        seconds = best_time(merge_all, repeat)
+        yield {
+            'class': cls_name,
+            'algo': None,
+            'size': sz,
+            'key_type': key_type,
+            'distribution': dist,
+            'operation': 'merge',
+            'ways': ways,
+            'count': sz,
+            'seconds': seconds,
+            'seconds_per_item': seconds / sz,
+        }
+
+
+def run(*, classes=SET_CLASSES + MAP_CLASSES + list(MERGE_CLASSES), algos=ALGOS, sizes=SIZES, key_types=KEY_TYPES, distributions=DISTRIBUTIONS, operations=OPERATIONS, merge_ways=MERGE_WAYS, lookups=1000, repeat=3, seed=0, progress=None):
+    ''' Run every combination of the arguments, returning the JSON-able results.
+    '''
+    rng = random.Random(seed)
+    results = []
+    for cls_name in classes:
+        if cls_name in MERGE_CLASSES:
+            if 'merge' not in operations:
+                continue
+            for key_type in key_types:
+                for dist in distributions:
+                    for sz in sizes:
+                        if progress is not None:
+                            progress('%s size=%d keys=%s dist=%s' % (cls_name, sz, key_type, dist))
+                        results.extend(bench_merge(cls_name, sz, key_type, dist, merge_ways, repeat=repeat, rng=rng))
+            continue
+        for key_type in key_types:
+            if key_type != 'int' and cls_name in INT_KEY_CLASSES:
+                continue
+            for dist in distributions:
+                for sz in sizes:
+                    for algo in algos:
+                        if progress is not None:
+                            progress('%s algo=%s size=%d keys=%s dist=%s' % (cls_name, algo, sz, key_type, dist))
+                        results.extend(bench_one(cls_name, algo, sz, key_type, dist, operations, lookups=lookups, repeat=repeat, rng=rng))
+    return {
+        'meta': {
+            'python': sys.version,
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'optimized': not __debug__,
+            'time': time.time(),
+            'seed': seed,
+            'lookups': lookups,
+            'merge_ways': merge_ways,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    def csv(fn=str):
+        return lambda s: [fn(x) for x in s.split(',')]
+
+    parser = argparse.ArgumentParser(prog='python -m o11c.benchmark', description='Benchmark the o11c containers, writing JSON.')
+    parser.add_argument('--classes', type=csv(), default=SET_CLASSES + MAP_CLASSES + list(MERGE_CLASSES))
+    parser.add_argument('--algos', type=csv(), default=ALGOS)
+    parser.add_argument('--sizes', type=csv(int), default=SIZES)
+    parser.add_argument('--key-types', type=csv(), default=KEY_TYPES)
+    parser.add_argument('--distributions', type=csv(), default=DISTRIBUTIONS)
+    parser.add_argument('--operations', type=csv(), default=OPERATIONS)
+    parser.add_argument('--merge-ways', type=csv(int), default=MERGE_WAYS)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('--quiet', '-q', action='store_true')
+    args = parser.parse_args(argv)
+    progress = None if args.quiet else lambda msg: print(msg, file=sys.stderr)
+    rv = run(
+            classes=args.classes, algos=args.algos, sizes=args.sizes,
+            key_types=args.key_types, distributions=args.distributions,
+            operations=args.operations, merge_ways=args.merge_ways,
+            lookups=args.lookups,
+            repeat=args.repeat, seed=args.seed, progress=progress,
+    )
+    json.dump(rv, args.output, indent=1)
+    args.output.write('\n')
+
+
+if __name__ == '__main__': # pragma: no cover
+    main()
@@ -15,9 +15,14 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import array
+import collections
+from collections.abc import Sequence
 import functools
+import threading
 
 from ..enums import Direction
+from ._sorted import as_array
 
 # Note: apparently this is called the "Eytzinger method", and dates to 1590.
 
@@ -175,8 +180,6 @@ def iter_toward(sz, dir):
     while n is not None:
         yield n
         n = adcessor(n, sz, dir=dir)
-iter_backward = functools.partial(iter_toward, dir=Direction.LEFT)
-iter_forward = functools.partial(iter_toward, dir=Direction.RIGHT)
 
 
 '''
@@ -301,7 +304,182 @@ def to_logical_index(pi, sz):
     return li
 
 
+def _index_typecode(sz):
+    # The smallest array typecode that can hold every index below sz.
+    for typecode in 'BHIQ':
+        if sz <= 1 << (8 * array.array(typecode).itemsize):
+            return typecode
+    assert False, sz # pragma: no cover
+
+
+class OrderCache:
+    ''' Size-keyed cache of index permutations, bounded by total bytes.
+
+        Since the permutation only depends on the size, every container of
+        a given length shares one compact array. Permutations that would
+        not fit at all get `fallback(sz)` instead, which must compute the
+        same sequence without storing it.
+    '''
+    def __init__(self, build, fallback, *, max_bytes):
+        self._build = build
+        self._fallback = fallback
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+    def __call__(self, sz):
+        with self._lock:
+            order = self._entries.get(sz)
+            if order is not None:
+                self._entries.move_to_end(sz)
+                return order
+        nbytes = sz * array.array(_index_typecode(sz)).itemsize
+        if nbytes > self.max_bytes:
+            return self._fallback(sz)
+        # Build without the lock; at worst the work is duplicated.
+        order = self._build(sz)
+        with self._lock:
+            if sz not in self._entries:
+                self._entries[sz] = order
+                self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                old_sz, old_order = self._entries.popitem(last=False)
+                self.nbytes -= old_sz * old_order.itemsize
+        return order
+
+    def lookup(self, sz):
+        ''' Return the cached permutation, or else `fallback(sz)`.
+
+            This never builds (or evicts) anything, so it's for when only
+            a few indices are needed, e.g. by a binary search.
+        '''
+        with self._lock:
+            order = self._entries.get(sz)
+            if order is not None:
+                self._entries.move_to_end(sz)
+                return order
+        return self._fallback(sz)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+def _build_forward_order(sz):
+    # Iterative in-order traversal; much cheaper than adcessor() per step.
+    rv = array.array(_index_typecode(sz))
+    stack = []
+    n = 0
+    while True:
+        while n < sz:
+            stack.append(n)
+            n = n * 2 + 1
+        if not stack:
+            return rv
+        n = stack.pop()
+        rv.append(n)
+        n = n * 2 + 2
+
+
+class PhysicalIndices(Sequence):
+    ''' Lazy `forward_order(sz)`, for when it is too big to cache.
+    '''
+    def __init__(self, sz):
+        self._sz = sz
+
+    def __len__(self):
+        return self._sz
+
+    def __getitem__(self, li):
+        return to_physical_index(range(self._sz)[li], self._sz)
+
+    def __array__(self, dtype=None, copy=None):
+        # For `numpy.asarray`, without a Python loop.
+        import numpy as np
+
+        return to_physical_indices(np.arange(self._sz), self._sz).astype(dtype, copy=False)
+
+
+forward_order = OrderCache(_build_forward_order, PhysicalIndices, max_bytes=64 << 20)
+lookup_order = forward_order.lookup
+
+
+def iter_forward(sz):
+    return iter(forward_order(sz))
+
+
+def iter_backward(sz):
+    return reversed(forward_order(sz))
+
+
+def _bit_lengths(v):
+    # Like int.bit_length() for each element of a non-negative int64 array.
+    import numpy as np
+
+    rv = np.zeros_like(v)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = v >> shift != 0
+        v = np.where(big, v >> shift, v)
+        rv += np.where(big, shift, 0)
+    return rv + (v != 0)
+
+def to_physical_indices(lis, sz):
+    ''' Array version of `to_physical_index`, for many indices at once.
+
+        This uses closed forms for the loops in the scalar version:
+        the number of times `to_physical_index_complete` shifts is the
+        number of trailing 1 bits, which is isolated by `(li+1) & ~li`.
+    '''
+    import numpy as np
+
+    lis = np.asarray(lis, dtype=np.int64)
+    assert ((0 <= lis) & (lis < sz)).all()
+
+    bits = sz.bit_length()
+    sz_completed = (1 << bits) - 1
+    missing = sz_completed - sz
+    adjustment_base = sz - missing
+    lis = lis + np.maximum(lis - adjustment_base, 0)
+
+    divisor = ((lis + 1) & ~lis) << 1
+    return sz_completed // divisor + lis // divisor
+
+def physical_indices(start, stop, sz):
+    ''' Return `forward_order(sz)[start:stop]` as a numpy array.
+    '''
+    import numpy as np
+
+    return to_physical_indices(np.arange(start, stop), sz)
+
+def to_logical_indices(pis, sz):
+    ''' Array version of `to_logical_index`, for many indices at once.
+    '''
+    import numpy as np
+
+    pis = np.asarray(pis, dtype=np.int64)
+    assert ((0 <= pis) & (pis < sz)).all()
+
+    bits = sz.bit_length()
+    sz_completed = (1 << bits) - 1
+    missing = sz_completed - sz
+    adjustment_base = sz - missing
+
+    pi_bits = _bit_lengths(pis + 1)
+    li_plus_1 = ((pis + 1 - (1 << (pi_bits - 1))) << 1) | 1
+    lis = (li_plus_1 << (bits - pi_bits)) - 1
+
+    return lis - (np.maximum(lis - adjustment_base, 0) >> 1)
+
+
 def make_order(arr, *, into=None):
+    if into is None and hasattr(arr, 'dtype'):
+        # A numpy array; do it as a single gather.
+        import numpy as np
+
+        sz = len(arr)
+        return arr[to_logical_indices(np.arange(sz), sz)]
     if into is None:
         sz = len(arr)
         into = [None] * sz
@@ -325,15 +503,40 @@ def iter_order_backward(arr):
         yield arr[i]
 
 
-def freeze(arr):
-    ''' Return a CFBS-ordered copy of arr.
+def permute_in_place(arr, dest):
+    ''' Move each arr[i] to arr[dest(i)], returning arr.
 
-        We're *allowed* to munge arr in place, but I haven't figured out how.
+        This follows each cycle of the permutation from its first element,
+        so the only scratch space needed is one bit per element to remember
+        which elements have already been moved.
     '''
-    arr = make_order(arr)
+    sz = len(arr)
+    done = bytearray((sz + 7) >> 3)
+    for start in range(sz):
+        if done[start >> 3] & (1 << (start & 7)):
+            continue
+        i = start
+        elem = arr[start]
+        while True:
+            done[i >> 3] |= 1 << (i & 7)
+            i = dest(i)
+            elem, arr[i] = arr[i], elem
+            if i == start:
+                break
     return arr
 
 
+def freeze(arr):
+    ''' Return arr in CFBS order.
+
+        If arr is mutable it is permuted in place, otherwise a copy is made.
+    '''
+    if not hasattr(arr, '__setitem__'):
+        return make_order(arr)
+    sz = len(arr)
+    return permute_in_place(arr, lambda li: to_physical_index(li, sz))
+
+
 def _do_search(arr, item):
     len_arr = len(arr)
     if not len_arr:
@@ -366,3 +569,30 @@ def search(arr, item):
     # Note: successor(-1, i) == first(i), except when i == 0
     assert len(arr) == 0 or successor(rv, len(arr)) is None or item < arr[successor(rv, len(arr))], rv
     return rv
+
+
+def search_many(arr, items):
+    ''' Return the indices where each of the items might be, as an array.
+
+        Equivalent to `[search(arr, item) for item in items]`, but the tree
+        is walked one level at a time for all items at once.
+
+        Both `arr` and `items` may be anything `as_array` accepts.
+    '''
+    import numpy as np
+
+    arr = as_array(arr)
+    items = as_array(items)
+    len_arr = len(arr)
+    # Use 1-based node numbers so that the path taken is encoded in the bits:
+    # a 0 bit for each left turn, a 1 bit for each right turn.
+    k = np.ones(items.shape, dtype=np.int64)
+    if len_arr:
+        for _ in range(len_arr.bit_length()):
+            active = k <= len_arr
+            went_right = arr[np.minimum(k, len_arr) - 1] <= items
+            k = np.where(active, (k << 1) | went_right, k)
+    # The floor is the node where we last turned right, so strip off
+    # all the trailing left turns, and then that right turn itself.
+    # If we never turned right, that leaves 0, i.e. -1 after rebasing.
+    return k // ((k & -k) << 1) - 1
@@ -18,10 +18,29 @@
 import bisect
 
 
+def forward_order(sz):
+    return range(sz)
+
+
+lookup_order = forward_order
+
+
 def iter_forward(sz):
     return range(sz)
 
 
+def iter_backward(sz):
+    return reversed(range(sz))
+
+
+def physical_indices(start, stop, sz):
+    ''' Return `forward_order(sz)[start:stop]` as a numpy array.
+    '''
+    import numpy as np
+
+    return np.arange(start, stop)
+
+
 def freeze(arr):
     ''' Does nothing here (input is already sorted).
     '''
@@ -35,3 +54,34 @@ def search(arr, item):
     assert rv == -1 or arr[rv] <= item
     assert rv+1 == len(arr) or item < arr[rv+1]
     return rv
+
+
+def as_array(arr):
+    ''' View a key sequence as a numpy array, for the `search_many`s.
+
+        Numpy arrays are used as is, whatever their shape. Otherwise each
+        element is one key, so a list of tuples becomes an object array
+        of tuples rather than growing another dimension.
+    '''
+    import numpy as np
+
+    if isinstance(arr, np.ndarray):
+        return arr
+    try:
+        rv = np.asarray(arr)
+    except ValueError:
+        # Tuples of differing lengths.
+        rv = None
+    if rv is None or rv.ndim != 1:
+        rv = np.fromiter(arr, dtype=object, count=len(arr))
+    return rv
+
+
+def search_many(arr, items):
+    ''' Return the indices where each of the items might be, as an array.
+
+        Both `arr` and `items` may be anything `as_array` accepts.
+    '''
+    import numpy as np
+
+    return np.searchsorted(as_array(arr), as_array(items), side='right') - 1
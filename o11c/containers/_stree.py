@@ -0,0 +1,237 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import array
+import bisect
+from collections.abc import Sequence
+
+from ._cfbs import OrderCache, _index_typecode, permute_in_place
+from ._sorted import as_array
+
+# Like _cfbs, but with B keys per node instead of 1, i.e. a static B-tree
+# (sometimes called an "S-tree"). Each node is a contiguous slice of the
+# array, so a lookup costs one cache line per level, and there are only
+# log(n)/log(B+1) levels instead of log2(n).
+#
+# Node k holds the keys at [k*B, k*B+B), and its B+1 children are the nodes
+# k*(B+1)+1 through k*(B+1)+B+1. Child i holds keys between key i-1 and
+# key i of its parent. Nodes only exist if their first key does, so only
+# the very last node can be partial (and it never has children).
+#
+# With B=2 (too small to be useful, but easy to draw):
+#
+#                           [08 14]
+#          [02 05]          [11 13]          [15 16]
+#   [00 01][03 04][06 07] [09 10][12]__
+# 17: 08 14 02 05 11 13 15 16 00 01 03 04 06 07 09 10 12
+
+B = 16
+
+
+def _walk(sz, reverse, start=0):
+    # Iterative in-order traversal. The stack holds the next key slot
+    # to emit for each node that we're partway through.
+    if start:
+        # Resume as if the first `start` slots had been emitted.
+        assert not reverse
+        stack = _path_to(start, sz)
+        k = sz
+    else:
+        stack = []
+        k = 0
+    while True:
+        while k * B < sz:
+            if reverse:
+                slot = min(k * B + B, sz) - 1
+                stack.append(slot)
+                k = k * (B + 1) + 1 + (slot - k * B + 1)
+            else:
+                stack.append(k * B)
+                k = k * (B + 1) + 1
+        if not stack:
+            return
+        slot = stack.pop()
+        yield slot
+        node, i = divmod(slot, B)
+        if reverse:
+            if i:
+                stack.append(slot - 1)
+            k = node * (B + 1) + 1 + i
+        else:
+            if i + 1 < B and slot + 1 < sz:
+                stack.append(slot + 1)
+            k = node * (B + 1) + 1 + (i + 1)
+
+
+def _build_forward_order(sz):
+    return array.array(_index_typecode(sz), _walk(sz, False))
+
+
+def _path_to(li, sz):
+    # The stack that `_walk` has just before it emits the li'th key:
+    # that key's slot, above the next slot of each node it is under.
+    assert 0 <= li < sz
+    # Every level but the last is full, so a subtree has the keys of a
+    # full one of its height, plus however many of its last level exist.
+    # `span` is the number of nodes that its last level would have.
+    span = 1
+    while (span * (B + 1) - 1) // B * B < sz:
+        span *= B + 1
+    stack = []
+    k = 0
+    while span > 1:
+        span //= B + 1
+        first_child = k * (B + 1) + 1
+        for i in range(B + 1):
+            first = (first_child + i) * span + (span - 1) // B
+            size = span - 1 + max(0, min((first + span) * B, sz) - first * B)
+            if li < size:
+                if i < B:
+                    stack.append(k * B + i)
+                k = first_child + i
+                break
+            li -= size
+            if li == 0:
+                stack.append(k * B + i)
+                return stack
+            li -= 1
+    stack.append(k * B + li)
+    return stack
+
+
+def to_physical_index(li, sz):
+    ''' Return the index of the li'th smallest key, in O(B log(n)).
+    '''
+    return _path_to(li, sz)[-1]
+
+
+class PhysicalIndices(Sequence):
+    ''' Lazy `forward_order(sz)`, for when it is too big to cache.
+    '''
+    def __init__(self, sz):
+        self._sz = sz
+
+    def __len__(self):
+        return self._sz
+
+    def __getitem__(self, li):
+        return to_physical_index(range(self._sz)[li], self._sz)
+
+    def __iter__(self):
+        return _walk(self._sz, False)
+
+    def __reversed__(self):
+        return _walk(self._sz, True)
+
+    def __array__(self, dtype=None, copy=None):
+        # For `numpy.asarray`; still a Python loop, but no list.
+        import numpy as np
+
+        return np.fromiter(iter(self), dtype=np.int64, count=self._sz).astype(dtype, copy=False)
+
+
+forward_order = OrderCache(_build_forward_order, PhysicalIndices, max_bytes=64 << 20)
+lookup_order = forward_order.lookup
+
+
+def physical_indices(start, stop, sz):
+    ''' Return `forward_order(sz)[start:stop]` as a numpy array.
+
+        Unless the order is already cached, this walks the tree from
+        the start'th key, so it doesn't need the whole order.
+    '''
+    import numpy as np
+
+    order = lookup_order(sz)
+    if not isinstance(order, PhysicalIndices):
+        return np.asarray(order[start:stop], dtype=np.int64)
+    if start == stop:
+        return np.zeros(0, dtype=np.int64)
+    return np.fromiter(_walk(sz, False, start), dtype=np.int64, count=stop - start)
+
+
+def iter_forward(sz):
+    return iter(forward_order(sz))
+
+
+def iter_backward(sz):
+    return reversed(forward_order(sz))
+
+
+def make_order(arr):
+    sz = len(arr)
+    into = [None] * sz
+    for idx, elem in zip(forward_order(sz), arr):
+        into[idx] = elem
+    return into
+
+
+def freeze(arr):
+    ''' Return arr in S-tree order.
+
+        If arr is mutable it is permuted in place, otherwise a copy is made.
+    '''
+    if not hasattr(arr, '__setitem__'):
+        return make_order(arr)
+    order = forward_order(len(arr))
+    if isinstance(order, PhysicalIndices):
+        # Indexing the lazy order costs O(B log(n)**2) for each key, so
+        # build a temporary one, which is freed once we're done.
+        order = _build_forward_order(len(arr))
+    return permute_in_place(arr, order.__getitem__)
+
+
+def search(arr, item):
+    ''' Return the index where the item might be.
+    '''
+    sz = len(arr)
+    rv = -1
+    k = 0
+    while k * B < sz:
+        lo = k * B
+        i = bisect.bisect_right(arr, item, lo, min(lo + B, sz))
+        if i != lo:
+            rv = i - 1
+        k = k * (B + 1) + 1 + (i - lo)
+    assert rv == -1 or arr[rv] <= item
+    return rv
+
+
+def search_many(arr, items):
+    ''' Return the indices where each of the items might be, as an array.
+
+        Equivalent to `[search(arr, item) for item in items]`, but the tree
+        is walked one level at a time for all items at once.
+    '''
+    import numpy as np
+
+    arr = as_array(arr)
+    items = as_array(items)
+    sz = len(arr)
+    rv = np.full(items.shape, -1, dtype=np.int64)
+    k = np.zeros(items.shape, dtype=np.int64)
+    offsets = np.arange(B)
+    while True:
+        active = k * B < sz
+        if not active.any():
+            return rv
+        slots = k[..., None] * B + offsets
+        valid = slots < sz
+        keys = arr[np.minimum(slots, sz - 1)]
+        i = ((keys <= items[..., None]) & valid).sum(axis=-1)
+        rv = np.where(active & (i != 0), k * B + i - 1, rv)
+        k = np.where(active, k * (B + 1) + 1 + i, k)
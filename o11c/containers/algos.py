@@ -0,0 +1,167 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import importlib
+import random
+import timeit
+
+
+_modules = {
+    'sorted': '._sorted',
+    'cfbs': '._cfbs',
+    'stree': '._stree',
+}
+
+
+class AutoType:
+    ''' Placeholder backend for `algo='auto'`.
+
+        Until a container is frozen its arrays are in sorted order, so this
+        behaves exactly like the bisect backend. `choose` replaces it with
+        a real backend when the size and key type are known.
+    '''
+    def __repr__(self):
+        return 'AUTO'
+
+    def __getattr__(self, name):
+        return getattr(get('sorted'), name)
+AUTO = AutoType()
+
+
+def register(name, module):
+    ''' Make a search backend module available as `algo=name`.
+
+        The module must provide at least `freeze`, `search`,
+        `forward_order`, `lookup_order`, `physical_indices` and
+        `iter_forward`, with the same meanings as in `_sorted`.
+    '''
+    if name == 'auto':
+        raise ValueError('%r is reserved' % name)
+    _modules[name] = module
+
+
+def names():
+    return list(_modules)
+
+
+def name_of(module):
+    ''' Return the name a search backend module was registered under.
+    '''
+    if module is AUTO:
+        return 'auto'
+    for name in names():
+        if get(name) is module:
+            return name
+    raise ValueError('Unregistered search algorithm: %r' % module)
+
+
+def get(algo, default=None, *, auto=True):
+    ''' Look up a search backend by name.
+
+        Module objects are returned unchanged, and None means `default`.
+    '''
+    if algo is None:
+        algo = default
+    if algo == 'auto' or algo is AUTO:
+        if not auto:
+            raise ValueError('algo=%r needs data that is not frozen yet' % algo)
+        return AUTO
+    if not isinstance(algo, str):
+        return algo
+    try:
+        module = _modules[algo]
+    except KeyError:
+        raise ValueError('Unknown search algorithm: %r' % algo) from None
+    if isinstance(module, str):
+        module = _modules[algo] = importlib.import_module(module, __package__)
+    return module
+
+
+# Minimum size at which each backend beats everything with a lower
+# threshold, for int keys. Anything not listed is never chosen.
+#
+# With CPython, bisect is implemented in C and the others are not,
+# so bisect wins at every size that fits in memory here.
+# Run `calibrate()` to measure your own machine and interpreter.
+thresholds = {
+    'sorted': 0,
+}
+
+
+def choose(algo, *arrays):
+    ''' Resolve `AUTO` for the given (sorted, not yet frozen) arrays.
+
+        Other backends are returned unchanged. Small arrays, and arrays
+        whose keys are not ints, always get bisect: the other layouts can
+        only win when comparing keys is cheap and the cache misses from
+        a big array are what dominate.
+    '''
+    if algo is not AUTO:
+        return algo
+    sz = sum(len(arr) for arr in arrays)
+    samples = [arr[0] for arr in arrays if len(arr)]
+    if not samples or type(samples[0]) is not int:
+        return get('sorted')
+    best = 'sorted'
+    for name, threshold in thresholds.items():
+        if thresholds[best] < threshold <= sz:
+            best = name
+    return get(best)
+
+
+def _time_lookups(module, sz, lookups, repeat):
+    arr = module.freeze(list(range(0, 2 * sz, 2)))
+    items = [random.randrange(-1, 2 * sz + 1) for _ in range(lookups)]
+    search = module.search
+    def run():
+        for item in items:
+            search(arr, item)
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / lookups
+
+
+def _thresholds_from(timings, sizes):
+    rv = {'sorted': 0}
+    for name, costs in timings.items():
+        threshold = None
+        for sz, cost, base in reversed(list(zip(sizes, costs, timings['sorted']))):
+            if cost >= base:
+                break
+            threshold = sz
+        if threshold is not None and name != 'sorted':
+            rv[name] = threshold
+    return rv
+
+
+def calibrate(*, sizes=(10, 100, 1000, 10**4, 10**5, 10**6), lookups=10000, repeat=3, apply=True):
+    ''' Measure lookup costs to decide the `thresholds` for `algo='auto'`.
+
+        Each backend's threshold is the smallest measured size from which
+        it is faster than bisect at every larger measured size. Returns
+        `(thresholds, timings)`, where timings maps each backend name to
+        a list of seconds per lookup for each size.
+    '''
+    sizes = sorted(sizes)
+    timings = {}
+    for name in names():
+        module = get(name)
+        timings[name] = [_time_lookups(module, sz, lookups, repeat) for sz in sizes]
+    rv = _thresholds_from(timings, sizes)
+    if apply:
+        thresholds.clear()
+        thresholds.update(rv)
+    return rv, timings
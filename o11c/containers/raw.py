@@ -0,0 +1,330 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import functools
+import importlib
+import io
+import json
+import mmap as _mmap
+import pickle
+import struct
+import sys
+import traceback
+
+from . import algos
+
+# File format for the frozen layout of a container, i.e. its `_to_raw()`:
+#
+#   magic       8 bytes, MAGIC
+#   meta_size   uint64, little-endian
+#   meta        JSON, padded with spaces to make meta_size a multiple of 8
+#   sections    each at the (8-aligned) offset recorded in the JSON,
+#               relative to the end of the meta
+#
+# The JSON holds the class, the search backend, and the raw tuple with
+# each array replaced by {"section": index}. Arrays of a simple numeric
+# type are stored as their native bytes, so they can be used in place
+# as a memoryview, straight out of an mmap. Anything else (e.g. a list
+# of str) is stored pickled and has to be unpickled on load.
+
+MAGIC = b'o11c\0raw'
+_HEADER = struct.Struct('<8sQ')
+_SIMPLE_FORMATS = set('bBhHiIlLqQfd')
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _as_simple(arr):
+    # Return a flat memoryview of `arr` if it's a native numeric buffer.
+    if isinstance(arr, (list, tuple)):
+        return None
+    try:
+        view = memoryview(arr)
+    except TypeError:
+        return None
+    if view.ndim != 1 or view.format not in _SIMPLE_FORMATS or not view.c_contiguous:
+        return None
+    return view
+
+
+def _flatten(raw, sections):
+    # Turn a raw tuple into JSON, appending the arrays to `sections`.
+    rv = []
+    for x in raw:
+        if isinstance(x, tuple):
+            rv.append(_flatten(x, sections))
+        elif isinstance(x, int):
+            rv.append(int(x))
+        else:
+            rv.append({'section': len(sections)})
+            sections.append(x)
+    return rv
+
+
+def _unflatten(meta, sections):
+    return tuple(
+        _unflatten(x, sections) if isinstance(x, list)
+        else sections[x['section']] if isinstance(x, dict)
+        else x
+        for x in meta
+    )
+
+
+def dump_parts(container):
+    ''' Return `(meta, buffers)` describing a frozen container.
+
+        `meta` is a JSON-able dict, and `buffers` are bytes-like objects
+        (zero-copy views where possible) to go with its sections.
+    '''
+    arrays = []
+    cls = type(container)
+    meta = {
+        'module': cls.__module__,
+        'class': cls.__qualname__,
+        # An empty container may never have resolved AUTO.
+        'algo': algos.name_of(algos.choose(container._algo)),
+        'byteorder': sys.byteorder,
+        'raw': _flatten(container._to_raw(), arrays),
+        'sections': [],
+    }
+    buffers = []
+    for arr in arrays:
+        view = _as_simple(arr)
+        if view is not None:
+            meta['sections'].append({'format': view.format, 'itemsize': view.itemsize, 'count': len(view)})
+            buffers.append(view.cast('B'))
+        else:
+            data = pickle.dumps(arr, protocol=pickle.HIGHEST_PROTOCOL)
+            meta['sections'].append({'format': 'pickle'})
+            buffers.append(data)
+    return meta, buffers
+
+
+def load_parts(meta, buffers, *, cls=None):
+    ''' Inverse of `dump_parts`, without copying simple arrays.
+    '''
+    if cls is None:
+        cls = getattr(importlib.import_module(meta['module']), meta['class'])
+    elif cls.__qualname__ != meta['class']:
+        raise ValueError('Expected a %s, not a %s' % (cls.__qualname__, meta['class']))
+    sections = []
+    for info, buf in zip(meta['sections'], buffers):
+        if info['format'] == 'pickle':
+            sections.append(pickle.loads(buf))
+            continue
+        if struct.calcsize(info['format']) != info['itemsize']:
+            raise ValueError('Saved %r items are %d bytes, not %d' % (info['format'], info['itemsize'], struct.calcsize(info['format'])))
+        view = memoryview(buf).cast('B').cast(info['format'])
+        if meta['byteorder'] != sys.byteorder:
+            import array
+            view = array.array(info['format'], view)
+            view.byteswap()
+        if len(view) != info['count']:
+            raise ValueError('Section has %d %r items, not %d' % (len(view), info['format'], info['count']))
+        sections.append(view)
+    return cls._from_raw(*_unflatten(meta['raw'], sections), algo=meta['algo'])
+
+
+def _pack(container):
+    # Return (head, sections, buffers, size) for the file format: the
+    # header and meta, then each buffer at its section's offset after that.
+    meta, buffers = dump_parts(container)
+    offset = 0
+    for info, buf in zip(meta['sections'], buffers):
+        info['offset'] = offset
+        info['nbytes'] = len(buf)
+        offset = _align(offset + len(buf))
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    meta_bytes += b' ' * (_align(_HEADER.size + len(meta_bytes)) - _HEADER.size - len(meta_bytes))
+    head = _HEADER.pack(MAGIC, len(meta_bytes)) + meta_bytes
+    return head, meta['sections'], buffers, len(head) + offset
+
+
+def dump(container, f):
+    ''' Write a frozen container to a binary file object, for `load`.
+    '''
+    head, sections, buffers, size = _pack(container)
+    f.write(head)
+    offset = 0
+    for info, buf in zip(sections, buffers):
+        f.write(b'\0' * (info['offset'] - offset))
+        f.write(buf)
+        offset = info['offset'] + len(buf)
+
+
+def dumps(container):
+    ''' Return the bytes that `save` would write.
+    '''
+    f = io.BytesIO()
+    dump(container, f)
+    return f.getvalue()
+
+
+def loads(data, *, cls=None):
+    ''' Load a container from bytes in the `save` format.
+
+        Simple arrays are memoryviews into `data`, so this is zero-copy
+        if `data` is, say, an mmap. Only give this trusted data: other
+        arrays are stored pickled, and unpickling can run arbitrary code.
+    '''
+    data = memoryview(data)
+    if len(data) < _HEADER.size:
+        raise ValueError('Not an o11c container file: too short')
+    magic, meta_size = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not an o11c container file: bad magic %r' % magic)
+    data_start = _HEADER.size + meta_size
+    meta = json.loads(bytes(data[_HEADER.size:data_start]).decode('utf-8'))
+    buffers = [data[data_start + info['offset']:data_start + info['offset'] + info['nbytes']] for info in meta['sections']]
+    return load_parts(meta, buffers, cls=cls)
+
+
+def save(container, path):
+    ''' Write a frozen container to a file, in a format for `load`.
+    '''
+    with open(path, 'wb') as f:
+        dump(container, f)
+
+
+def load(path, *, mmap=True, cls=None):
+    ''' Load a container that was written by `save`.
+
+        With `mmap=True` the file is mapped read-only and the arrays are
+        views into it, so loading is fast no matter the size, and separate
+        processes loading the same file share the same physical pages.
+        Arrays that had to be pickled are still copied.
+
+        As for `loads`, only load trusted files: the pickled arrays are
+        unpickled, which can run arbitrary code.
+    '''
+    with open(path, 'rb') as f:
+        if not mmap:
+            return loads(f.read(), cls=cls)
+        try:
+            data = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        except ValueError:
+            # Can't mmap an empty file, but loads() will reject it anyway.
+            data = b''
+        return loads(data, cls=cls)
+
+
+# The names of the blocks that this process created with `share`.
+_shared_names = set()
+
+
+def share(container, name=None):
+    ''' Copy a frozen container into a new block of shared memory.
+
+        The block holds the same bytes that `save` would write. Other
+        processes can `attach` to it by its `name`, and all of them use
+        the same physical copy of the arrays. Returns the
+        `multiprocessing.shared_memory.SharedMemory`; the caller owns it,
+        so must `close()` and `unlink()` it once every process is done.
+    '''
+    from multiprocessing import shared_memory
+
+    head, sections, buffers, size = _pack(container)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _shared_names.add(shm.name)
+    view = shm.buf
+    view[:len(head)] = head
+    for info, buf in zip(sections, buffers):
+        start = len(head) + info['offset']
+        view[start:start + info['nbytes']] = buf
+    return shm
+
+
+@functools.lru_cache(maxsize=None)
+def _attached_type():
+    from multiprocessing import shared_memory
+
+    class _Attached(shared_memory.SharedMemory):
+        # A block that an `attach`ed container is using.
+        #
+        # The container's arrays are views of the mapping, and when the
+        # container goes away they may or may not be released before this.
+        # If not, they keep the mapping alive by themselves until they are.
+        def __del__(self):
+            try:
+                self.close()
+            except BufferError:
+                self._mmap = None
+                self.close()
+    return _Attached
+
+
+def _open_shared(name):
+    # Only the owner may unlink a block. Before Python 3.13, opening one
+    # registers it with this process's resource tracker, which unlinks
+    # it for everyone when this process exits, so undo that (unless this
+    # process created it, and so has the owner's registration).
+    cls = _attached_type()
+    if sys.version_info >= (3, 13): # pragma: no cover
+        return cls(name=name, track=False)
+    shm = cls(name=name)
+    if shm.name not in _shared_names:
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def attach(name, *, cls=None):
+    ''' Load a container that was `share`d, by the name of its block.
+
+        The arrays are read-only views into the shared memory, so this
+        doesn't copy them, and it stays mapped as long as the container
+        is alive. (Arrays that had to be pickled are still copied.)
+        Attaching never unlinks the block, even when this process exits.
+
+        As for `loads`, only attach to blocks from trusted processes: the
+        pickled arrays are unpickled, which can run arbitrary code.
+    '''
+    shm = _open_shared(name)
+    try:
+        container = loads(shm.buf.toreadonly(), cls=cls)
+    except BaseException as e:
+        # The traceback still has views of the block, which would stop
+        # it from closing.
+        traceback.clear_frames(e.__traceback__)
+        shm.close()
+        raise
+    container._shm = shm
+    return container
+
+
+def _unpickle(cls, meta, buffers):
+    return load_parts(meta, buffers, cls=cls)
+
+
+def reduce(container, protocol):
+    ''' Implement `__reduce_ex__` for a frozen container.
+
+        This pickles the frozen layout, as `dump_parts` does, so that
+        unpickling doesn't sort or reorder anything. With protocol 5 the
+        arrays are `PickleBuffer`s, which the pickler may pass out of band
+        (e.g. `multiprocessing.shared_memory`) instead of copying them.
+    '''
+    meta, buffers = dump_parts(container)
+    if protocol >= 5:
+        buffers = [pickle.PickleBuffer(buf) for buf in buffers]
+    else:
+        buffers = [bytes(buf) for buf in buffers]
+    return _unpickle, (type(container), meta, buffers)
@@ -15,13 +15,32 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from collections.abc import Set, Mapping
+import array
+import bisect
+from collections.abc import Set, Mapping, MutableSet, MutableMapping, Sequence
+import copy
+import functools
+import heapq
 import importlib
-
+import itertools
+import math
+import operator
+import sys
+import threading
+import tracemalloc
+import weakref
+
+# The default search backend; each container can also pick its own.
 _algo = importlib.import_module(__name__.replace('.containers.', '.containers._'))
+from . import algos, raw
+from ._sorted import as_array
 from ..enums import ErrorBool
 from ..iterators import MinIter
 
+# How an AutoMap run finds its values: a single key, the same value for
+# every key, or a value that goes up by 1 with each key.
+POINT, CONSTANT, DELTA = range(3)
+
 
 def adjacent(left, right, *, step=1):
     try:
@@ -31,10 +50,835 @@ def adjacent(left, right, *, step=1):
     return check == right
 
 
-class SortedSet(Set):
+def compact_ints(arr):
+    ''' Return a list of ints as an `array.array` of int64, if they all fit.
+
+        Anything else is returned unchanged. This is about 1/4 the memory
+        of a list of (non-cached) int objects, and has nothing for the
+        garbage collector to traverse. Indexing it still produces ints,
+        so the search backends don't need to care.
+    '''
+    if type(arr) is not list or not all(type(x) is int for x in arr):
+        return arr
+    try:
+        return array.array('q', arr)
+    except OverflowError:
+        return arr
+
+
+def traces_peak(_freeze):
+    ''' Record how much memory a `_freeze` method needs, in `_freeze_peak`.
+
+        This is the peak traced memory above what was in use beforehand,
+        so it is only available (i.e. not None) if `tracemalloc` is tracing.
+        The caller's own peak, if it is measuring one, is kept.
+    '''
+    @functools.wraps(_freeze)
+    def wrapper(self):
+        if not tracemalloc.is_tracing():
+            _freeze(self)
+            self._freeze_peak = None
+            return
+        base, outer_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        _freeze(self)
+        size, peak = tracemalloc.get_traced_memory()
+        self._freeze_peak = peak - base
+        # There's no way to set the peak back, so if it was higher than
+        # ours, briefly allocate enough to reach it again.
+        if outer_peak > peak:
+            bytearray(max(0, outer_peak - size - sys.getsizeof(bytearray())))
+    return wrapper
+
+
+def check_sorted(iterable, key=None):
+    ''' Yield the items of iterable, as long as they are strictly increasing.
+    '''
+    prev = None
+    first = True
+    for item in iterable:
+        k = item if key is None else key(item)
+        if not first and not prev < k:
+            raise ValueError('Input is not strictly increasing: %r then %r' % (prev, k))
+        prev = k
+        first = False
+        yield item
+
+
+def sorted_ranges(ranges):
+    ''' Sort (low_key, high_key, ...) tuples by low key, rejecting empty ones.
+    '''
+    ranges = sorted(ranges, key=operator.itemgetter(0))
+    for r in ranges:
+        if not r[0] <= r[1]:
+            raise ValueError('Range %r has low key greater than high key' % (r,))
+    return ranges
+
+
+def _run_events(runs, side):
+    for low_key, high_key in runs:
+        yield (low_key, False, side)
+        yield (high_key, True, side)
+
+
+def merge_runs(left, right, op):
+    ''' Combine two sets given as increasing, inclusive (low_key, high_key) runs.
+
+        `op(in_left, in_right)` says whether a key is in the result, and
+        must be false if it is in neither. Yields the runs of the result
+        in order; they may be adjacent, so the caller should coalesce them.
+
+        This takes time proportional to the number of runs, not keys.
+        Keys are only incremented or decremented where a run is split,
+        which can't happen when every run is a single key, so any
+        ordered keys work for those.
+    '''
+    inside = [False, False]
+    was = False
+    low_key = None
+    events = MinIter(_run_events(left, 0), _run_events(right, 1))
+    for (key, is_end), group in itertools.groupby(events, key=operator.itemgetter(0, 1)):
+        for _, _, side in group:
+            inside[side] = not is_end
+        now = op(*inside)
+        if now == was:
+            continue
+        was = now
+        if now:
+            low_key = key + 1 if is_end else key
+            continue
+        high_key = key if is_end else key - 1
+        # Ending after k then starting before k + 1 leaves nothing between.
+        if low_key <= high_key:
+            yield (low_key, high_key)
+
+
+def _difference(in_left, in_right):
+    return in_left and not in_right
+
+
+def chunked(iterable, size):
+    ''' Yield lists of up to `size` items from `iterable`.
+    '''
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _build_part(cls, kwargs, items):
+    # Find the runs of one partition of sorted input. This runs in a
+    # worker, and the frozen result is sent back as its raw arrays.
+    return cls.from_sorted(items, **kwargs)
+
+
+def _place_runs(algo, sz, start, count):
+    # Find where runs [start, start+count) of a table of sz go in its
+    # frozen layout. This also runs in a worker, so `algo` is a name.
+    return algos.get(algo).physical_indices(start, start + count, sz)
+
+
+def _scatter(sz, dests, sources):
+    # Join slices of run arrays into one array of sz, where sources[i][j]
+    # goes to dests[i][j]. If all the slices are `array.array`s (or views
+    # of them, once pickled) of one type, so is the result, and it's done
+    # by numpy; otherwise it's a list.
+    typecodes = {getattr(src, 'typecode', None) or getattr(src, 'format', None) for src in sources if len(src)}
+    if len(typecodes) == 1 and None not in typecodes:
+        import numpy as np
+
+        typecode, = typecodes
+        rv = np.empty(sz, dtype=typecode)
+        for dest, src in zip(dests, sources):
+            if len(src):
+                rv[dest] = np.frombuffer(src, dtype=typecode)
+        return array.array(typecode, rv.tobytes())
+    rv = [None] * sz
+    for dest, src in zip(dests, sources):
+        for idx, elem in zip(dest.tolist(), src):
+            rv[idx] = elem
+    return rv
+
+
+class SortedView(Sequence):
+    ''' A frozen array, in sorted order (e.g. for `bisect`).
+    '''
+    def __init__(self, arr, order):
+        self._arr = arr
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, li):
+        return self._arr[self._order[li]]
+
+
+def logical_range(start, stop, reverse):
+    rv = range(start, stop)
+    return reversed(rv) if reverse else rv
+
+
+def physical_range(algo, sz, reverse):
+    # The physical indices of an array of `sz` frozen by `algo`, in
+    # (reverse) sorted order.
+    return algo.iter_backward(sz) if reverse else algo.iter_forward(sz)
+
+
+def bisect_between(view, low, high, inclusive):
+    ''' Return the (start, stop) logical indices of the keys between `low`
+        and `high`, either of which may be None for no limit.
+    '''
+    start = 0
+    stop = len(view)
+    if low is not None:
+        start = (bisect.bisect_left if inclusive[0] else bisect.bisect_right)(view, low)
+    if high is not None:
+        stop = (bisect.bisect_right if inclusive[1] else bisect.bisect_left)(view, high)
+    return start, max(start, stop)
+
+
+def as_numpy(arr):
+    ''' View a key or value array as a numpy array.
+
+        Arrays of numbers are not copied; lists become object arrays,
+        even if their elements are sequences themselves.
+    '''
+    import numpy as np
+
+    if isinstance(arr, list):
+        return np.fromiter(arr, dtype=object, count=len(arr))
+    return np.asarray(arr)
+
+
+def gather(arr, idx, found):
+    ''' Return `arr[idx]` where `found`; the rest is arbitrary.
+    '''
+    import numpy as np
+
+    arr = as_numpy(arr)
+    rv = np.empty(found.shape, dtype=arr.dtype)
+    rv[found] = arr[idx[found]]
+    return rv
+
+
+def put(values, mask, new):
+    ''' Return `values` with `new` (a scalar, or an array of the same
+        shape) stored where `mask`, promoting the dtype if needed.
+    '''
+    import numpy as np
+
+    new = np.asarray(new)
+    # Only promote between numbers; numpy would turn 1 and 'x' into str.
+    if values.dtype.kind in 'biufc' and new.dtype.kind in 'biufc':
+        dtype = np.result_type(values, new)
+    else:
+        dtype = object
+    values = values.astype(dtype, copy=False)
+    values[mask] = new[mask] if new.shape else new
+    return values
+
+
+def in_order(arr, order):
+    ''' Return a frozen array as a new numpy array, in sorted order.
+    '''
+    import numpy as np
+
+    arr = as_numpy(arr)
+    if isinstance(order, range):
+        return arr[order.start:order.stop].copy()
+    return arr[np.asarray(order)]
+
+
+def run_lengths(low_keys, high_keys):
+    ''' Return the number of keys in each run, as a numpy array.
+    '''
+    import numpy as np
+
+    lengths = np.ones(len(low_keys), dtype=np.intp)
+    # Only runs of more than one key need to be ints.
+    multi = low_keys != high_keys
+    lengths[multi] = high_keys[multi] - low_keys[multi] + 1
+    return lengths
+
+
+def run_positions(lengths):
+    ''' Return `range(n)` for each run length `n`, all concatenated.
+    '''
+    import numpy as np
+
+    total = int(lengths.sum())
+    starts = np.cumsum(lengths) - lengths
+    return np.arange(total) - np.repeat(starts, lengths)
+
+
+def expand_runs(starts, lengths, steps=None):
+    ''' Return `starts[i] + j` for each `j` in `range(lengths[i])`, for
+        each run `i`, as one numpy array.
+
+        This takes a few vectorized passes, instead of a Python loop over
+        the keys. If `steps` (an array of bools) is given, only the runs
+        where it is true count up; the rest repeat their start.
+    '''
+    import numpy as np
+
+    rv = np.repeat(starts, lengths)
+    if len(rv) == len(starts):
+        # Every run is a single key, which may not even be an int.
+        return rv
+    positions = run_positions(lengths)
+    if steps is None:
+        np.add(rv, positions, out=rv, casting='unsafe')
+    else:
+        np.add(rv, positions, out=rv, where=np.repeat(steps, lengths), casting='unsafe')
+    return rv
+
+
+def sliceable(arr):
+    ''' Return `arr` as something that can be sliced without copying.
+
+        Slicing an `array.array` copies, but a memoryview of it doesn't.
+        Numpy arrays and memoryviews already don't; lists always do.
+    '''
+    if isinstance(arr, array.array):
+        return memoryview(arr)
+    return arr
+
+
+def run_length(low_key, high_key):
+    # Single-key runs are allowed to have keys that aren't ints.
+    return 1 if low_key == high_key else high_key - low_key + 1
+
+
+def run_keys(low_key, high_key, reverse):
+    if low_key == high_key:
+        return (low_key,)
+    return logical_range(low_key, high_key + 1, reverse)
+
+
+class Runs:
+    ''' Range queries for containers whose keys are stored as runs.
+
+        Subclasses need `_len`, `_low_keys`, `_high_keys` and `_algo`.
+        Keys only need to be ints in runs of more than one key.
+    '''
+    def _run_offsets(self):
+        # How many keys come before each run, in sorted order. This is
+        # only needed by `count_between`, so it is built on first use.
+        offsets = getattr(self, '_offsets', None)
+        if offsets is None:
+            offsets = []
+            total = 0
+            for low_key, high_key in self._iter_runs():
+                offsets.append(total)
+                total += run_length(low_key, high_key)
+            offsets = self._offsets = compact_ints(offsets)
+        return offsets
+
+    def _keys_before(self, li, idx):
+        return self._run_offsets()[li]
+
+    def _iter_runs(self, reverse=False):
+        _low_keys = self._low_keys
+        _high_keys = self._high_keys
+        for idx in physical_range(self._algo, len(_low_keys), reverse):
+            yield (_low_keys[idx], _high_keys[idx])
+
+    def _sorted_runs(self):
+        # The (order, low_keys, lengths) of the runs, as numpy arrays in
+        # sorted order, for exporting.
+        order = self._algo.forward_order(len(self._low_keys))
+        low_keys = in_order(self._low_keys, order)
+        return order, low_keys, run_lengths(low_keys, in_order(self._high_keys, order))
+
+    def _keys_array(self):
+        order, low_keys, lengths = self._sorted_runs()
+        return expand_runs(low_keys, lengths)
+
+    def _clipped_runs(self, low, high, inclusive, reverse):
+        # Yield (idx, low_key, high_key) for each run with keys between
+        # `low` and `high`, narrowed to just those keys. Only a run that
+        # straddles a bound is narrowed, so single keys are left alone.
+        if not self._len:
+            # The bounds may not even be comparable to the (absent) keys.
+            return
+        _low_keys = self._low_keys
+        _high_keys = self._high_keys
+        order = self._algo.lookup_order(len(_low_keys))
+        view = SortedView(_low_keys, order)
+        start = 0
+        stop = len(view)
+        if low is not None:
+            start = bisect.bisect_right(view, low) - 1
+            if start >= 0:
+                high_key = _high_keys[order[start]]
+                if not (low <= high_key if inclusive[0] else low < high_key):
+                    start += 1
+            else:
+                start = 0
+        if high is not None:
+            stop = (bisect.bisect_right if inclusive[1] else bisect.bisect_left)(view, high)
+        for li in logical_range(start, stop, reverse):
+            idx = order[li]
+            low_key = _low_keys[idx]
+            high_key = _high_keys[idx]
+            # Only a run of ints can straddle a bound, but the bound
+            # itself needn't be an int (e.g. a float).
+            if low is not None and (low_key < low if inclusive[0] else low_key <= low):
+                low_key = math.ceil(low) if inclusive[0] else math.floor(low) + 1
+            if high is not None and (high < high_key if inclusive[1] else high <= high_key):
+                high_key = math.floor(high) if inclusive[1] else math.ceil(high) - 1
+            yield idx, low_key, high_key
+
+    def _search_runs_many(self, keys):
+        # Like `_clipped_runs`, but for many single keys at once.
+        import numpy as np
+
+        if not self._len:
+            # The keys may not even be comparable to the (absent) keys.
+            return np.full(keys.shape, -1), np.zeros(keys.shape, dtype=bool)
+        idx = self._algo.search_many(self._low_keys, keys)
+        found = idx >= 0
+        found[found] = keys[found] <= as_numpy(self._high_keys)[idx[found]]
+        return idx, found
+
+    def _count_below(self, key, inclusive):
+        if not self._len:
+            return 0
+        _low_keys = self._low_keys
+        order = self._algo.lookup_order(len(_low_keys))
+        li = (bisect.bisect_right if inclusive else bisect.bisect_left)(SortedView(_low_keys, order), key) - 1
+        if li < 0:
+            return 0
+        idx = order[li]
+        low_key = _low_keys[idx]
+        high_key = self._high_keys[idx]
+        if high_key < key or (inclusive and high_key == key):
+            n = run_length(low_key, high_key)
+        else:
+            # The run straddles `key`, so it's all ints (but `key` may not be).
+            n = (math.floor(key) + 1 if inclusive else math.ceil(key)) - low_key
+        return self._keys_before(li, idx) + n
+
+
+class SetAlgebra:
+    ''' Set operations that merge the sorted runs of two containers,
+        instead of looking up each key of one in the other.
+
+        Other kinds of set fall back to the generic `Set` methods.
+        Results are the same type as the left operand, and are frozen.
+    '''
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Used by the generic methods, which may produce duplicates.
+        keys = sorted(iterable)
+        return cls.from_sorted((k for k, _ in itertools.groupby(keys)), validate='none')
+
+    def _combine(self, other, op):
+        rv = type(self)(freeze=False, algo=self._algo)
+        for low_key, high_key in merge_runs(self._iter_runs(), other._iter_runs(), op):
+            rv._append_range(low_key, high_key)
+        rv._freeze()
+        return rv
+
+    def _overlaps(self, other, op):
+        for _ in merge_runs(self._iter_runs(), other._iter_runs(), op):
+            return True
+        return False
+
+    def __and__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__and__(self, other)
+        return self._combine(other, operator.and_)
+
+    def __or__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__or__(self, other)
+        return self._combine(other, operator.or_)
+
+    def __sub__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__sub__(self, other)
+        return self._combine(other, _difference)
+
+    def __xor__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__xor__(self, other)
+        return self._combine(other, operator.xor)
+
+    def isdisjoint(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.isdisjoint(self, other)
+        return not self._overlaps(other, operator.and_)
+
+    def __le__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__le__(self, other)
+        return len(self) <= len(other) and not self._overlaps(other, _difference)
+
+    def __ge__(self, other):
+        if not isinstance(other, SetAlgebra):
+            return Set.__ge__(self, other)
+        return other <= self
+
+
+class Frozen:
+    ''' Methods shared by every container.
+    '''
+    # The arrays with an item per run, in `_to_raw` order.
+    # These are what `_freeze` permutes.
+    _run_arrays = ()
+
+    @classmethod
+    def from_sorted(cls, iterable, *, validate='cheap', freeze=True, **kwargs):
+        ''' Build a container from keys (or items) that are already sorted.
+
+            Unlike the constructor, this streams the input without making
+            a sorted copy, and builds the runs in a single pass.
+
+            `validate` is one of:
+                'none': trust the input; garbage in, garbage out.
+                'cheap': compare each key to the previous one.
+                'full': as 'cheap', then look up every key in the result.
+                    This needs the result to be frozen.
+        '''
+        if validate not in ('none', 'cheap', 'full'):
+            raise ValueError('Unknown validate=%r' % validate)
+        if validate == 'full' and not freeze:
+            raise ValueError("validate='full' can't look up keys with freeze=False")
+        self = cls(freeze=False, **kwargs)
+        if isinstance(self, Mapping):
+            if isinstance(iterable, Mapping):
+                iterable = iterable.items()
+            key = operator.itemgetter(0)
+        else:
+            key = None
+        if validate != 'none':
+            iterable = check_sorted(iterable, key)
+        self._extend_sorted(iterable)
+        if freeze:
+            self._freeze()
+        if validate == 'full':
+            self._validate()
+        return self
+
+    @classmethod
+    def from_unsorted(cls, iterable, *, executor=None, chunk_size=1 << 16, freeze=True, **kwargs):
+        ''' Build a container from keys (or items) in any order, in parallel.
+
+            The work is done by `executor.map`, for any `concurrent.futures`
+            executor, e.g. a `ProcessPoolExecutor`; None does it all here.
+            The input is sorted in chunks of `chunk_size`, which are then
+            merged. The merged keys are cut into partitions of the same
+            size, and each partition's runs are found separately. Only the
+            runs at each boundary are then stitched together. Finally the
+            frozen position of each run is found in parallel as well, and
+            the runs are scattered there.
+
+            Unlike the constructor, keys must be unique (as for `from_sorted`).
+        '''
+        map_ = map if executor is None else executor.map
+        if issubclass(cls, Mapping):
+            if isinstance(iterable, Mapping):
+                iterable = iterable.items()
+            key = operator.itemgetter(0)
+        else:
+            key = None
+        sorted_chunks = map_(functools.partial(sorted, key=key), chunked(iterable, chunk_size))
+        merged = heapq.merge(*sorted_chunks, key=key)
+        # The parts only exist to be stitched, so just do the cheap freeze.
+        part_kwargs = dict(kwargs, algo='sorted')
+        parts = list(map_(functools.partial(_build_part, cls, part_kwargs), chunked(merged, chunk_size)))
+        self = cls(freeze=False, **kwargs)
+        if not freeze:
+            high_key = None
+            for part in parts:
+                runs = list(self._stitch_units(part))
+                if high_key is not None and not high_key < runs[0][0]:
+                    raise ValueError('Duplicate key %r' % (runs[0][0],))
+                high_key = runs[-1][1]
+                self._extend_runs(runs)
+            return self
+        if not parts:
+            self._freeze()
+            return self
+        segments = self._stitch(parts, part_kwargs)
+        counts = [stop - start for part, start, stop in segments]
+        sz = sum(counts)
+        # `choose` only looks at the total size, and the type of the first key.
+        first_keys = getattr(segments[0][0], self._run_arrays[0])[:1]
+        algo = algos.choose(self._algo, first_keys, range(sz - 1))
+        offsets = itertools.accumulate([0] + counts[:-1])
+        dests = list(map_(functools.partial(_place_runs, algos.name_of(algo), sz), offsets, counts))
+        self._join(segments, dests)
+        self._algo = algo
+        self._len = sum(part._len for part in parts)
+        self._frozen = True
+        self._freeze_peak = None
+        return self
+
+    def _stitch(self, parts, part_kwargs):
+        # Work out the runs that appending every part to this one would
+        # give (as `from_sorted` would), as a list of (container, start,
+        # stop) slices of frozen, sorted runs.
+        # Appending can only change the last run, so once the last run
+        # is the same as it was at that point of building the part (which
+        # `shadow` builds again), the rest of the part is unchanged too.
+        # Only the runs up to there, and the last run of each part (which
+        # is still open), need to go through a `tail` container here.
+        cls = type(self)
+        segments = []
+        tail = None
+        for part in parts:
+            count = len(getattr(part, self._run_arrays[0]))
+            start = 0
+            if tail is not None:
+                shadow = cls(freeze=False, **part_kwargs)
+                units = self._stitch_units(part)
+                unit = next(units)
+                if not next(tail.iter_runs(reverse=True))[1] < unit[0]:
+                    raise ValueError('Duplicate key %r' % (unit[0],))
+                while unit is not None:
+                    tail._extend_runs([unit])
+                    shadow._extend_runs([unit])
+                    if next(tail.iter_runs(reverse=True))[:2] == next(shadow.iter_runs(reverse=True))[:2]:
+                        # The tail's last run will be the part's one at `start`.
+                        start = len(getattr(shadow, self._run_arrays[0])) - 1
+                        break
+                    unit = next(units, None)
+                else:
+                    # The whole part went into the tail, whose last run
+                    # is still open.
+                    start = count
+                tail._freeze()
+                tail_count = len(getattr(tail, self._run_arrays[0]))
+                segments.append((tail, 0, tail_count - 1))
+                if start == count:
+                    part, start, count = tail, tail_count - 1, tail_count
+            segments.append((part, start, count - 1))
+            tail = cls(freeze=False, **part_kwargs)
+            tail._extend_runs([next(part.iter_runs(reverse=True))])
+        tail._freeze()
+        segments.append((tail, 0, 1))
+        return segments
+
+    def _stitch_units(self, part):
+        # What to append from a part so that it comes out as if its keys
+        # were appended one by one. For most containers, whole runs will do.
+        return part.iter_runs()
+
+    def _join(self, segments, dests, **sources):
+        # Scatter the runs from `_stitch` to their places in this frozen
+        # container. `sources` replaces the slices of some run arrays.
+        # Compacting the whole array as `_freeze` would is needed in case
+        # some parts weren't compacted but this would be.
+        sz = sum(len(dest) for dest in dests)
+        for name in self._run_arrays:
+            if name not in sources:
+                sources[name] = [getattr(part, name)[start:stop] for part, start, stop in segments]
+            column = _scatter(sz, dests, sources[name])
+            if self._compact:
+                column = compact_ints(column)
+            setattr(self, name, column)
+
+    def _extend_runs(self, runs):
+        # Append runs, in the form that `iter_runs` produces them.
+        _append_range = self._append_range
+        for run in runs:
+            _append_range(*run)
+
+    def _validate(self):
+        count = 0
+        for key in self:
+            if key not in self:
+                raise ValueError('Key %r was lost' % (key,))
+            count += 1
+        if count != len(self):
+            raise ValueError('Expected %d keys but found %d' % (len(self), count))
+
+    def irange(self, low=None, high=None, *, inclusive=(True, False), reverse=False):
+        ''' Iterate over the keys from `low` to `high`, in sorted order.
+
+            Either bound may be None for no limit. `inclusive` says whether
+            each bound is included; the default is the half-open [low, high).
+            This costs O(log n) to find the start, then O(1) per key.
+        '''
+        return self._between(low, high, inclusive, reverse)
+
+    def count_between(self, low=None, high=None, *, inclusive=(True, False)):
+        ''' Count the keys that `irange` would produce, in O(log n).
+        '''
+        stop = len(self) if high is None else self._count_below(high, inclusive[1])
+        start = 0 if low is None else self._count_below(low, not inclusive[0])
+        return max(0, stop - start)
+
+    def iter_runs(self, reverse=False):
+        ''' Iterate over the keys as (low_key, high_key) runs, in sorted order.
+
+            Each run is every key from `low_key` to `high_key`, inclusive.
+            The runs are as stored, so adjacent ones are not always merged;
+            e.g. a `SortedSet` has a run for every key. With `reverse`,
+            the last run comes first (but each is still low to high).
+        '''
+        return self._iter_runs(reverse)
+
+    def keys_array(self):
+        ''' Return all the keys as a new numpy array, in sorted order.
+
+            Runs are expanded with vectorized numpy operations, not a
+            Python loop over the keys.
+        '''
+        return self._keys_array()
+
+    def to_numpy(self):
+        ''' Return `keys_array()`; maps return `(keys, values)` arrays.
+        '''
+        return self.keys_array()
+
+    def contains_many(self, keys):
+        ''' Check many keys at once, returning a numpy array of bools.
+
+            `keys` may be any sequence or numpy array; the lookups are
+            all done by a single vectorized search.
+        '''
+        return self._lookup_many(as_array(keys))[1]
+
+    def __reduce_ex__(self, protocol):
+        ''' Pickle the frozen layout, so that unpickling is just a load.
+
+            A container that is still being built pickles its attributes.
+        '''
+        if not self._frozen:
+            return super().__reduce_ex__(protocol)
+        return raw.reduce(self, protocol)
+
+    def __copy__(self):
+        # Don't go through `__reduce_ex__`, which would pickle the values.
+        rv = self.__class__.__new__(self.__class__)
+        rv.__dict__.update(self.__dict__)
+        if not self._frozen:
+            # `_freeze` permutes these in place, so they can't be shared.
+            for name, value in rv.__dict__.items():
+                if isinstance(value, (list, array.array)):
+                    rv.__dict__[name] = value[:]
+        return rv
+
+    def __deepcopy__(self, memo):
+        rv = self.__class__.__new__(self.__class__)
+        memo[id(self)] = rv
+        state = self.__getstate__()
+        # A loaded container's arrays are views of a file or of shared
+        # memory, which can't be deep-copied; the copy owns its arrays.
+        state.pop('_shm', None)
+        for name, value in state.items():
+            if isinstance(value, memoryview):
+                state[name] = array.array(value.format, value)
+        rv.__setstate__(copy.deepcopy(state, memo))
+        return rv
+
+    def save(self, path):
+        ''' Write the frozen layout to a file, to be `load`ed later.
+        '''
+        raw.save(self, path)
+
+    @classmethod
+    def load(cls, path, *, mmap=True):
+        ''' Load a container written by `save`, without rebuilding it.
+
+            With `mmap`, integer arrays are used directly from the file.
+            Only load trusted files, since some arrays may be pickled.
+        '''
+        return raw.load(path, mmap=mmap, cls=cls)
+
+    def share(self, name=None):
+        ''' Copy the frozen layout into shared memory, for `attach`.
+
+            Returns the `SharedMemory`, which the caller must `close()`
+            and `unlink()` when every process is done with it.
+        '''
+        return raw.share(self, name)
+
+    @classmethod
+    def attach(cls, name):
+        ''' Use a container that another process `share`d, without copying.
+
+            Only attach to trusted blocks, since some arrays may be pickled.
+        '''
+        return raw.attach(name, cls=cls)
+
+    def __getstate__(self):
+        # Backend modules can't be pickled, so store them by name.
+        state = self.__dict__.copy()
+        if '_algo' in state:
+            state['_algo'] = algos.name_of(state['_algo'])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_algo' in state:
+            self._algo = algos.get(self._algo)
+
+
+class FrozenMap(Frozen):
+    ''' Methods shared by every map.
+    '''
+    def irange(self, low=None, high=None, *, inclusive=(True, False), reverse=False):
+        ''' Iterate over the keys from `low` to `high`, as `Frozen.irange`.
+        '''
+        for key, _ in self._between(low, high, inclusive, reverse):
+            yield key
+
+    def get_many(self, keys, default=None, *, mask=False):
+        ''' Look up many keys at once, returning a numpy array of values.
+
+            Missing keys get `default`; the dtype is promoted if needed to
+            hold it. With `mask`, return `(values, found)` instead, where
+            `found` is what `contains_many` would return.
+        '''
+        values, found = self._lookup_many(as_array(keys))
+        if not found.all():
+            values = put(values, ~found, default)
+        if mask:
+            return values, found
+        return values
+
+    def items_between(self, low=None, high=None, *, inclusive=(True, False), reverse=False):
+        ''' Like `irange`, but produce (key, value) pairs.
+        '''
+        return self._between(low, high, inclusive, reverse)
+
+    def iter_runs(self, reverse=False):
+        ''' Iterate over (low_key, high_key, value, is_delta) runs, in sorted order.
+
+            `value` belongs to `low_key`. If `is_delta`, the value for each
+            later key goes up by 1 per key, otherwise it is the same for
+            the whole run. `DenseMap` instead yields (low_key, high_key,
+            values), with a value for each key. `reverse` is as for
+            `Frozen.iter_runs`.
+        '''
+        return self._iter_value_runs(reverse)
+
+    def values_array(self):
+        ''' Return all the values as a new numpy array, in key order.
+        '''
+        return self._values_array()
+
+    def to_numpy(self):
+        ''' Return `(keys_array(), values_array())`.
+        '''
+        return self.keys_array(), self.values_array()
+
+
+class SortedSet(Frozen, SetAlgebra, Set):
     ''' Simple binary-search set.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_keys',)
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._keys = []
         self._frozen = False
@@ -51,19 +895,31 @@ class SortedSet(Set):
         self._keys.append(key)
         self._len += 1
 
-    def _pop(self):
+    def _append_range(self, low_key, high_key):
+        if low_key == high_key:
+            self._append(low_key)
+            return
+        for key in range(low_key, high_key + 1):
+            self._append(key)
+
+    def _extend_sorted(self, keys):
         assert not self._frozen
-        self._keys.pop()
-        self._len -= 1
+        self._keys.extend(keys)
+        self._len = len(self._keys)
 
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._keys = _algo.freeze(self._keys)
+        self._algo = algos.choose(self._algo, self._keys)
+        if self._compact:
+            self._keys = compact_ints(self._keys)
+        self._keys = self._algo.freeze(self._keys)
 
     @classmethod
-    def _from_raw(cls, len, keys):
+    def _from_raw(cls, len, keys, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._keys = keys
         self._frozen = True
@@ -75,22 +931,49 @@ class SortedSet(Set):
 
     def __contains__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._keys, item)
+        idx = self._algo.search(self._keys, item)
         if idx != -1:
             assert self._keys[idx] <= item
             if item == self._keys[idx]:
                 return True
         return False
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _keys = self._keys
-        for idx in _algo.iter_forward(len(_keys)):
+        for idx in physical_range(self._algo, len(_keys), reverse):
             yield (_keys[idx],)
 
+    def _iter_runs(self, reverse=False):
+        for k, in self._iter_tuples(reverse):
+            yield (k, k)
+
+    def _keys_array(self):
+        return in_order(self._keys, self._algo.forward_order(len(self._keys)))
+
     def __iter__(self):
         for k, in self._iter_tuples():
             yield k
 
+    def __reversed__(self):
+        for k, in self._iter_tuples(reverse=True):
+            yield k
+
+    def _between(self, low, high, inclusive, reverse):
+        view = SortedView(self._keys, self._algo.lookup_order(len(self._keys)))
+        start, stop = bisect_between(view, low, high, inclusive)
+        for li in logical_range(start, stop, reverse):
+            yield view[li]
+
+    def _count_below(self, key, inclusive):
+        view = SortedView(self._keys, self._algo.lookup_order(len(self._keys)))
+        return (bisect.bisect_right if inclusive else bisect.bisect_left)(view, key)
+
+    def _lookup_many(self, keys):
+        idx = self._algo.search_many(self._keys, keys)
+        found = idx >= 0
+        found[found] = as_numpy(self._keys)[idx[found]] == keys[found]
+        return None, found
+
     def __len__(self):
         return self._len
 
@@ -98,10 +981,14 @@ class SortedSet(Set):
         return '%s(len=%d, keys=%r)' % (self.__class__.__qualname__, self._len, self._keys)
 
 
-class RangeSet(Set):
+class RangeSet(Frozen, Runs, SetAlgebra, Set):
     ''' Compressed binary-search set.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_low_keys', '_high_keys')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._low_keys = []
         self._high_keys = []
@@ -113,6 +1000,26 @@ class RangeSet(Set):
             if freeze:
                 self._freeze()
 
+    @classmethod
+    def from_ranges(cls, ranges, *, freeze=True, **kwargs):
+        ''' Build a set from inclusive (low_key, high_key) ranges.
+
+            The ranges may be in any order, and may overlap or touch;
+            the time taken depends only on the number of ranges.
+        '''
+        self = cls(freeze=False, **kwargs)
+        for low_key, high_key in sorted_ranges(ranges):
+            if self._len:
+                prev_high_key = self._high_keys[-1]
+                if high_key <= prev_high_key:
+                    continue
+                if low_key <= prev_high_key:
+                    low_key = prev_high_key + 1
+            self._append_range(low_key, high_key)
+        if freeze:
+            self._freeze()
+        return self
+
     def _append_range(self, low_key, high_key):
         assert not self._frozen
         assert not self._len or self._high_keys[-1] < low_key
@@ -124,15 +1031,35 @@ class RangeSet(Set):
             self._high_keys.append(high_key)
         self._len += high_key - low_key + 1
 
+    def _extend_sorted(self, keys):
+        assert not self._frozen
+        low_keys = self._low_keys
+        high_keys = self._high_keys
+        n = 0
+        for key in keys:
+            if high_keys and high_keys[-1] + 1 == key:
+                high_keys[-1] = key
+            else:
+                low_keys.append(key)
+                high_keys.append(key)
+            n += 1
+        self._len += n
+
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._low_keys = _algo.freeze(self._low_keys)
-        self._high_keys = _algo.freeze(self._high_keys)
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
 
     @classmethod
-    def _from_raw(cls, len, low_keys, high_keys):
+    def _from_raw(cls, len, low_keys, high_keys, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._low_keys = low_keys
         self._high_keys = high_keys
@@ -145,17 +1072,17 @@ class RangeSet(Set):
 
     def __contains__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._low_keys, item)
+        idx = self._algo.search(self._low_keys, item)
         if idx != -1:
             assert self._low_keys[idx] <= item
             if item <= self._high_keys[idx]:
                 return True
         return False
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _low_keys = self._low_keys
         _high_keys = self._high_keys
-        for idx in _algo.iter_forward(len(_low_keys)):
+        for idx in physical_range(self._algo, len(_low_keys), reverse):
             yield (_low_keys[idx], _high_keys[idx])
 
     def __iter__(self):
@@ -163,6 +1090,17 @@ class RangeSet(Set):
             for k in range(k1, k2+1):
                 yield k
 
+    def __reversed__(self):
+        for k1, k2 in self._iter_tuples(reverse=True):
+            yield from logical_range(k1, k2 + 1, True)
+
+    def _between(self, low, high, inclusive, reverse):
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            yield from logical_range(low_key, high_key + 1, reverse)
+
+    def _lookup_many(self, keys):
+        return None, self._search_runs_many(keys)[1]
+
     def __len__(self):
         return self._len
 
@@ -170,12 +1108,22 @@ class RangeSet(Set):
         return '%s(len=%d, low_keys=%r, high_keys=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys)
 
 
-class AutoSet(Set):
+class AutoSet(Frozen, Runs, SetAlgebra, Set):
     ''' Multi-strategy binary-search set.
+
+        Single keys and ranges of keys are both stored as runs in one
+        table, so that a lookup is a single search. Unlike `RangeSet`,
+        keys don't have to be ints, as long as they don't form ranges.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
-        self._simple = SortedSet()
-        self._compressed = RangeSet()
+    _run_arrays = ('_low_keys', '_high_keys')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
+        self._len = 0
+        self._low_keys = []
+        self._high_keys = []
+        self._frozen = False
         if iterable is not None:
             iterable = sorted(iterable)
             for key in iterable:
@@ -184,50 +1132,112 @@ class AutoSet(Set):
                 self._freeze()
 
     def _append_range(self, low_key, high_key):
-        assert not self._simple._len or self._simple._keys[-1] < low_key
-        assert not self._compressed._len or self._compressed._high_keys[-1] < low_key
+        assert not self._frozen
+        assert not self._len or self._high_keys[-1] < low_key
         assert low_key <= high_key
-        if self._simple._len and adjacent(self._simple._keys[-1], low_key):
-            low_key = self._simple._keys[-1]
-            self._simple._pop()
-            self._compressed._append_range(low_key, high_key)
-            return
-        if low_key != high_key or (self._compressed._len and adjacent(self._compressed._high_keys[-1], low_key)):
-            self._compressed._append_range(low_key, high_key)
-            return
-        self._simple._append(low_key)
+        if self._len and adjacent(self._high_keys[-1], low_key):
+            self._high_keys[-1] = high_key
+        else:
+            self._low_keys.append(low_key)
+            self._high_keys.append(high_key)
+        self._len += run_length(low_key, high_key)
 
+    def _extend_sorted(self, keys):
+        _append_range = self._append_range
+        for key in keys:
+            _append_range(key, key)
+
+    @traces_peak
     def _freeze(self):
-        self._simple._freeze()
-        self._compressed._freeze()
+        assert not self._frozen
+        self._frozen = True
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
 
     @classmethod
-    def _from_raw(cls, simple_raw, compressed_raw):
+    def _from_raw(cls, *raw, algo=None):
+        if isinstance(raw[0], tuple):
+            # The separate (SortedSet, RangeSet) layout, from `_to_raw(parts=True)`.
+            simple_raw, compressed_raw = raw
+            simple = SortedSet._from_raw(*simple_raw, algo=algo)
+            compressed = RangeSet._from_raw(*compressed_raw, algo=algo)
+            self = cls(freeze=False, algo=simple._algo)
+            for low_key, high_key in heapq.merge(((k, k) for k in simple), compressed._iter_runs()):
+                self._append_range(low_key, high_key)
+            self._freeze()
+            return self
+        len, low_keys, high_keys = raw
         self = cls.__new__(cls)
-        self._simple = SortedSet._from_raw(*simple_raw)
-        self._compressed = RangeSet._from_raw(*compressed_raw)
+        self._algo = algos.get(algo, _algo, auto=False)
+        self._len = len
+        self._low_keys = low_keys
+        self._high_keys = high_keys
+        self._frozen = True
         return self
 
-    def _to_raw(self):
-        return self._simple._to_raw(), self._compressed._to_raw()
+    def _to_raw(self, *, parts=False):
+        ''' Return the frozen layout, as `_from_raw` takes it.
+
+            With `parts`, return the separate (SortedSet, RangeSet)
+            layout instead; `_from_raw` takes that too.
+        '''
+        assert self._frozen or not self._len
+        if not parts:
+            return self._len, self._low_keys, self._high_keys
+        simple = SortedSet(algo=self._algo)
+        compressed = RangeSet(algo=self._algo)
+        for low_key, high_key in self._iter_runs():
+            if low_key == high_key:
+                simple._append(low_key)
+            else:
+                compressed._append_range(low_key, high_key)
+        simple._freeze()
+        compressed._freeze()
+        return simple._to_raw(), compressed._to_raw()
 
     def __contains__(self, item):
-        return item in self._simple or item in self._compressed
+        assert self._frozen or not self._len
+        idx = self._algo.search(self._low_keys, item)
+        if idx != -1:
+            assert self._low_keys[idx] <= item
+            if item <= self._high_keys[idx]:
+                return True
+        return False
 
     def __iter__(self):
-        return MinIter(self._simple, self._compressed)
+        for low_key, high_key in self._iter_runs():
+            yield from run_keys(low_key, high_key, False)
+
+    def __reversed__(self):
+        for low_key, high_key in self._iter_runs(reverse=True):
+            yield from run_keys(low_key, high_key, True)
+
+    def _between(self, low, high, inclusive, reverse):
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            yield from run_keys(low_key, high_key, reverse)
+
+    def _lookup_many(self, keys):
+        return None, self._search_runs_many(keys)[1]
 
     def __len__(self):
-        return self._simple._len + self._compressed._len
+        return self._len
 
     def __repr__(self):
-        return '%s(simple=%r, compressed=%r)' % (self.__class__.__qualname__, self._simple, self._compressed)
+        return '%s(len=%d, low_keys=%r, high_keys=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys)
 
 
-class SortedMap(Mapping):
+class SortedMap(FrozenMap, Mapping):
     ''' Simple binary-search dict.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_keys', '_values')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._keys = []
         self._values = []
@@ -248,21 +1258,30 @@ class SortedMap(Mapping):
         self._values.append(value)
         self._len += 1
 
-    def _pop(self):
+    def _extend_sorted(self, items):
         assert not self._frozen
-        self._keys.pop()
-        self._values.pop()
-        self._len -= 1
-
+        keys_append = self._keys.append
+        values_append = self._values.append
+        for key, value in items:
+            keys_append(key)
+            values_append(value)
+        self._len = len(self._keys)
+
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._keys = _algo.freeze(self._keys)
-        self._values = _algo.freeze(self._values)
+        self._algo = algos.choose(self._algo, self._keys)
+        if self._compact:
+            self._keys = compact_ints(self._keys)
+            self._values = compact_ints(self._values)
+        self._keys = self._algo.freeze(self._keys)
+        self._values = self._algo.freeze(self._values)
 
     @classmethod
-    def _from_raw(cls, len, keys, values):
+    def _from_raw(cls, len, keys, values, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._keys = keys
         self._values = values
@@ -275,23 +1294,59 @@ class SortedMap(Mapping):
 
     def __getitem__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._keys, item)
+        idx = self._algo.search(self._keys, item)
         if idx != -1:
             assert self._keys[idx] <= item
             if item == self._keys[idx]:
                 return self._values[idx]
         raise KeyError(item)
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _keys = self._keys
         _values = self._values
-        for idx in _algo.iter_forward(len(_keys)):
+        for idx in physical_range(self._algo, len(_keys), reverse):
             yield (_keys[idx], _values[idx])
 
+    def _iter_value_runs(self, reverse=False):
+        for k, v in self._iter_tuples(reverse):
+            yield (k, k, v, False)
+
+    def _extend_runs(self, runs):
+        self._extend_sorted((low_key, value) for low_key, high_key, value, is_delta in runs)
+
+    def _keys_array(self):
+        return in_order(self._keys, self._algo.forward_order(len(self._keys)))
+
+    def _values_array(self):
+        return in_order(self._values, self._algo.forward_order(len(self._keys)))
+
     def __iter__(self):
         for k, v in self._iter_tuples():
             yield k
 
+    def __reversed__(self):
+        for k, v in self._iter_tuples(reverse=True):
+            yield k
+
+    def _between(self, low, high, inclusive, reverse):
+        _keys = self._keys
+        _values = self._values
+        order = self._algo.lookup_order(len(_keys))
+        start, stop = bisect_between(SortedView(_keys, order), low, high, inclusive)
+        for li in logical_range(start, stop, reverse):
+            idx = order[li]
+            yield (_keys[idx], _values[idx])
+
+    def _count_below(self, key, inclusive):
+        view = SortedView(self._keys, self._algo.lookup_order(len(self._keys)))
+        return (bisect.bisect_right if inclusive else bisect.bisect_left)(view, key)
+
+    def _lookup_many(self, keys):
+        idx = self._algo.search_many(self._keys, keys)
+        found = idx >= 0
+        found[found] = as_numpy(self._keys)[idx[found]] == keys[found]
+        return gather(self._values, idx, found), found
+
     def __len__(self):
         return self._len
 
@@ -299,10 +1354,14 @@ class SortedMap(Mapping):
         return '%s(len=%d, keys=%r, values=%r)' % (self.__class__.__qualname__, self._len, self._keys, self._values)
 
 
-class RangeMap(Mapping):
+class RangeMap(FrozenMap, Runs, Mapping):
     ''' Compressed binary-search dict (for equal values).
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_low_keys', '_high_keys', '_values')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._low_keys = []
         self._high_keys = []
@@ -317,6 +1376,29 @@ class RangeMap(Mapping):
             if freeze:
                 self._freeze()
 
+    @classmethod
+    def from_ranges(cls, ranges, *, freeze=True, **kwargs):
+        ''' Build a dict from inclusive (low_key, high_key, value) ranges.
+
+            The ranges may be in any order, and may overlap or touch;
+            overlapping ranges must have equal values.
+            The time taken depends only on the number of ranges.
+        '''
+        self = cls(freeze=False, **kwargs)
+        for low_key, high_key, value in sorted_ranges(ranges):
+            if self._len:
+                prev_high_key = self._high_keys[-1]
+                if low_key <= prev_high_key:
+                    if self._values[-1] != value:
+                        raise ValueError('Overlapping ranges at key %r have different values' % (low_key,))
+                    if high_key <= prev_high_key:
+                        continue
+                    low_key = prev_high_key + 1
+            self._append_range(low_key, high_key, value)
+        if freeze:
+            self._freeze()
+        return self
+
     def _append_range(self, low_key, high_key, value):
         assert not self._frozen
         assert not self._len or self._high_keys[-1] < low_key
@@ -329,23 +1411,39 @@ class RangeMap(Mapping):
             self._values.append(value)
         self._len += high_key - low_key + 1
 
-    def _pop_range(self):
+    def _extend_sorted(self, items):
         assert not self._frozen
-        low_key = self._low_keys.pop()
-        high_key = self._high_keys.pop()
-        self._values.pop()
-        self._len -= high_key - low_key + 1
-
+        low_keys = self._low_keys
+        high_keys = self._high_keys
+        values = self._values
+        n = 0
+        for key, value in items:
+            if high_keys and high_keys[-1] + 1 == key and values[-1] == value:
+                high_keys[-1] = key
+            else:
+                low_keys.append(key)
+                high_keys.append(key)
+                values.append(value)
+            n += 1
+        self._len += n
+
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._low_keys = _algo.freeze(self._low_keys)
-        self._high_keys = _algo.freeze(self._high_keys)
-        self._values = _algo.freeze(self._values)
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+            self._values = compact_ints(self._values)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
+        self._values = self._algo.freeze(self._values)
 
     @classmethod
-    def _from_raw(cls, len, low_keys, high_keys, values):
+    def _from_raw(cls, len, low_keys, high_keys, values, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._low_keys = low_keys
         self._high_keys = high_keys
@@ -359,18 +1457,18 @@ class RangeMap(Mapping):
 
     def __getitem__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._low_keys, item)
+        idx = self._algo.search(self._low_keys, item)
         if idx != -1:
             assert self._low_keys[idx] <= item
             if item <= self._high_keys[idx]:
                 return self._values[idx]
         raise KeyError(item)
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _low_keys = self._low_keys
         _high_keys = self._high_keys
         _values = self._values
-        for idx in _algo.iter_forward(len(self._low_keys)):
+        for idx in physical_range(self._algo, len(self._low_keys), reverse):
             yield (_low_keys[idx], _high_keys[idx], _values[idx])
 
     def __iter__(self):
@@ -378,6 +1476,35 @@ class RangeMap(Mapping):
             for k in range(k1, k2+1):
                 yield k
 
+    def __reversed__(self):
+        for k1, k2, v in self._iter_tuples(reverse=True):
+            yield from logical_range(k1, k2 + 1, True)
+
+    def _between(self, low, high, inclusive, reverse):
+        _values = self._values
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            value = _values[idx]
+            for k in logical_range(low_key, high_key + 1, reverse):
+                yield (k, value)
+
+    def _lookup_many(self, keys):
+        idx, found = self._search_runs_many(keys)
+        return gather(self._values, idx, found), found
+
+    def _iter_value_runs(self, reverse=False):
+        for low_key, high_key, value in self._iter_tuples(reverse):
+            yield (low_key, high_key, value, False)
+
+    def _extend_runs(self, runs):
+        for low_key, high_key, value, is_delta in runs:
+            self._append_range(low_key, high_key, value)
+
+    def _values_array(self):
+        import numpy as np
+
+        order, low_keys, lengths = self._sorted_runs()
+        return np.repeat(in_order(self._values, order), lengths)
+
     def __len__(self):
         return self._len
 
@@ -385,10 +1512,14 @@ class RangeMap(Mapping):
         return '%s(len=%d, low_keys=%r, high_keys=%r, values=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys, self._values)
 
 
-class DeltaMap(Mapping):
+class DeltaMap(FrozenMap, Runs, Mapping):
     ''' Compressed binary-search dict (for sequential values).
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_low_keys', '_high_keys', '_values')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._low_keys = []
         self._high_keys = []
@@ -403,6 +1534,31 @@ class DeltaMap(Mapping):
             if freeze:
                 self._freeze()
 
+    @classmethod
+    def from_ranges(cls, ranges, *, freeze=True, **kwargs):
+        ''' Build a dict from inclusive (low_key, high_key, value) ranges,
+            where each key maps to `value + (key - low_key)`.
+
+            The ranges may be in any order, and may overlap or touch;
+            overlapping ranges must agree on their values.
+            The time taken depends only on the number of ranges.
+        '''
+        self = cls(freeze=False, **kwargs)
+        for low_key, high_key, value in sorted_ranges(ranges):
+            if self._len:
+                prev_high_key = self._high_keys[-1]
+                if low_key <= prev_high_key:
+                    if self._values[-1] + (low_key - self._low_keys[-1]) != value:
+                        raise ValueError('Overlapping ranges at key %r have different values' % (low_key,))
+                    if high_key <= prev_high_key:
+                        continue
+                    value += prev_high_key + 1 - low_key
+                    low_key = prev_high_key + 1
+            self._append_range(low_key, high_key, value)
+        if freeze:
+            self._freeze()
+        return self
+
     def _append_range(self, low_key, high_key, value):
         assert not self._frozen
         assert not self._len or self._high_keys[-1] < low_key
@@ -415,23 +1571,39 @@ class DeltaMap(Mapping):
             self._values.append(value)
         self._len += high_key - low_key + 1
 
-    def _pop_range(self):
+    def _extend_sorted(self, items):
         assert not self._frozen
-        low_key = self._low_keys.pop()
-        high_key = self._high_keys.pop()
-        self._values.pop()
-        self._len -= high_key - low_key + 1
-
+        low_keys = self._low_keys
+        high_keys = self._high_keys
+        values = self._values
+        n = 0
+        for key, value in items:
+            if high_keys and high_keys[-1] + 1 == key and values[-1] + (key - low_keys[-1]) == value:
+                high_keys[-1] = key
+            else:
+                low_keys.append(key)
+                high_keys.append(key)
+                values.append(value)
+            n += 1
+        self._len += n
+
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._low_keys = _algo.freeze(self._low_keys)
-        self._high_keys = _algo.freeze(self._high_keys)
-        self._values = _algo.freeze(self._values)
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+            self._values = compact_ints(self._values)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
+        self._values = self._algo.freeze(self._values)
 
     @classmethod
-    def _from_raw(cls, len, low_keys, high_keys, values):
+    def _from_raw(cls, len, low_keys, high_keys, values, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._low_keys = low_keys
         self._high_keys = high_keys
@@ -445,18 +1617,20 @@ class DeltaMap(Mapping):
 
     def __getitem__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._low_keys, item)
+        idx = self._algo.search(self._low_keys, item)
         if idx != -1:
             assert self._low_keys[idx] <= item
             if item <= self._high_keys[idx]:
-                return self._values[idx] + (item - self._low_keys[idx])
+                # Keep the offset as a plain int, even if the raw arrays are
+                # numpy ones; `-1 + numpy.uint32(0)` is an OverflowError.
+                return self._values[idx] + int(item - self._low_keys[idx])
         raise KeyError(item)
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _low_keys = self._low_keys
         _high_keys = self._high_keys
         _values = self._values
-        for idx in _algo.iter_forward(len(self._low_keys)):
+        for idx in physical_range(self._algo, len(self._low_keys), reverse):
             yield (_low_keys[idx], _high_keys[idx], _values[idx])
 
     def __iter__(self):
@@ -464,6 +1638,36 @@ class DeltaMap(Mapping):
             for k in range(k1, k2+1):
                 yield k
 
+    def __reversed__(self):
+        for k1, k2, v in self._iter_tuples(reverse=True):
+            yield from logical_range(k1, k2 + 1, True)
+
+    def _between(self, low, high, inclusive, reverse):
+        _low_keys = self._low_keys
+        _values = self._values
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            delta = _values[idx] - _low_keys[idx]
+            for k in logical_range(low_key, high_key + 1, reverse):
+                yield (k, k + delta)
+
+    def _lookup_many(self, keys):
+        idx, found = self._search_runs_many(keys)
+        values = gather(self._values, idx, found)
+        values[found] += keys[found] - as_numpy(self._low_keys)[idx[found]]
+        return values, found
+
+    def _iter_value_runs(self, reverse=False):
+        for low_key, high_key, value in self._iter_tuples(reverse):
+            yield (low_key, high_key, value, True)
+
+    def _extend_runs(self, runs):
+        for low_key, high_key, value, is_delta in runs:
+            self._append_range(low_key, high_key, value)
+
+    def _values_array(self):
+        order, low_keys, lengths = self._sorted_runs()
+        return expand_runs(in_order(self._values, order), lengths)
+
     def __len__(self):
         return self._len
 
@@ -471,15 +1675,25 @@ class DeltaMap(Mapping):
         return '%s(len=%d, low_keys=%r, high_keys=%r, values=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys, self._values)
 
 
-class DenseMap(Mapping):
+class DenseMap(FrozenMap, Runs, Mapping):
     ''' Compressed binary-search dict (for arbitrary values with dense keys).
+
+        With a `typecode` (as for `array.array`), the values are stored
+        in an array of that type instead of a list, e.g. 8 bytes each for
+        'q' or 'd' rather than a whole object. Blocks of values are then
+        produced as zero-copy memoryview slices, and `get_many` gathers
+        from the array directly.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
+    _run_arrays = ('_low_keys', '_high_keys', '_value_indices')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True, typecode=None):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
         self._len = 0
         self._low_keys = []
         self._high_keys = []
         self._value_indices = []
-        self._value_data = []
+        self._value_data = [] if typecode is None else array.array(typecode)
         self._frozen = False
         if iterable is not None:
             if isinstance(iterable, Mapping):
@@ -490,6 +1704,39 @@ class DenseMap(Mapping):
             if freeze:
                 self._freeze()
 
+    @classmethod
+    def from_blocks(cls, blocks, *, freeze=True, **kwargs):
+        ''' Build a dict from (low_key, [values...]) blocks, where the
+            values are for consecutive keys starting at `low_key`.
+
+            The blocks may be in any order, and may overlap or touch;
+            overlapping blocks must have equal values.
+            The time taken depends on the number of blocks and values,
+            not on the number of keys between them.
+        '''
+        self = cls(freeze=False, **kwargs)
+        blocks = sorted_ranges((low_key, low_key + len(value_list) - 1, value_list) for low_key, value_list in blocks if len(value_list))
+        for low_key, high_key, value_list in blocks:
+            if isinstance(self._value_data, list) and hasattr(value_list, 'tolist'):
+                # Store Python objects, not numpy scalars.
+                value_list = value_list.tolist()
+            if self._len:
+                prev_high_key = self._high_keys[-1]
+                if low_key <= prev_high_key:
+                    overlap = prev_high_key - low_key + 1
+                    start = len(self._value_data) - overlap
+                    n = min(overlap, len(value_list))
+                    if list(self._value_data[start:start + n]) != list(value_list[:n]):
+                        raise ValueError('Overlapping blocks at key %r have different values' % (low_key,))
+                    if high_key <= prev_high_key:
+                        continue
+                    value_list = value_list[overlap:]
+                    low_key = prev_high_key + 1
+            self._append_range(low_key, value_list)
+        if freeze:
+            self._freeze()
+        return self
+
     def _append_range(self, low_key, value_list):
         high_key = low_key + len(value_list) - 1
         assert not self._frozen
@@ -505,17 +1752,39 @@ class DenseMap(Mapping):
             self._value_data.extend(value_list)
         self._len += high_key - low_key + 1
 
+    def _extend_sorted(self, items):
+        assert not self._frozen
+        low_keys = self._low_keys
+        high_keys = self._high_keys
+        value_indices = self._value_indices
+        value_data = self._value_data
+        for key, value in items:
+            if not (high_keys and high_keys[-1] + 1 == key):
+                low_keys.append(key)
+                high_keys.append(key)
+                value_indices.append(len(value_data))
+            high_keys[-1] = key
+            value_data.append(value)
+        self._len = len(value_data)
+
+    @traces_peak
     def _freeze(self):
         assert not self._frozen
         self._frozen = True
-        self._low_keys = _algo.freeze(self._low_keys)
-        self._high_keys = _algo.freeze(self._high_keys)
-        self._value_indices = _algo.freeze(self._value_indices)
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+            self._value_indices = compact_ints(self._value_indices)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
+        self._value_indices = self._algo.freeze(self._value_indices)
         # self._value_data is unchanged
 
     @classmethod
-    def _from_raw(cls, len, low_keys, high_keys, value_indices, value_data):
+    def _from_raw(cls, len, low_keys, high_keys, value_indices, value_data, *, algo=None):
         self = cls.__new__(cls)
+        self._algo = algos.get(algo, _algo, auto=False)
         self._len = len
         self._low_keys = low_keys
         self._high_keys = high_keys
@@ -530,7 +1799,7 @@ class DenseMap(Mapping):
 
     def __getitem__(self, item):
         assert self._frozen or not self._len
-        idx = _algo.search(self._low_keys, item)
+        idx = self._algo.search(self._low_keys, item)
         if idx != -1:
             assert self._low_keys[idx] <= item
             if item <= self._high_keys[idx]:
@@ -539,12 +1808,12 @@ class DenseMap(Mapping):
                 return self._value_data[vi + kd]
         raise KeyError(item)
 
-    def _iter_tuples(self):
+    def _iter_tuples(self, reverse=False):
         _low_keys = self._low_keys
         _high_keys = self._high_keys
         _value_indices = self._value_indices
-        _value_data = self._value_data
-        for idx in _algo.iter_forward(len(self._low_keys)):
+        _value_data = sliceable(self._value_data)
+        for idx in physical_range(self._algo, len(self._low_keys), reverse):
             nkeys = _high_keys[idx] - _low_keys[idx] + 1
             vi = _value_indices[idx]
             yield (_low_keys[idx], _value_data[vi:vi+nkeys])
@@ -554,6 +1823,60 @@ class DenseMap(Mapping):
             for kd, v in enumerate(vs):
                 yield k + kd
 
+    def __reversed__(self):
+        for k, vs in self._iter_tuples(reverse=True):
+            yield from logical_range(k, k + len(vs), True)
+
+    def _between(self, low, high, inclusive, reverse):
+        _low_keys = self._low_keys
+        _value_indices = self._value_indices
+        _value_data = self._value_data
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            vd = _value_indices[idx] - _low_keys[idx]
+            for k in logical_range(low_key, high_key + 1, reverse):
+                yield (k, _value_data[vd + k])
+
+    def _keys_before(self, li, idx):
+        # The values are stored in key order, so this is already known.
+        return self._value_indices[idx]
+
+    def _lookup_many(self, keys):
+        import numpy as np
+
+        idx, found = self._search_runs_many(keys)
+        # Build the indices as real ints, even if the arrays are lists.
+        hits = idx[found]
+        vi = np.zeros(keys.shape, dtype=np.intp)
+        vi[found] = as_numpy(self._value_indices)[hits] + (keys[found] - as_numpy(self._low_keys)[hits])
+        return gather(self._value_data, vi, found), found
+
+    def _iter_value_runs(self, reverse=False):
+        for low_key, values in self._iter_tuples(reverse):
+            yield (low_key, low_key + len(values) - 1, values)
+
+    def _extend_runs(self, runs):
+        for low_key, high_key, values in runs:
+            self._append_range(low_key, values)
+
+    def _join(self, segments, dests):
+        # The values stay in key order, so they are just concatenated,
+        # but each run's index into them moves.
+        value_indices = []
+        for part, start, stop in segments:
+            indices = part._value_indices[start:stop]
+            if len(indices):
+                end = part._value_indices[stop] if stop < len(part._value_indices) else len(part._value_data)
+                shift = len(self._value_data) - indices[0]
+                self._value_data.extend(part._value_data[indices[0]:end])
+                shifted = [idx + shift for idx in indices]
+                indices = array.array(indices.typecode, shifted) if isinstance(indices, array.array) else shifted
+            value_indices.append(indices)
+        Frozen._join(self, segments, dests, _value_indices=value_indices)
+
+    def _values_array(self):
+        # The values are already stored in key order.
+        return in_order(self._value_data, range(self._len))
+
     def __len__(self):
         return self._len
 
@@ -561,13 +1884,26 @@ class DenseMap(Mapping):
         return '%s(len=%d, low_keys=%r, high_keys=%r, value_indices=%r, value_data=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys, self._value_indices, self._value_data)
 
 
-class AutoMap(Mapping):
+class AutoMap(FrozenMap, Runs, Mapping):
     ''' Multi-strategy binary-search dict.
+
+        Keys are stored as runs in one table, each tagged with how to find
+        its values: `POINT` for a single key (as in `SortedMap`), `CONSTANT`
+        for the same value throughout (as in `RangeMap`), or `DELTA` for
+        values that go up with the keys (as in `DeltaMap`). A lookup is a
+        single search, then a check of the tag.
     '''
-    def __init__(self, iterable=None, *, freeze=True):
-        self._simple = SortedMap()
-        self._compressed = RangeMap()
-        self._sequential = DeltaMap()
+    _run_arrays = ('_low_keys', '_high_keys', '_tags', '_values')
+
+    def __init__(self, iterable=None, *, freeze=True, algo=None, compact=True):
+        self._algo = algos.get(algo, _algo)
+        self._compact = compact
+        self._len = 0
+        self._low_keys = []
+        self._high_keys = []
+        self._tags = []
+        self._values = []
+        self._frozen = False
         if iterable is not None:
             if isinstance(iterable, Mapping):
                 iterable = iterable.items()
@@ -577,82 +1913,560 @@ class AutoMap(Mapping):
             if freeze:
                 self._freeze()
 
+    def _append_run(self, low_key, high_key, tag, value):
+        self._low_keys.append(low_key)
+        self._high_keys.append(high_key)
+        self._tags.append(tag)
+        self._values.append(value)
+
     def _append_range(self, low_key, high_key, value, is_delta):
-        assert not self._simple._len or self._simple._keys[-1] < low_key
-        assert not self._compressed._len or self._compressed._high_keys[-1] < low_key
-        assert not self._sequential._len or self._sequential._high_keys[-1] < low_key
+        assert not self._frozen
+        assert not self._len or self._high_keys[-1] < low_key
         assert low_key <= high_key
-        if self._simple._len and adjacent(self._simple._keys[-1], low_key):
-            if (low_key == high_key or not is_delta) and self._simple._values[-1] == value:
-                low_key = self._simple._keys[-1]
-                self._simple._pop()
-                self._compressed._append_range(low_key, high_key, value)
-                return
-            if (low_key == high_key or is_delta) and adjacent(self._simple._values[-1], value):
-                low_key = self._simple._keys[-1]
-                value = self._simple._values[-1]
-                self._simple._pop()
-                self._sequential._append_range(low_key, high_key, value)
-                return
-        # If both compression and sequential apply, convert (2, 1) into (1, 2)
-        # so that later appends can take full advantage of the longer range.
-        if low_key == high_key:
-            if self._compressed._len and adjacent(self._compressed._low_keys[-1], self._compressed._high_keys[-1]):
-                if adjacent(self._compressed._high_keys[-1], low_key) and adjacent(self._compressed._values[-1], value):
-                    self._simple._append(self._compressed._low_keys[-1], self._compressed._values[-1])
-                    self._sequential._append_range(self._compressed._high_keys[-1], low_key, self._compressed._values[-1])
-                    self._compressed._pop_range()
+        _low_keys = self._low_keys
+        _high_keys = self._high_keys
+        _tags = self._tags
+        _values = self._values
+        self._len += run_length(low_key, high_key)
+        # Only the last run can be adjacent to the new keys.
+        if _high_keys and adjacent(_high_keys[-1], low_key):
+            last_tag = _tags[-1]
+            last_value = _values[-1]
+            if last_tag == POINT:
+                if (low_key == high_key or not is_delta) and last_value == value:
+                    _tags[-1] = CONSTANT
+                    _high_keys[-1] = high_key
                     return
-            if self._sequential._len and adjacent(self._sequential._low_keys[-1], self._sequential._high_keys[-1]):
-                # Note: we use adjacent() for the values isntead of ==, since we have to undo the delta.
-                if adjacent(self._sequential._high_keys[-1], low_key) and adjacent(self._sequential._values[-1], value):
-                    self._simple._append(self._sequential._low_keys[-1], self._sequential._values[-1])
-                    self._compressed._append_range(self._sequential._high_keys[-1], low_key, value)
-                    self._sequential._pop_range()
+                if (low_key == high_key or is_delta) and adjacent(last_value, value):
+                    _tags[-1] = DELTA
+                    _high_keys[-1] = high_key
                     return
-        if low_key == high_key or not is_delta:
-            if low_key != high_key or (self._compressed._len and adjacent(self._compressed._high_keys[-1], low_key) and self._compressed._values[-1] == value):
-                self._compressed._append_range(low_key, high_key, value)
+            # If both compression and sequential apply, convert (2, 1) into (1, 2)
+            # so that later appends can take full advantage of the longer range.
+            elif low_key == high_key and adjacent(_low_keys[-1], _high_keys[-1]) and adjacent(last_value, value):
+                # Note: we use adjacent() for the values of a DELTA run instead of ==,
+                # since we have to undo the delta.
+                middle_key = _high_keys[-1]
+                _high_keys[-1] = _low_keys[-1]
+                _tags[-1] = POINT
+                if last_tag == CONSTANT:
+                    self._append_run(middle_key, low_key, DELTA, last_value)
+                else:
+                    self._append_run(middle_key, low_key, CONSTANT, value)
+                return
+            if last_tag == CONSTANT and (low_key == high_key or not is_delta) and last_value == value:
+                _high_keys[-1] = high_key
                 return
-        if low_key == high_key or is_delta:
-            if low_key != high_key or (self._sequential._len and adjacent(self._sequential._high_keys[-1], low_key) and adjacent(self._sequential._values[-1], value, step=(low_key - self._sequential._low_keys[-1]))):
-                self._sequential._append_range(low_key, high_key, value)
+            if last_tag == DELTA and (low_key == high_key or is_delta) and adjacent(last_value, value, step=(low_key - _low_keys[-1])):
+                _high_keys[-1] = high_key
                 return
-        assert low_key == high_key
-        self._simple._append(low_key, value)
+        if low_key == high_key:
+            self._append_run(low_key, high_key, POINT, value)
+        else:
+            self._append_run(low_key, high_key, DELTA if is_delta else CONSTANT, value)
 
+    def _extend_sorted(self, items):
+        _append_range = self._append_range
+        for key, value in items:
+            _append_range(key, key, value, ErrorBool)
+
+    def _stitch_units(self, part):
+        # A run might have been split differently if later keys had been
+        # appended one at a time, so do that.
+        for key, value in part.items():
+            yield (key, key, value, False)
+
+    @traces_peak
     def _freeze(self):
-        self._simple._freeze()
-        self._compressed._freeze()
-        self._sequential._freeze()
+        assert not self._frozen
+        self._frozen = True
+        self._algo = algos.choose(self._algo, self._low_keys)
+        if self._compact:
+            self._low_keys = compact_ints(self._low_keys)
+            self._high_keys = compact_ints(self._high_keys)
+            self._tags = array.array('B', self._tags)
+            self._values = compact_ints(self._values)
+        self._low_keys = self._algo.freeze(self._low_keys)
+        self._high_keys = self._algo.freeze(self._high_keys)
+        self._tags = self._algo.freeze(self._tags)
+        self._values = self._algo.freeze(self._values)
 
     @classmethod
-    def _from_raw(cls, simple_raw, compressed_raw, sequential_raw):
+    def _from_raw(cls, *raw, algo=None):
+        if isinstance(raw[0], tuple):
+            # The separate (SortedMap, RangeMap, DeltaMap) layout,
+            # from `_to_raw(parts=True)`.
+            simple_raw, compressed_raw, sequential_raw = raw
+            simple = SortedMap._from_raw(*simple_raw, algo=algo)
+            compressed = RangeMap._from_raw(*compressed_raw, algo=algo)
+            sequential = DeltaMap._from_raw(*sequential_raw, algo=algo)
+            self = cls(freeze=False, algo=simple._algo)
+            runs = heapq.merge(
+                    ((k, k, POINT, v) for k, v in simple._iter_tuples()),
+                    ((lo, hi, CONSTANT, v) for lo, hi, v in compressed._iter_tuples()),
+                    ((lo, hi, DELTA, v) for lo, hi, v in sequential._iter_tuples()),
+                    key=operator.itemgetter(0))
+            for low_key, high_key, tag, value in runs:
+                self._append_run(low_key, high_key, tag, value)
+                self._len += run_length(low_key, high_key)
+            self._freeze()
+            return self
+        len, low_keys, high_keys, tags, values = raw
         self = cls.__new__(cls)
-        self._simple = SortedMap._from_raw(*simple_raw)
-        self._compressed = RangeMap._from_raw(*compressed_raw)
-        self._sequential = DeltaMap._from_raw(*sequential_raw)
+        self._algo = algos.get(algo, _algo, auto=False)
+        self._len = len
+        self._low_keys = low_keys
+        self._high_keys = high_keys
+        self._tags = tags
+        self._values = values
+        self._frozen = True
         return self
 
-    def _to_raw(self):
-        return self._simple._to_raw(), self._compressed._to_raw(), self._sequential._to_raw()
+    def _to_raw(self, *, parts=False):
+        ''' Return the frozen layout, as `_from_raw` takes it.
+
+            With `parts`, return the separate (SortedMap, RangeMap,
+            DeltaMap) layout instead; `_from_raw` takes that too.
+        '''
+        assert self._frozen or not self._len
+        if not parts:
+            return self._len, self._low_keys, self._high_keys, self._tags, self._values
+        simple = SortedMap(algo=self._algo)
+        compressed = RangeMap(algo=self._algo)
+        sequential = DeltaMap(algo=self._algo)
+        for idx in self._algo.iter_forward(len(self._low_keys)):
+            low_key = self._low_keys[idx]
+            high_key = self._high_keys[idx]
+            tag = self._tags[idx]
+            value = self._values[idx]
+            if tag == POINT:
+                simple._append(low_key, value)
+            elif tag == CONSTANT:
+                compressed._append_range(low_key, high_key, value)
+            else:
+                sequential._append_range(low_key, high_key, value)
+        simple._freeze()
+        compressed._freeze()
+        sequential._freeze()
+        return simple._to_raw(), compressed._to_raw(), sequential._to_raw()
 
     def __getitem__(self, item):
+        assert self._frozen or not self._len
+        idx = self._algo.search(self._low_keys, item)
+        if idx != -1:
+            assert self._low_keys[idx] <= item
+            if item <= self._high_keys[idx]:
+                value = self._values[idx]
+                if self._tags[idx] == DELTA:
+                    # As in DeltaMap, keep the offset as a plain int.
+                    value += int(item - self._low_keys[idx])
+                return value
+        raise KeyError(item)
+
+    def __iter__(self):
+        for low_key, high_key in self._iter_runs():
+            yield from run_keys(low_key, high_key, False)
+
+    def __reversed__(self):
+        for low_key, high_key in self._iter_runs(reverse=True):
+            yield from run_keys(low_key, high_key, True)
+
+    def _between(self, low, high, inclusive, reverse):
+        _low_keys = self._low_keys
+        _tags = self._tags
+        _values = self._values
+        for idx, low_key, high_key in self._clipped_runs(low, high, inclusive, reverse):
+            value = _values[idx]
+            if _tags[idx] == DELTA:
+                delta = value - _low_keys[idx]
+                for k in logical_range(low_key, high_key + 1, reverse):
+                    yield (k, k + delta)
+            else:
+                for k in run_keys(low_key, high_key, reverse):
+                    yield (k, value)
+
+    def _lookup_many(self, keys):
+        idx, found = self._search_runs_many(keys)
+        values = gather(self._values, idx, found)
+        delta = found.copy()
+        delta[found] = as_numpy(self._tags)[idx[found]] == DELTA
+        if delta.any():
+            values[delta] += keys[delta] - as_numpy(self._low_keys)[idx[delta]]
+        return values, found
+
+    def _iter_value_runs(self, reverse=False):
+        _low_keys = self._low_keys
+        _high_keys = self._high_keys
+        _tags = self._tags
+        _values = self._values
+        for idx in physical_range(self._algo, len(_low_keys), reverse):
+            yield (_low_keys[idx], _high_keys[idx], _values[idx], _tags[idx] == DELTA)
+
+    def _values_array(self):
+        order, low_keys, lengths = self._sorted_runs()
+        return expand_runs(in_order(self._values, order), lengths, in_order(self._tags, order) == DELTA)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return '%s(len=%d, low_keys=%r, high_keys=%r, tags=%r, values=%r)' % (self.__class__.__qualname__, self._len, self._low_keys, self._high_keys, self._tags, self._values)
+
+
+class DeletedType:
+    ''' Marks a key that was removed since the last compaction.
+    '''
+    def __repr__(self):
+        return 'Deleted'
+
+    def __reduce__(self):
+        # Unpickle as the same singleton.
+        return 'Deleted'
+Deleted = DeletedType()
+
+
+class LogStructured:
+    ''' Shared parts of the mutable containers.
+
+        A mutable container is a frozen `_base` plus a dict of `_pending`
+        changes, from key to value (or `Deleted`). Lookups try `_pending`,
+        then `_base`. Once there are more than `max_pending` changes they
+        are merged into a new frozen base, in linear time: the base is
+        already sorted, so only the pending keys need sorting. By default
+        `max_pending` grows with the base, so each write is amortized
+        O(log n) and the base is almost always what gets searched.
+
+        Keys must be hashable, as well as orderable.
+    '''
+    min_pending = 256
+
+    def _init(self, base, algo, max_pending):
+        self._base_algo = algo
+        self._max_pending = max_pending
+        self._pending = {}
+        self._base = base
+        self._len = len(base)
+
+    def _pending_limit(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return max(self.min_pending, len(self._base) >> 3)
+
+    def _lookup(self, key):
         try:
-            return self._simple[item]
+            return self._pending[key]
         except KeyError:
             pass
+        return self._base_lookup(key)
+
+    def _write(self, key, value):
+        was_present = self._lookup(key) is not Deleted
+        self._len += (value is not Deleted) - was_present
+        if value is Deleted and key not in self._base:
+            self._pending.pop(key, None)
+        else:
+            self._pending[key] = value
+        if len(self._pending) > self._pending_limit():
+            self.compact()
+
+    def _iter_items(self, reverse=False):
+        pending = sorted(self._pending.items(), key=operator.itemgetter(0), reverse=reverse)
+        if reverse:
+            # Pending changes are merged first, so they win over the base.
+            # The forward loop below is faster, but only works ascending.
+            for item in MinIter(pending, self._base_items(True), key=operator.itemgetter(0), reverse=True, dedup=True):
+                if item[1] is not Deleted:
+                    yield item
+            return
+        pi = 0
+        for key, value in self._base_items(False):
+            while pi < len(pending) and pending[pi][0] < key:
+                if pending[pi][1] is not Deleted:
+                    yield pending[pi]
+                pi += 1
+            if pi < len(pending) and pending[pi][0] == key:
+                value = pending[pi][1]
+                pi += 1
+            if value is not Deleted:
+                yield (key, value)
+        for item in pending[pi:]:
+            if item[1] is not Deleted:
+                yield item
+
+    def _lookup_many(self, keys):
+        import numpy as np
+
+        values, found = self._base._lookup_many(keys)
+        if not self._pending:
+            return values, found
+        pending = sorted(self._pending.items(), key=operator.itemgetter(0))
+        pending_keys = as_numpy([k for k, _ in pending])
+        pos = np.minimum(np.searchsorted(pending_keys, keys), len(pending) - 1)
+        hit = pending_keys[pos] == keys
+        found[hit] = [pending[i][1] is not Deleted for i in pos[hit]]
+        if values is not None:
+            values = put(values, hit, gather([v for _, v in pending], pos, hit))
+        return values, found
+
+    contains_many = Frozen.contains_many
+
+    def __getstate__(self):
+        # The base pickles itself; the backend has to go by name.
+        state = self.__dict__.copy()
+        state['_base_algo'] = algos.name_of(self._base_algo)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._base_algo = algos.get(self._base_algo)
+
+    def _compacted_base(self):
+        self.compact()
+        return self._base
+
+    def iter_runs(self, reverse=False):
+        ''' As for the frozen containers, after merging pending changes.
+        '''
+        return self._compacted_base().iter_runs(reverse)
+
+    def keys_array(self):
+        ''' As for the frozen containers, after merging pending changes.
+        '''
+        return self._compacted_base().keys_array()
+
+    def to_numpy(self):
+        ''' As for the frozen containers, after merging pending changes.
+        '''
+        return self._compacted_base().to_numpy()
+
+    def compact(self):
+        ''' Merge the pending changes into a new frozen base now.
+        '''
+        if self._pending:
+            self._base = self._compacted(self._iter_items())
+            self._pending = {}
+        assert len(self._base) == self._len
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return '%s(base=%r, pending=%r)' % (self.__class__.__qualname__, self._base, self._pending)
+
+
+class MutableSortedSet(LogStructured, MutableSet):
+    ''' Binary-search set that can be changed after it is built.
+    '''
+    def __init__(self, iterable=(), *, algo=None, max_pending=None):
+        algo = algos.get(algo, _algo)
+        self._init(SortedSet(set(iterable), algo=algo), algo, max_pending)
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    def _base_lookup(self, key):
+        return True if key in self._base else Deleted
+
+    def _base_items(self, reverse):
+        for key in (reversed(self._base) if reverse else self._base):
+            yield (key, True)
+
+    def _compacted(self, items):
+        return SortedSet.from_sorted((key for key, _ in items), validate='none', algo=self._base_algo)
+
+    def add(self, key):
+        self._write(key, True)
+
+    def discard(self, key):
+        if key in self:
+            self._write(key, Deleted)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not Deleted
+
+    def __iter__(self):
+        for key, _ in self._iter_items():
+            yield key
+
+    def __reversed__(self):
+        for key, _ in self._iter_items(reverse=True):
+            yield key
+
+
+class MutableSortedMap(LogStructured, MutableMapping):
+    ''' Binary-search dict that can be changed after it is built.
+    '''
+    def __init__(self, iterable=(), *, algo=None, max_pending=None):
+        algo = algos.get(algo, _algo)
+        self._init(SortedMap(dict(iterable), algo=algo), algo, max_pending)
+
+    def _base_lookup(self, key):
         try:
-            return self._compressed[item]
+            return self._base[key]
         except KeyError:
-            pass
-        return self._sequential[item]
+            return Deleted
+
+    def _base_items(self, reverse):
+        return self._base._iter_tuples(reverse)
+
+    def _compacted(self, items):
+        return SortedMap.from_sorted(items, validate='none', algo=self._base_algo)
+
+    get_many = FrozenMap.get_many
+
+    def values_array(self):
+        ''' As for the frozen containers, after merging pending changes.
+        '''
+        return self._compacted_base().values_array()
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is Deleted:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._write(key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._write(key, Deleted)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not Deleted
 
     def __iter__(self):
-        return MinIter(self._simple, self._compressed, self._sequential)
+        for key, _ in self._iter_items():
+            yield key
+
+    def __reversed__(self):
+        for key, _ in self._iter_items(reverse=True):
+            yield key
+
+
+class Versioned:
+    ''' Shared parts of `VersionedSet` and `VersionedMap`.
+
+        This holds the current version of a frozen container, and swaps
+        in new ones with read-copy-update semantics. Readers just take
+        `snapshot()`, which is a single attribute read, so it never
+        blocks; the container it returns never changes. Writers build
+        and freeze a whole new container, then `publish` it. A version
+        stays alive as long as any reader still has it; once the last
+        one lets go it is released, which is tracked with weak references
+        so that `live_versions` and `synchronize` can report on it.
+    '''
+    def __init__(self, container):
+        self._cond = threading.Condition(threading.RLock())
+        # id(container) -> the newest version it was published as.
+        self._live = {}
+        self._current = None
+        self._next_version = 0
+        self.publish(container)
+
+    def publish(self, container):
+        ''' Make a frozen container the current version, and return its number.
+
+            Readers with an older snapshot keep using it until they're done.
+            Publishing a container that is still live again just moves it
+            to the new number, since the old one can't be released first.
+        '''
+        if not isinstance(container, Frozen) or (not container._frozen and len(container)):
+            raise ValueError('Only frozen containers can be published, not %r' % (container,))
+        with self._cond:
+            version = self._next_version
+            self._next_version += 1
+            key = id(container)
+            if key not in self._live:
+                weakref.finalize(container, self._release, key)
+            self._live[key] = version
+            # The swap itself; this may release the old version right away.
+            self._current = (version, container)
+        return version
+
+    def _release(self, key):
+        with self._cond:
+            del self._live[key]
+            self._cond.notify_all()
+
+    def snapshot(self):
+        ''' Return the current frozen container, for any number of reads.
+        '''
+        return self._current[1]
+
+    @property
+    def version(self):
+        ''' The number of the current version; they count up from 0.
+        '''
+        return self._current[0]
+
+    def live_versions(self):
+        ''' Return the numbers of the versions still in use, oldest first.
+
+            This includes the current one, so it is never empty.
+        '''
+        with self._cond:
+            return sorted(self._live.values())
+
+    def synchronize(self, timeout=None):
+        ''' Wait until every version older than the current one is released.
+
+            Returns False if `timeout` (in seconds) ran out first. A writer
+            can call this after `publish` to bound how many versions are
+            in memory at once.
+        '''
+        with self._cond:
+            version = self.version
+            return self._cond.wait_for(lambda: min(self._live.values()) >= version, timeout)
 
     def __len__(self):
-        return self._simple._len + self._compressed._len + self._sequential._len
+        return len(self.snapshot())
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __reversed__(self):
+        return reversed(self.snapshot())
+
+    def __contains__(self, key):
+        return key in self.snapshot()
 
     def __repr__(self):
-        return '%s(simple=%r, compressed=%r, delta=%r)' % (self.__class__.__qualname__, self._simple, self._compressed, self._sequential)
+        return '%s(version=%d, live=%d, current=%r)' % (self.__class__.__qualname__, self.version, len(self._live), self.snapshot())
+
+
+class VersionedSet(Versioned):
+    ''' A frozen set that can be replaced as a whole, under concurrent readers.
+
+        Each method reads a single snapshot. To do several reads of the
+        same version, take `snapshot()` once and use that.
+    '''
+    def __init__(self, container=None):
+        super().__init__(SortedSet(()) if container is None else container)
+
+
+class VersionedMap(Versioned):
+    ''' A frozen dict that can be replaced as a whole, under concurrent readers.
+
+        Each method reads a single snapshot. To do several reads of the
+        same version, take `snapshot()` once and use that.
+    '''
+    def __init__(self, container=None):
+        super().__init__(SortedMap(()) if container is None else container)
+
+    def __getitem__(self, key):
+        return self.snapshot()[key]
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
@@ -0,0 +1 @@
+sorted.py
\ No newline at end of file
@@ -20,6 +20,7 @@ from string import ascii_lowercase
 import unittest
 
 from o11c.containers import _cfbs as cfbs
+from o11c.enums import Direction
 
 
 def sizes_up_to(sz_limit):
@@ -195,3 +196,89 @@ class TestCfbs(unittest.TestCase):
             order_in_numpy_array = cfbs.make_order(iter(range(sz)), into=np.ndarray(sz, dtype=np.int32))
             assert isinstance(order_in_numpy_array, np.ndarray)
             assert all(order_in_python_list == order_in_numpy_array)
+
+    def test_search_many(self):
+        for sz in sizes_up_to(100):
+            order = cfbs.make_order(range(0, 2*sz, 2))
+            items = list(range(-2, 2*sz + 2))
+            expected = [cfbs.search(order, item) for item in items]
+            actual = cfbs.search_many(order, items)
+            assert isinstance(actual, np.ndarray)
+            assert list(actual) == expected
+            actual = cfbs.search_many(np.array(order, dtype=np.int32), np.array(items, dtype=np.int64))
+            assert list(actual) == expected
+        for sz in sizes_up_to(26+1):
+            order = cfbs.make_order(ascii_range_of_size(sz))
+            items = ['', 'a', 'aa', 'm', 'mm', 'z', 'zz']
+            expected = [cfbs.search(order, item) for item in items]
+            assert list(cfbs.search_many(order, items)) == expected
+
+    def test_freeze_in_place(self):
+        for sz in sizes_up_to(100):
+            expected = cfbs.make_order(range(sz))
+            arr = list(range(sz))
+            assert cfbs.freeze(arr) is arr
+            assert arr == expected
+            arr = np.arange(sz)
+            assert cfbs.freeze(arr) is arr
+            assert list(arr) == expected
+            assert cfbs.freeze(range(sz)) == expected
+
+    def test_index_conversion_many(self):
+        for sz in sizes_up_to(100):
+            indices = np.arange(sz)
+            expected_physical = [cfbs.to_physical_index(li, sz) for li in range(sz)]
+            physical = cfbs.to_physical_indices(indices, sz)
+            assert list(physical) == expected_physical
+            expected = [cfbs.to_logical_index(pi, sz) for pi in range(sz)]
+            logical = cfbs.to_logical_indices(indices, sz)
+            assert list(logical) == expected
+            assert list(logical[physical]) == list(indices)
+            for start in range(0, sz, 7):
+                assert list(cfbs.physical_indices(start, sz, sz)) == expected_physical[start:]
+        sz = 10**6 + 12345
+        indices = np.arange(sz)
+        assert (cfbs.to_logical_indices(cfbs.to_physical_indices(indices, sz), sz) == indices).all()
+        lis = [0, 1, sz//3, sz//2, sz-2, sz-1]
+        assert list(cfbs.to_physical_indices(lis, sz)) == [cfbs.to_physical_index(li, sz) for li in lis]
+
+    def test_make_order_gather(self):
+        for sz in sizes_up_to(100):
+            order = cfbs.make_order(np.arange(sz) * 3)
+            assert isinstance(order, np.ndarray)
+            assert list(order) == [3 * i for i in cfbs.make_order(range(sz))]
+
+    def test_forward_order(self):
+        for sz in sizes_up_to(100):
+            order = cfbs.forward_order(sz)
+            assert cfbs.forward_order(sz) is order
+            assert list(order) == list(cfbs.iter_toward(sz, dir=Direction.RIGHT))
+            assert list(cfbs.iter_backward(sz)) == list(cfbs.iter_toward(sz, dir=Direction.LEFT))
+        assert cfbs.forward_order(100).typecode == 'B'
+        assert cfbs.forward_order(1000).typecode == 'H'
+
+    def test_order_cache(self):
+        cache = cfbs.OrderCache(cfbs._build_forward_order, cfbs.PhysicalIndices, max_bytes=100)
+        a = cache(60)
+        assert cache(60) is a and cache.nbytes == 60
+        b = cache(40)
+        assert cache(40) is b and cache.nbytes == 100
+        assert cache(60) is a
+        c = cache(30)
+        # 40 was used least recently, so that's what gets evicted
+        assert cache.nbytes == 90
+        assert cache(60) is a and cache(30) is c
+        # A lookup uses what's cached, but never builds anything.
+        assert cache.lookup(60) is a
+        lazy = cache.lookup(50)
+        assert isinstance(lazy, cfbs.PhysicalIndices) and list(lazy) == list(cfbs.forward_order(50))
+        assert cache.nbytes == 90
+        assert cache(40) is not b
+        big = cache(101)
+        assert isinstance(big, cfbs.PhysicalIndices)
+        assert list(big) == list(cfbs.forward_order(101))
+        assert list(reversed(big)) == list(cfbs.iter_backward(101))
+        assert big[-1] == cfbs.forward_order(101)[-1]
+        assert np.asarray(big).tolist() == list(big)
+        cache.clear()
+        assert cache.nbytes == 0 and cache(60) is not a
@@ -0,0 +1,39 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import numpy as np
+import unittest
+
+from o11c.containers import _sorted as sorted_
+
+
+class TestSorted(unittest.TestCase):
+    def test_search_many(self):
+        for sz in range(100):
+            arr = list(range(0, 2*sz, 2))
+            items = list(range(-2, 2*sz + 2))
+            expected = [sorted_.search(arr, item) for item in items]
+            actual = sorted_.search_many(arr, items)
+            assert isinstance(actual, np.ndarray)
+            assert list(actual) == expected
+
+    def test_order(self):
+        for sz in range(10):
+            assert list(sorted_.forward_order(sz)) == list(sorted_.iter_forward(sz)) == list(range(sz))
+            assert list(sorted_.iter_backward(sz)) == list(reversed(range(sz)))
+            assert list(sorted_.physical_indices(sz // 3, sz, sz)) == list(range(sz // 3, sz))
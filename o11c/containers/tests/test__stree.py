@@ -0,0 +1,141 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import bisect
+import numpy as np
+import unittest
+
+from o11c.containers import _stree as stree
+
+
+def sizes_up_to(sz_limit):
+    # Every size for the first couple of levels, then sparser.
+    return list(range(300)) + list(range(300, sz_limit, 37))
+
+
+class TestStree(unittest.TestCase):
+    def test_hardcoded(self):
+        assert stree.make_order(range(0)) == []
+        assert stree.make_order(range(5)) == [0, 1, 2, 3, 4]
+        assert stree.make_order(range(16)) == list(range(16))
+        # The root's first child is the only other node.
+        assert stree.make_order(range(17)) == list(range(1, 17)) + [0]
+        assert stree.make_order(range(18)) == list(range(2, 18)) + [0, 1]
+        assert list(stree.iter_forward(18)) == [16, 17, 0] + list(range(1, 16))
+
+    def test_invariant(self):
+        for sz in sizes_up_to(5000):
+            o = stree.make_order(range(sz))
+            f = list(stree.iter_forward(sz))
+            assert sorted(f) == list(range(sz))
+            for i in range(sz):
+                assert f[o[i]] == i
+                assert o[f[i]] == i
+            assert list(stree.iter_backward(sz)) == f[::-1]
+
+    def test_physical_indices(self):
+        for sz in sizes_up_to(2000):
+            order = list(stree.forward_order(sz))
+            lazy = stree.PhysicalIndices(sz)
+            assert len(lazy) == sz
+            assert list(lazy) == order
+            assert list(reversed(lazy)) == order[::-1]
+            assert [lazy[li] for li in range(sz)] == order
+            assert np.asarray(lazy).tolist() == order
+            if sz:
+                assert lazy[-1] == order[-1]
+        cache = stree.OrderCache(stree._build_forward_order, stree.PhysicalIndices, max_bytes=100)
+        assert isinstance(cache(101), stree.PhysicalIndices)
+        assert list(cache(101)) == list(stree.forward_order(101))
+
+    def test_physical_index_ranges(self):
+        # The lazy version walks from the start, instead of using the cache.
+        sizes = sizes_up_to(1000) + [83520, 83521, 83522]
+        expected = [list(stree._build_forward_order(sz)) for sz in sizes]
+        for max_bytes in [64 << 20, 0]:
+            stree.forward_order.clear()
+            stree.forward_order.max_bytes = max_bytes
+            try:
+                for sz, order in zip(sizes, expected):
+                    for start in {0, 1, sz // 3, sz - 1, sz}:
+                        for stop in {start, min(start + 1, sz), min(start + 40, sz), sz}:
+                            if 0 <= start <= stop:
+                                assert stree.physical_indices(start, stop, sz).tolist() == order[start:stop]
+            finally:
+                stree.forward_order.max_bytes = 64 << 20
+                stree.forward_order.clear()
+
+    def test_freeze_uncached(self):
+        # Above the cache limit, freeze permutes by a temporary order
+        # instead of indexing the lazy one.
+        sizes = [1, 17, 300, 1000]
+        expected = [stree.make_order(range(sz)) for sz in sizes]
+        to_physical_index = stree.to_physical_index
+        indexed = []
+        def counting(li, sz):
+            indexed.append(li)
+            return to_physical_index(li, sz)
+        stree.forward_order.clear()
+        stree.forward_order.max_bytes = 0
+        stree.to_physical_index = counting
+        try:
+            for sz, order in zip(sizes, expected):
+                assert isinstance(stree.forward_order(sz), stree.PhysicalIndices)
+                assert stree.freeze(list(range(sz))) == order
+            assert stree.forward_order.nbytes == 0
+            # Only this lookup indexed the lazy order; freeze never did.
+            assert stree.forward_order(1000)[5] == expected[-1].index(5)
+            assert indexed == [5]
+        finally:
+            stree.to_physical_index = to_physical_index
+            stree.forward_order.max_bytes = 64 << 20
+            stree.forward_order.clear()
+
+    def test_tree(self):
+        for sz in sizes_up_to(5000):
+            order = stree.make_order(range(sz))
+            for k in range((sz + stree.B - 1) // stree.B):
+                keys = order[k * stree.B:(k + 1) * stree.B]
+                assert keys == sorted(keys)
+                for i in range(stree.B + 1):
+                    c = k * (stree.B + 1) + 1 + i
+                    child = order[c * stree.B:(c + 1) * stree.B]
+                    if i:
+                        assert all(keys[i - 1] < x for x in child)
+                    if i < len(keys):
+                        assert all(x < keys[i] for x in child)
+
+    def test_search(self):
+        for sz in sizes_up_to(5000):
+            sorted_data = list(range(0, 2*sz, 2))
+            order = stree.freeze(list(sorted_data))
+            assert order == stree.make_order(sorted_data)
+            items = list(range(-2, 2*sz + 2))
+            expected = [bisect.bisect_right(sorted_data, item) - 1 for item in items]
+            actual = [stree.search(order, item) for item in items]
+            assert [order[i] if i != -1 else None for i in actual] == [sorted_data[i] if i != -1 else None for i in expected]
+            assert list(stree.search_many(order, items)) == actual
+            assert list(stree.search_many(np.array(order), np.array(items))) == actual
+
+    def test_freeze(self):
+        for sz in sizes_up_to(1000):
+            expected = stree.make_order(range(sz))
+            arr = list(range(sz))
+            assert stree.freeze(arr) is arr
+            assert arr == expected
+            assert stree.freeze(range(sz)) == expected
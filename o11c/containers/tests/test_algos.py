@@ -0,0 +1,90 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import unittest
+
+from o11c.containers import algos, _cfbs, _sorted, _stree
+from o11c.containers.sorted import SortedSet, AutoSet
+
+
+class TestAlgos(unittest.TestCase):
+    def test_get(self):
+        assert algos.get('sorted') is _sorted
+        assert algos.get('cfbs') is _cfbs
+        assert algos.get('stree') is _stree
+        assert algos.get(None, 'stree') is _stree
+        assert algos.get(_stree) is _stree
+        assert algos.get('auto') is algos.AUTO
+        assert repr(algos.AUTO) == 'AUTO'
+        assert algos.AUTO.search is _sorted.search
+        with self.assertRaises(ValueError):
+            algos.get('bogus')
+        with self.assertRaises(ValueError):
+            algos.get('auto', auto=False)
+        assert algos.name_of(_stree) == 'stree'
+        assert algos.name_of(algos.AUTO) == 'auto'
+        with self.assertRaises(ValueError):
+            algos.name_of(algos)
+
+    def test_register(self):
+        algos.register('bisect', _sorted)
+        try:
+            assert algos.get('bisect') is _sorted
+            assert 'bisect' in algos.names()
+            assert list(SortedSet([3, 1, 2], algo='bisect')) == [1, 2, 3]
+        finally:
+            del algos._modules['bisect']
+        with self.assertRaises(ValueError):
+            algos.register('auto', _sorted)
+
+    def test_choose(self):
+        old = dict(algos.thresholds)
+        try:
+            algos.thresholds.clear()
+            algos.thresholds.update({'sorted': 0, 'stree': 100, 'cfbs': 1000})
+            assert algos.choose(_cfbs, [1]) is _cfbs
+            assert algos.choose(algos.AUTO) is _sorted
+            assert algos.choose(algos.AUTO, range(99)) is _sorted
+            assert algos.choose(algos.AUTO, range(100)) is _stree
+            assert algos.choose(algos.AUTO, range(50), range(50)) is _stree
+            assert algos.choose(algos.AUTO, range(1000)) is _cfbs
+            assert algos.choose(algos.AUTO, [str(i) for i in range(1000)]) is _sorted
+            assert SortedSet(range(1000), algo='auto')._algo is _cfbs
+            s = AutoSet(list(range(0, 1000, 2)) + list(range(1000, 1100)), algo='auto')
+            # 500 single keys and 1 range, in one table of runs.
+            assert s._algo is _stree
+        finally:
+            algos.thresholds.clear()
+            algos.thresholds.update(old)
+
+    def test_calibrate(self):
+        old = dict(algos.thresholds)
+        try:
+            thresholds, timings = algos.calibrate(sizes=[10, 1], lookups=10, repeat=1, apply=False)
+            assert algos.thresholds == old
+            assert thresholds['sorted'] == 0
+            assert set(timings) == set(algos.names())
+            assert all(len(t) == 2 for t in timings.values())
+            thresholds, timings = algos.calibrate(sizes=[1], lookups=1, repeat=1)
+            assert algos.thresholds == thresholds
+            # Fake some timings to check how they are interpreted.
+            timings = {'sorted': [1, 1, 1, 1], 'stree': [2, 0, 2, 0], 'cfbs': [0, 0, 0, 0]}
+            assert algos._thresholds_from(timings, [1, 10, 100, 1000]) == {'sorted': 0, 'stree': 1000, 'cfbs': 1}
+        finally:
+            algos.thresholds.clear()
+            algos.thresholds.update(old)
@@ -0,0 +1,215 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import io
+import json
+import numpy as np
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import o11c
+from o11c.containers import algos, raw
+from o11c.containers import cfbs, sorted as sorted_
+
+
+class TestRaw(unittest.TestCase):
+    def test_zero_copy(self):
+        m = cfbs.AutoMap({k: 2 * k for k in range(100)})
+        data = bytearray(raw.dumps(m))
+        n = raw.loads(data)
+        assert type(n) is cfbs.AutoMap and n == m
+        keys = n._low_keys
+        assert isinstance(keys, memoryview)
+        assert np.shares_memory(np.asarray(keys), np.frombuffer(data, dtype=np.uint8))
+
+    def test_share(self):
+        m = cfbs.AutoMap({k: 2 * k for k in range(100)})
+        shm = raw.share(m)
+        try:
+            n = raw.attach(shm.name)
+            assert type(n) is cfbs.AutoMap and n == m
+            keys = n._low_keys
+            assert isinstance(keys, memoryview) and keys.readonly
+            assert np.shares_memory(np.asarray(keys), np.frombuffer(n._shm.buf, dtype=np.uint8))
+            assert n._algo.search(keys, 50) == m._algo.search(m._low_keys, 50)
+            with self.assertRaises(ValueError):
+                raw.attach(shm.name, cls=sorted_.RangeSet)
+            # The arrays keep the block mapped, even without the container.
+            expected = list(m._low_keys)
+            del n
+            assert list(keys) == expected
+            del keys
+        finally:
+            shm.close()
+            shm.unlink()
+        s = sorted_.SortedSet(['a', 'b'])
+        shm = raw.share(s, 'o11c-test-%d' % os.getpid())
+        try:
+            with self.assertRaises(FileExistsError):
+                raw.share(s, shm.name)
+            assert list(sorted_.SortedSet.attach(shm.name)) == ['a', 'b']
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_share_processes(self):
+        # Unrelated processes that attach must not unlink the block when
+        # they exit, so the second one still finds it.
+        m = cfbs.AutoMap({k: 2 * k for k in range(100)})
+        path = [os.path.dirname(os.path.dirname(o11c.__file__)), os.environ.get('PYTHONPATH', '')]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+        shm = raw.share(m)
+        try:
+            code = 'import sys; from o11c.containers import cfbs; print(sum(cfbs.AutoMap.attach(sys.argv[1]).values()))'
+            for _ in range(2):
+                rv = subprocess.run([sys.executable, '-c', code, shm.name], env=env, capture_output=True, text=True, check=True)
+                assert rv.stdout == '%d\n' % sum(m.values()) and rv.stderr == ''
+        finally:
+            shm.close()
+            shm.unlink()
+        # The other way around: this process attaches to a block that
+        # another one shared, and unlinks once we're done with it.
+        code = 'import sys; from o11c.containers import cfbs; shm = cfbs.AutoMap({1: 2}).share(); print(shm.name, flush=True); sys.stdin.readline(); shm.close(); shm.unlink()'
+        with subprocess.Popen([sys.executable, '-c', code], env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
+            n = cfbs.AutoMap.attach(proc.stdout.readline().strip())
+            assert dict(n) == {1: 2}
+            del n
+            out, err = proc.communicate('\n')
+        assert proc.returncode == 0 and out == '' and err == ''
+
+    def test_pickle(self):
+        m = cfbs.AutoMap({k: 2 * k for k in range(100)})
+        buffers = []
+        data = pickle.dumps(m, protocol=5, buffer_callback=buffers.append)
+        buffers = [bytearray(buf) for buf in buffers]
+        assert len(buffers) == 4
+        n = pickle.loads(data, buffers=buffers)
+        assert type(n) is cfbs.AutoMap and n == m
+        assert np.shares_memory(np.asarray(n._low_keys), np.frombuffer(buffers[0], dtype=np.uint8))
+        # A mutable container pickles its base the same way.
+        s = sorted_.MutableSortedSet(range(10), algo='auto')
+        s.add(20)
+        t = pickle.loads(pickle.dumps(s))
+        assert list(t) == list(s) and isinstance(t._base._keys, memoryview)
+        assert t._base_algo is algos.AUTO and 20 in t._pending
+        # Loaded containers are memoryviews, which pickle can't do by itself.
+        u = pickle.loads(pickle.dumps(raw.loads(raw.dumps(m))))
+        assert u == m
+
+    def test_parts_layout(self):
+        # Files from before AutoMap had a single table of runs.
+        class AutoMap(cfbs.AutoMap):
+            def _to_raw(self):
+                return super()._to_raw(parts=True)
+        data = {1: 'x', 2: 'x', 3: 'x', 5: 5, 6: 6, 7: 7, 9: 'y'}
+        meta, buffers = raw.dump_parts(AutoMap(data))
+        assert isinstance(meta['raw'][0], list)
+        meta['class'] = 'AutoMap'
+        m = raw.load_parts(meta, buffers, cls=cfbs.AutoMap)
+        assert type(m) is cfbs.AutoMap and dict(m) == data
+
+    def test_format(self):
+        s = sorted_.SortedSet(['a', 'b'])
+        data = raw.dumps(s)
+        assert data.startswith(raw.MAGIC)
+        meta_size = int.from_bytes(data[8:16], 'little')
+        assert (16 + meta_size) % 8 == 0
+        meta = json.loads(data[16:16 + meta_size].decode('utf-8'))
+        assert meta['module'] == 'o11c.containers.sorted'
+        assert meta['class'] == 'SortedSet'
+        assert meta['algo'] == 'sorted'
+        assert meta['raw'] == [2, {'section': 0}]
+        assert meta['sections'][0]['format'] == 'pickle'
+        t = sorted_.SortedSet._from_raw(3, range(3))
+        assert raw.dump_parts(t)[0]['sections'][0]['format'] == 'pickle'
+        assert raw.loads(raw.dumps(t))._keys == range(3)
+        f = io.BytesIO()
+        raw.dump(s, f)
+        assert f.getvalue() == data
+
+    def test_numpy(self):
+        keys = np.arange(0, 20, 2, dtype=np.int32)
+        s = cfbs.SortedSet._from_raw(len(keys), cfbs._algo.make_order(keys))
+        t = raw.loads(raw.dumps(s))
+        assert isinstance(t._keys, memoryview) and t._keys.format == 'i'
+        assert list(t) == list(range(0, 20, 2))
+        s = cfbs.SortedSet._from_raw(len(keys), cfbs._algo.make_order(keys.astype('>u4' if sys.byteorder == 'little' else '<u4')))
+        t = raw.loads(raw.dumps(s))
+        assert isinstance(t._keys, np.ndarray)
+        assert list(t) == list(range(0, 20, 2))
+
+    def test_byteswap(self):
+        s = sorted_.SortedSet(range(10))
+        meta, buffers = raw.dump_parts(s)
+        other = 'big' if sys.byteorder == 'little' else 'little'
+        swapped = [np.frombuffer(b, dtype=np.int64).byteswap().tobytes() for b in buffers]
+        meta['byteorder'] = other
+        t = raw.load_parts(meta, swapped)
+        assert list(t) == list(range(10))
+
+    def test_empty_auto(self):
+        # Never frozen, so AUTO was never resolved.
+        for cls in [sorted_.SortedSet, sorted_.AutoMap]:
+            c = cls(algo='auto', freeze=False)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'empty.o11c')
+                c.save(path)
+                d = cls.load(path)
+                assert type(d) is cls and not d and d._algo is algos.get('sorted')
+                del d
+            shm = c.share()
+            try:
+                d = cls.attach(shm.name)
+                assert not d
+                del d
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def test_errors(self):
+        s = sorted_.SortedSet(range(10))
+        data = raw.dumps(s)
+        with self.assertRaises(ValueError):
+            raw.loads(data[:10])
+        with self.assertRaises(ValueError):
+            raw.loads(b'x' * len(data))
+        with self.assertRaises(ValueError):
+            raw.loads(data, cls=sorted_.RangeSet)
+        meta, buffers = raw.dump_parts(s)
+        meta['sections'][0]['itemsize'] = 3
+        with self.assertRaises(ValueError):
+            raw.load_parts(meta, buffers)
+        # A truncated section, even under -O.
+        meta, buffers = raw.dump_parts(s)
+        buffers[0] = buffers[0][:-meta['sections'][0]['itemsize']]
+        with self.assertRaises(ValueError):
+            raw.load_parts(meta, buffers)
+        with self.assertRaises(ValueError):
+            raw.loads(data[:-16])
+        bogus = sorted_.SortedSet._from_raw(0, [], algo=object())
+        with self.assertRaises(ValueError):
+            raw.dumps(bogus)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'empty')
+            open(path, 'wb').close()
+            with self.assertRaises(ValueError):
+                raw.load(path)
@@ -16,20 +16,38 @@
 
 
 import abc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
 import importlib
+import itertools
 import numpy as np
+import operator
+import os
+import pickle
+import random
+import tempfile
+import threading
+import tracemalloc
 import unittest
 
 mod = importlib.import_module(__name__.replace('.containers.tests.test_', '.containers.'))
 for name in '''
     SortedSet RangeSet AutoSet
     SortedMap RangeMap DeltaMap DenseMap AutoMap
+    MutableSortedSet MutableSortedMap
+    VersionedSet VersionedMap
 '''.split():
     globals()[name] = getattr(mod, name)
 del name
+import array
+from o11c.containers import algos, raw
 from o11c.enums import ErrorBool
 
 
+def raw_arrays(raw):
+    return [x for x in raw if not isinstance(x, int)]
+
+
 class _TestSetBase(unittest.TestCase, metaclass=abc.ABCMeta):
     cls = None
     need_int_key = False
@@ -59,6 +77,18 @@ class _TestSetBase(unittest.TestCase, metaclass=abc.ABCMeta):
             assert s and len(s) == 2
             assert list(s) == ['bar', 'foo']
 
+    def test_reversed(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append(sorted(str(k) for k in keys))
+        for keys in datasets:
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                assert list(reversed(s)) == keys[::-1]
+                assert list(itertools.islice(reversed(s), 3)) == keys[:-4:-1]
+                assert list(s.iter_runs(reverse=True)) == list(s.iter_runs())[::-1]
+
     def test_lookup(self):
         s = self.cls()
         assert [x for x in s if x in s] == []
@@ -97,6 +127,326 @@ class _TestSetBase(unittest.TestCase, metaclass=abc.ABCMeta):
             u = self.convert_raw('O', *r)
             v = self.cls._from_raw(*u)
 
+    def test_algo(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        expected = [k for k in range(-1, 300) if k in self.cls(keys)]
+        for algo in algos.names() + ['auto']:
+            s = self.cls(keys, algo=algo)
+            assert list(s) == sorted(keys)
+            assert [k for k in range(-1, 300) if k in s] == expected
+            t = self.cls._from_raw(*s._to_raw(), algo=s._algo)
+            assert s._algo is not algos.AUTO
+            assert s == t
+            u = pickle.loads(pickle.dumps(s))
+            assert s == u and s._algo is u._algo
+        assert not any(k in self.cls(algo='auto') for k in range(3))
+        assert pickle.loads(pickle.dumps(self.cls(algo='auto')))._algo is algos.AUTO
+        with self.assertRaises(ValueError):
+            self.cls(algo='nonexistent')
+        with self.assertRaises(ValueError):
+            self.cls._from_raw(*self.cls()._to_raw(), algo='auto')
+
+    def test_compact(self):
+        keys = list(range(0, 100, 3)) + list(range(100, 200))
+        s = self.cls(keys)
+        t = self.cls(keys, compact=False)
+        assert s == t
+        assert [k for k in range(-1, 300) if k in s] == [k for k in range(-1, 300) if k in t] == keys
+        assert all(isinstance(a, array.array) for a in raw_arrays(s._to_raw()))
+        assert all(isinstance(a, list) for a in raw_arrays(t._to_raw()))
+        big = [2**70, 2**70 + 1]
+        s = self.cls(big)
+        assert list(s) == big and all(k in s for k in big)
+        assert all(isinstance(a, list) for a in raw_arrays(s._to_raw()) if len(a))
+        if not self.need_int_key:
+            s = self.cls(['foo', 'bar'])
+            assert all(isinstance(a, list) for a in raw_arrays(s._to_raw()) if len(a))
+
+    def test_save_load(self):
+        keys = list(range(0, 100, 3)) + list(range(100, 200))
+        datasets = [keys]
+        if not self.need_int_key:
+            datasets.append([str(k) for k in keys])
+        with tempfile.TemporaryDirectory() as tmp:
+            for algo in algos.names():
+                for i, keys in enumerate(datasets):
+                    path = os.path.join(tmp, '%s-%d.o11c' % (algo, i))
+                    s = self.cls(keys, algo=algo)
+                    s.save(path)
+                    for mmap in [True, False]:
+                        t = self.cls.load(path, mmap=mmap)
+                        assert type(t) is self.cls
+                        assert t._algo is s._algo
+                        assert list(t) == list(s) == sorted(keys)
+                        assert [k for k in keys if k in t] == keys
+            path = os.path.join(tmp, 'empty.o11c')
+            self.cls().save(path)
+            assert not self.cls.load(path)
+
+    def test_pickle(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append([str(k) for k in keys])
+        for keys in datasets:
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+                    t = pickle.loads(pickle.dumps(s, protocol))
+                    assert type(t) is self.cls and t._algo is s._algo
+                    assert t == s and list(t) == sorted(keys)
+        u = pickle.loads(pickle.dumps(self.cls([1, 2], freeze=False)))
+        assert not u._frozen
+        u._freeze()
+        assert list(u) == [1, 2]
+
+    def test_copy(self):
+        for algo in algos.names():
+            for freeze in [True, False]:
+                s = self.cls([1, 2, 5], algo=algo, freeze=freeze)
+                for t in [copy.copy(s), copy.deepcopy(s)]:
+                    assert type(t) is self.cls and t._algo is s._algo
+                    assert t._frozen == freeze
+                    if not freeze:
+                        t._freeze()
+                    assert list(t) == [1, 2, 5]
+        # Freezing one copy of an unfrozen container leaves the other alone.
+        keys = list(range(100))
+        for algo in algos.names():
+            s = self.cls.from_sorted(keys, algo=algo, freeze=False, compact=False)
+            t = copy.copy(s)
+            s._freeze()
+            t._extend_sorted([200])
+            t._freeze()
+            assert list(s) == keys and list(t) == keys + [200]
+        s = self.cls([1, 2, 5])
+        shm = s.share()
+        try:
+            # Loaded arrays are memoryviews, which deepcopy can't do.
+            for t in [pickle.loads(pickle.dumps(s)), raw.loads(raw.dumps(s)), self.cls.attach(shm.name)]:
+                u = copy.deepcopy(t)
+                assert type(u) is self.cls and u == s and list(u) == [1, 2, 5]
+                assert not hasattr(u, '_shm')
+            del t
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_share(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        for algo in algos.names():
+            s = self.cls(keys, algo=algo)
+            shm = s.share()
+            try:
+                t = self.cls.attach(shm.name)
+                assert type(t) is self.cls and t._algo is s._algo
+                assert t == s and list(t) == keys
+                del t
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def test_from_unsorted(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        shuffled = random.Random(3).sample(keys, len(keys))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append(sorted(str(k) for k in keys))
+        with ThreadPoolExecutor(2) as executor:
+            for keys in datasets:
+                mixed = random.Random(3).sample(keys, len(keys))
+                for algo in algos.names():
+                    for ex in [None, executor]:
+                        for chunk_size in [1, 2, 7, 1000]:
+                            s = self.cls.from_unsorted(keys[::-1], executor=ex, chunk_size=chunk_size, algo=algo)
+                            assert s == self.cls(keys, algo=algo) and list(s) == keys
+                            assert s._algo is algos.get(algo)
+                            # Byte for byte what the serial build gives.
+                            assert raw.dumps(s) == raw.dumps(self.cls(keys, algo=algo))
+                            s = self.cls.from_unsorted(mixed, executor=ex, chunk_size=chunk_size, algo=algo, compact=False)
+                            assert raw.dumps(s) == raw.dumps(self.cls(keys, algo=algo, compact=False))
+            s = self.cls.from_unsorted(shuffled, executor=executor, chunk_size=5, freeze=False)
+            s._freeze()
+            assert list(s) == sorted(shuffled)
+        for freeze in [True, False]:
+            with self.assertRaises(ValueError):
+                self.cls.from_unsorted([3, 1, 3, 2], chunk_size=2, freeze=freeze)
+            with self.assertRaises(ValueError):
+                self.cls.from_unsorted([1, 2, 2, 3], chunk_size=2, freeze=freeze)
+
+    def test_freeze_peak(self):
+        s = self.cls([2, 1])
+        assert s._freeze_peak is None
+        tracemalloc.start()
+        try:
+            s = self.cls(range(1000), compact=False)
+            # A caller measuring its own peak still sees it afterwards.
+            bytearray(1 << 20)
+            outer_peak = tracemalloc.get_traced_memory()[1]
+            t = self.cls(range(1000), compact=False)
+            assert tracemalloc.get_traced_memory()[1] >= outer_peak
+        finally:
+            tracemalloc.stop()
+        # Less than a copy of the list would need.
+        assert 0 <= s._freeze_peak < 8 * 1000
+        assert 0 <= t._freeze_peak < 8 * 1000
+
+    def test_from_sorted(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append(sorted(str(k) for k in keys))
+        for keys in datasets:
+            expected = self.cls(keys)
+            for validate in ['none', 'cheap', 'full']:
+                s = self.cls.from_sorted(iter(keys), validate=validate)
+                assert type(s) is self.cls
+                assert s == expected
+                assert list(s) == keys and len(s) == len(keys)
+                assert all(k in s for k in keys)
+                assert s._to_raw() == expected._to_raw()
+        s = self.cls.from_sorted([1, 2, 4], freeze=False, compact=False)
+        s._freeze()
+        assert list(s) == [1, 2, 4]
+        for bad in [[2, 1], [1, 1]]:
+            for validate in ['cheap', 'full']:
+                with self.assertRaises(ValueError):
+                    self.cls.from_sorted(bad, validate=validate)
+        with self.assertRaises(ValueError):
+            self.cls.from_sorted([], validate='sometimes')
+        with self.assertRaises(ValueError):
+            self.cls.from_sorted([], validate='full', freeze=False)
+
+        class Lossy(self.cls):
+            def __contains__(self, key):
+                return False
+        class Miscounted(self.cls):
+            def __len__(self):
+                return super().__len__() + 1
+        for cls in [Lossy, Miscounted]:
+            cls.from_sorted([1, 2, 4])
+            with self.assertRaises(ValueError):
+                cls.from_sorted([1, 2, 4], validate='full')
+
+    def test_algebra(self):
+        samples = [
+            set(),
+            {5},
+            set(range(0, 20)),
+            set(range(5, 10)) | {12, 14} | set(range(16, 30)),
+            set(range(0, 40, 3)) | set(range(19, 23)),
+            {0, 1, 2, 3, 10, 11, 19, 20, 21, 29},
+        ]
+        others = [SortedSet, RangeSet, AutoSet]
+        for a in samples:
+            s = self.cls(a)
+            for b in samples:
+                for other_cls in others:
+                    t = other_cls(b)
+                    for op in [operator.and_, operator.or_, operator.sub, operator.xor]:
+                        r = op(s, t)
+                        assert type(r) is self.cls and r == self.cls._from_raw(*r._to_raw(), algo=r._algo)
+                        assert list(r) == sorted(op(a, b))
+                        assert [k for k in range(-1, 41) if k in r] == sorted(op(a, b))
+                    assert s.isdisjoint(t) == a.isdisjoint(b)
+                    assert (s <= t) == (a <= b) and (s >= t) == (a >= b)
+                    assert (s < t) == (a < b) and (s == t) == (a == b)
+                # Anything else takes the slow path, but still works.
+                assert set(s & b) == a & b and set(s | b) == a | b
+                assert set(s - b) == a - b and set(s ^ b) == a ^ b
+                assert s.isdisjoint(b) == a.isdisjoint(b)
+                assert (s <= b) == (a <= b) and (s >= b) == (a >= b)
+        if not self.need_int_key:
+            s = self.cls(['bar', 'foo'])
+            t = SortedSet(['baz', 'foo'])
+            assert list(s & t) == ['foo']
+            assert list(s | t) == ['bar', 'baz', 'foo']
+            assert list(s - t) == ['bar']
+            assert list(s ^ t) == ['bar', 'baz']
+            assert not s.isdisjoint(t) and not s <= t
+
+    def test_irange(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append(sorted(str(k) for k in keys))
+        # Run containers round bounds that aren't ints.
+        bounds = [None, -1, 0, 1, 1.5, 2, 4, 4.0, 5, 14, 16.5, 17, 18, 103, 103.0, 104, 197, 198, 300]
+        for keys in datasets:
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                for low in bounds:
+                    for high in bounds:
+                        if isinstance(keys[0] if keys else None, str):
+                            low = None if low is None else str(low)
+                            high = None if high is None else str(high)
+                        for inclusive in [(True, False), (True, True), (False, False), (False, True)]:
+                            expected = [k for k in keys
+                                    if (low is None or (low <= k if inclusive[0] else low < k))
+                                    and (high is None or (k <= high if inclusive[1] else k < high))]
+                            assert list(s.irange(low, high, inclusive=inclusive)) == expected
+                            assert list(s.irange(low, high, inclusive=inclusive, reverse=True)) == expected[::-1]
+                            assert s.count_between(low, high, inclusive=inclusive) == len(expected)
+        assert list(self.cls([1, 2, 3]).irange()) == [1, 2, 3]
+        assert self.cls([1, 2, 3]).count_between() == 3
+        # A search doesn't build (and cache) the whole order.
+        for algo in algos.names():
+            s = self.cls(range(0, 3000, 3), algo=algo)
+            order_cache = algos.get(algo).forward_order
+            if hasattr(order_cache, 'clear'):
+                order_cache.clear()
+            assert list(s.irange(100, 120)) == [102, 105, 108, 111, 114, 117]
+            assert list(s.irange(100, 120, reverse=True)) == [117, 114, 111, 108, 105, 102]
+            if hasattr(order_cache, 'clear'):
+                assert order_cache.nbytes == 0
+            assert s.count_between(100, 120) == 6
+
+    def test_contains_many(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        queries = list(range(-2, 210))
+        datasets = [([], queries), (keys, queries)]
+        if not self.need_int_key:
+            datasets.append(([str(k) for k in keys], [str(k) for k in queries]))
+        for keys, queries in datasets:
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                expected = [q in s for q in queries]
+                for q in [queries, np.array(queries)]:
+                    found = s.contains_many(q)
+                    assert isinstance(found, np.ndarray) and found.dtype == bool
+                    assert found.tolist() == expected
+        s = self.cls([1, 2, 3, 5])
+        assert s.contains_many(np.array([[0, 1], [4, 5]])).tolist() == [[False, True], [False, True]]
+        assert s.contains_many([]).tolist() == []
+        if not self.need_int_key:
+            # Tuple keys must not become another dimension of the array.
+            keys = [(k % 3, k) for k in range(0, 100, 7)] + [(3,)]
+            queries = [(q % 3, q) for q in range(-2, 110)] + [(0,), (3,), (3, 0)]
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                found = s.contains_many(queries)
+                assert found.shape == (len(queries),)
+                assert found.tolist() == [q in s for q in queries]
+
+    def test_to_numpy(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        datasets = [[], keys]
+        if not self.need_int_key:
+            datasets.append(sorted(str(k) for k in keys))
+        for keys in datasets:
+            for algo in algos.names():
+                s = self.cls(keys, algo=algo)
+                runs = list(s.iter_runs())
+                assert [k for low_key, high_key in runs for k in ([low_key] if low_key == high_key else range(low_key, high_key + 1))] == keys
+                arr = s.keys_array()
+                assert isinstance(arr, np.ndarray) and arr.tolist() == keys
+                assert s.to_numpy().tolist() == keys
+                # It's a copy, even of compact arrays.
+                if keys:
+                    arr[0] = arr[-1]
+                assert list(s) == keys
+        assert self.cls([3, 1, 2]).keys_array().dtype == np.int64
+
     def cls_from_pairs(self, pairs):
         rv = self.cls()
         append_range = self.append_range
@@ -199,6 +549,20 @@ class _TestMapBase(unittest.TestCase, metaclass=abc.ABCMeta):
             assert m and len(m) == 3
             assert list(m) == ['bar', 'baz', 'foo']
 
+    def test_reversed(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        datasets = [[], list(zip(keys, values))]
+        if not self.need_int_key:
+            datasets.append(sorted((str(k), v) for k, v in zip(keys, values)))
+        for items in datasets:
+            for algo in algos.names():
+                m = self.cls(items, algo=algo)
+                keys = [k for k, _ in items]
+                assert list(reversed(m)) == keys[::-1]
+                assert list(itertools.islice(reversed(m), 3)) == keys[:-4:-1]
+                assert list(m.iter_runs(reverse=True)) == list(m.iter_runs())[::-1]
+
     def test_lookup(self):
         m = self.cls()
         assert list(m.items()) == []
@@ -251,6 +615,330 @@ class _TestMapBase(unittest.TestCase, metaclass=abc.ABCMeta):
             v = self.cls._from_raw(*u)
             assert m == t == v
 
+    def test_algo(self):
+        pairs = [(1, 1), (2, 2), (3, 3), (5, 4), (8, 4), (13, 5), (14, 7), (15, 8)] + [(k, k * 2) for k in range(100, 200, 3)]
+        expected = [(k, v) for k, v in self.cls(pairs).items()]
+        for algo in algos.names() + ['auto']:
+            m = self.cls(pairs, algo=algo)
+            assert list(m.items()) == expected == sorted(pairs)
+            assert [(k, m[k]) for k in range(-1, 300) if k in m] == expected
+            n = self.cls._from_raw(*m._to_raw(), algo=m._algo)
+            assert m._algo is not algos.AUTO
+            assert m == n
+            o = pickle.loads(pickle.dumps(m))
+            assert m == o and m._algo is o._algo
+        assert not any(k in self.cls(algo='auto') for k in range(3))
+        assert pickle.loads(pickle.dumps(self.cls(algo='auto')))._algo is algos.AUTO
+        with self.assertRaises(ValueError):
+            self.cls(algo='nonexistent')
+        with self.assertRaises(ValueError):
+            self.cls._from_raw(*self.cls()._to_raw(), algo='auto')
+
+    def test_compact(self):
+        pairs = [(k, k // 4) for k in range(0, 100, 3)] + [(k, k) for k in range(100, 200)]
+        m = self.cls(pairs)
+        n = self.cls(pairs, compact=False)
+        assert m == n
+        assert [(k, m[k]) for k in range(-1, 300) if k in m] == [(k, n[k]) for k in range(-1, 300) if k in n] == pairs
+        arrays = list(raw_arrays(m._to_raw()))
+        if self.cls is DenseMap:
+            # Only the indices are compacted, not the values themselves.
+            arrays.pop()
+        assert all(isinstance(a, array.array) for a in arrays)
+        assert all(isinstance(a, list) for a in raw_arrays(n._to_raw()))
+        big = {2**70: 1, 2**70 + 1: 2}
+        m = self.cls(big)
+        assert dict(m.items()) == big
+        if not self.need_int_value:
+            m = self.cls({1: True, 2: False, 4: 'x'})
+            assert [type(v) for v in m.values()] == [bool, bool, str]
+
+    def test_save_load(self):
+        pairs = [(k, k // 4) for k in range(0, 100, 3)] + [(k, k) for k in range(100, 200)]
+        datasets = [pairs]
+        if not self.need_int_value:
+            datasets.append(pairs + [(k, str(k)) for k in range(300, 320)])
+        if not self.need_int_key:
+            datasets.append([('k%d' % k, k) for k in range(10)])
+        with tempfile.TemporaryDirectory() as tmp:
+            for algo in algos.names():
+                for i, pairs in enumerate(datasets):
+                    path = os.path.join(tmp, '%s-%d.o11c' % (algo, i))
+                    m = self.cls(pairs, algo=algo)
+                    m.save(path)
+                    for mmap in [True, False]:
+                        n = self.cls.load(path, mmap=mmap)
+                        assert type(n) is self.cls
+                        assert n._algo is m._algo
+                        assert list(n.items()) == list(m.items()) == sorted(pairs)
+                        assert [(k, n[k]) for k, v in pairs] == pairs
+            path = os.path.join(tmp, 'empty.o11c')
+            self.cls().save(path)
+            assert not self.cls.load(path)
+
+    def test_pickle(self):
+        pairs = [(k, k // 4) for k in range(0, 100, 3)] + [(k, k) for k in range(100, 200)]
+        datasets = [[], pairs]
+        if not self.need_int_value:
+            datasets.append(pairs + [(k, str(k)) for k in range(300, 320)])
+        if not self.need_int_key:
+            datasets.append([('k%d' % k, k) for k in range(10)])
+        for pairs in datasets:
+            for algo in algos.names():
+                m = self.cls(pairs, algo=algo)
+                for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+                    n = pickle.loads(pickle.dumps(m, protocol))
+                    assert type(n) is self.cls and n._algo is m._algo
+                    assert list(n.items()) == list(m.items()) == sorted(pairs)
+        o = pickle.loads(pickle.dumps(self.cls({1: 2}, freeze=False)))
+        assert not o._frozen
+        o._freeze()
+        assert list(o.items()) == [(1, 2)]
+
+    def test_copy(self):
+        for algo in algos.names():
+            for freeze in [True, False]:
+                m = self.cls({1: 2, 2: 3, 5: 4}, algo=algo, freeze=freeze)
+                for n in [copy.copy(m), copy.deepcopy(m)]:
+                    assert type(n) is self.cls and n._algo is m._algo
+                    assert n._frozen == freeze
+                    if not freeze:
+                        n._freeze()
+                    assert list(n.items()) == [(1, 2), (2, 3), (5, 4)]
+        # Freezing one copy of an unfrozen container leaves the other alone.
+        items = [(k, k // 3) for k in range(100)]
+        for algo in algos.names():
+            m = self.cls.from_sorted(items, algo=algo, freeze=False, compact=False)
+            n = copy.copy(m)
+            m._freeze()
+            n._extend_sorted([(200, 1)])
+            n._freeze()
+            assert list(m.items()) == items and list(n.items()) == items + [(200, 1)]
+        m = self.cls({1: 2, 2: 3, 5: 4})
+        shm = m.share()
+        try:
+            # Loaded arrays are memoryviews, which deepcopy can't do.
+            for n in [pickle.loads(pickle.dumps(m)), raw.loads(raw.dumps(m)), self.cls.attach(shm.name)]:
+                o = copy.deepcopy(n)
+                assert type(o) is self.cls and list(o.items()) == [(1, 2), (2, 3), (5, 4)]
+                assert not hasattr(o, '_shm')
+            del n
+        finally:
+            shm.close()
+            shm.unlink()
+        if not self.need_int_value:
+            value = [1]
+            m = self.cls({1: value, 2: value})
+            # Values are shared by a copy, not pickled.
+            assert copy.copy(m)[1] is value
+            n = copy.deepcopy(m)
+            assert n[1] == value and n[1] is not value and n[1] is n[2]
+
+    def test_share(self):
+        pairs = [(k, k // 4) for k in range(0, 100, 3)] + [(k, k) for k in range(100, 200)]
+        for algo in algos.names():
+            m = self.cls(pairs, algo=algo)
+            shm = m.share()
+            try:
+                n = self.cls.attach(shm.name)
+                assert type(n) is self.cls and n._algo is m._algo
+                assert list(n.items()) == pairs and n == m
+                del n
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def test_from_unsorted(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        datasets = [[], list(zip(keys, values))]
+        if not self.need_int_key:
+            datasets.append(sorted((str(k), v) for k, v in zip(keys, values)))
+        if not self.need_int_value:
+            datasets.append([(k, 'x' if k < 50 else 'y') for k in keys])
+        with ThreadPoolExecutor(2) as executor:
+            for items in datasets:
+                shuffled = random.Random(3).sample(items, len(items))
+                for algo in algos.names():
+                    for ex in [None, executor]:
+                        for chunk_size in [1, 2, 7, 1000]:
+                            m = self.cls.from_unsorted(items[::-1], executor=ex, chunk_size=chunk_size, algo=algo)
+                            assert m == self.cls(items, algo=algo) and list(m.items()) == items
+                            # Byte for byte what the serial build gives.
+                            assert raw.dumps(m) == raw.dumps(self.cls(items, algo=algo))
+                            m = self.cls.from_unsorted(shuffled, executor=ex, chunk_size=chunk_size, algo=algo, compact=False)
+                            assert raw.dumps(m) == raw.dumps(self.cls(items, algo=algo, compact=False))
+            m = self.cls.from_unsorted(dict(items), executor=executor, chunk_size=3)
+            assert list(m.items()) == items
+        for freeze in [True, False]:
+            with self.assertRaises(ValueError):
+                self.cls.from_unsorted([(3, 1), (1, 1), (3, 2), (2, 1)], chunk_size=2, freeze=freeze)
+            with self.assertRaises(ValueError):
+                self.cls.from_unsorted([(1, 1), (2, 1), (2, 2), (3, 1)], chunk_size=2, freeze=freeze)
+
+    def test_freeze_peak(self):
+        m = self.cls({2: 1, 1: 2})
+        assert m._freeze_peak is None
+        tracemalloc.start()
+        try:
+            m = self.cls({k: 2*k for k in range(1000)}, compact=False)
+            # A caller measuring its own peak still sees it afterwards.
+            bytearray(1 << 20)
+            outer_peak = tracemalloc.get_traced_memory()[1]
+            n = self.cls({k: 2*k for k in range(1000)}, compact=False)
+            assert tracemalloc.get_traced_memory()[1] >= outer_peak
+        finally:
+            tracemalloc.stop()
+        # Less than a copy of the list would need.
+        assert 0 <= m._freeze_peak < 8 * 1000
+        assert 0 <= n._freeze_peak < 8 * 1000
+
+    def test_from_sorted(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        datasets = [[], list(zip(keys, values))]
+        if not self.need_int_key:
+            datasets.append(sorted((str(k), v) for k, v in zip(keys, values)))
+        if not self.need_int_value:
+            datasets.append([(k, 'x' if k < 50 else 'y') for k in keys])
+        for items in datasets:
+            expected = self.cls(items)
+            for validate in ['none', 'cheap', 'full']:
+                m = self.cls.from_sorted(iter(items), validate=validate)
+                assert type(m) is self.cls
+                assert m == expected
+                assert list(m.items()) == items and len(m) == len(items)
+                assert m._to_raw() == expected._to_raw()
+            assert self.cls.from_sorted(dict(items)) == expected
+        m = self.cls.from_sorted([(1, 2), (2, 3), (4, 5)], freeze=False, compact=False)
+        m._freeze()
+        assert list(m.items()) == [(1, 2), (2, 3), (4, 5)]
+        for bad in [[(2, 1), (1, 1)], [(1, 1), (1, 2)]]:
+            for validate in ['cheap', 'full']:
+                with self.assertRaises(ValueError):
+                    self.cls.from_sorted(bad, validate=validate)
+        with self.assertRaises(ValueError):
+            self.cls.from_sorted([], validate='sometimes')
+        with self.assertRaises(ValueError):
+            self.cls.from_sorted([], validate='full', freeze=False)
+
+        class Lossy(self.cls):
+            def __contains__(self, key):
+                return False
+        class Miscounted(self.cls):
+            def __len__(self):
+                return super().__len__() + 1
+        for cls in [Lossy, Miscounted]:
+            cls.from_sorted([(1, 2), (2, 3), (4, 5)])
+            with self.assertRaises(ValueError):
+                cls.from_sorted([(1, 2), (2, 3), (4, 5)], validate='full')
+
+    def test_irange(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        datasets = [[], list(zip(keys, values))]
+        if not self.need_int_key:
+            datasets.append(sorted((str(k), v) for k, v in zip(keys, values)))
+        # Run containers round bounds that aren't ints.
+        bounds = [None, -1, 0, 1, 1.5, 2, 4, 4.0, 5, 14, 16.5, 17, 18, 103, 103.0, 104, 197, 198, 300]
+        for items in datasets:
+            for algo in algos.names():
+                m = self.cls(items, algo=algo)
+                for low in bounds:
+                    for high in bounds:
+                        if isinstance(items[0][0] if items else None, str):
+                            low = None if low is None else str(low)
+                            high = None if high is None else str(high)
+                        for inclusive in [(True, False), (True, True), (False, False), (False, True)]:
+                            expected = [(k, v) for k, v in items
+                                    if (low is None or (low <= k if inclusive[0] else low < k))
+                                    and (high is None or (k <= high if inclusive[1] else k < high))]
+                            assert list(m.items_between(low, high, inclusive=inclusive)) == expected
+                            assert list(m.items_between(low, high, inclusive=inclusive, reverse=True)) == expected[::-1]
+                            assert list(m.irange(low, high, inclusive=inclusive)) == [k for k, v in expected]
+                            assert list(m.irange(low, high, inclusive=inclusive, reverse=True)) == [k for k, v in expected[::-1]]
+                            assert m.count_between(low, high, inclusive=inclusive) == len(expected)
+        m = self.cls({1: 2, 2: 3, 3: 4})
+        assert list(m.irange()) == [1, 2, 3] and m.count_between() == 3
+        # A search doesn't build (and cache) the whole order.
+        for algo in algos.names():
+            m = self.cls({k: k // 2 for k in range(0, 3000, 3)}, algo=algo)
+            order_cache = algos.get(algo).forward_order
+            if hasattr(order_cache, 'clear'):
+                order_cache.clear()
+            assert list(m.items_between(100, 110)) == [(102, 51), (105, 52), (108, 54)]
+            assert list(m.items_between(100, 110, reverse=True)) == [(108, 54), (105, 52), (102, 51)]
+            if hasattr(order_cache, 'clear'):
+                assert order_cache.nbytes == 0
+            assert m.count_between(100, 110) == 3
+
+    def test_get_many(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        queries = list(range(-2, 210))
+        datasets = [([], queries), (list(zip(keys, values)), queries)]
+        if not self.need_int_key:
+            datasets.append(([(str(k), v) for k, v in zip(keys, values)], [str(k) for k in queries]))
+        if not self.need_int_value:
+            datasets.append(([(k, 'x' if k < 50 else 'y') for k in keys], queries))
+        for items, queries in datasets:
+            for algo in algos.names():
+                m = self.cls(items, algo=algo)
+                for q in [queries, np.array(queries)]:
+                    assert m.get_many(q).tolist() == [m.get(k) for k in queries]
+                    assert m.get_many(q, -1).tolist() == [m.get(k, -1) for k in queries]
+                    values, found = m.get_many(q, 0, mask=True)
+                    assert found.dtype == bool and found.tolist() == [k in m for k in queries]
+                    assert m.contains_many(q).tolist() == found.tolist()
+                    assert values.tolist() == [m.get(k, 0) for k in queries]
+        m = self.cls({1: 2, 2: 3, 3: 4})
+        # DenseMap keeps its values in a plain list.
+        int_dtype = object if self.cls is DenseMap else np.int64
+        values = m.get_many([1, 2, 3])
+        assert values.dtype == int_dtype and values.tolist() == [2, 3, 4]
+        values = m.get_many([0, 1], -1)
+        assert values.dtype == int_dtype and values.tolist() == [-1, 2]
+        values = m.get_many([0, 1], 'missing')
+        assert values.dtype == object and values.tolist() == ['missing', 2]
+        assert m.get_many(np.array([[0, 1], [2, 3]])).tolist() == [[None, 2], [3, 4]]
+        if not self.need_int_key:
+            # Tuple keys must not become another dimension of the array.
+            items = [((k % 3, k), k * 2) for k in range(0, 100, 7)] + [((3,), 0)]
+            queries = [(q % 3, q) for q in range(-2, 110)] + [(0,), (3,), (3, 0)]
+            for algo in algos.names():
+                m = self.cls(items, algo=algo)
+                values, found = m.get_many(queries, -1, mask=True)
+                assert found.shape == (len(queries),)
+                assert found.tolist() == [k in m for k in queries]
+                assert values.tolist() == [m.get(k, -1) for k in queries]
+
+    def test_to_numpy(self):
+        keys = [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3))
+        values = [2 * k if k < 10 else k + 1 if k < 50 else 7 for k in keys]
+        datasets = [[], list(zip(keys, values))]
+        if not self.need_int_key:
+            datasets.append(sorted((str(k), v) for k, v in zip(keys, values)))
+        if not self.need_int_value:
+            datasets.append([(k, 'x' if k < 50 else 'y') for k in keys])
+        for items in datasets:
+            for algo in algos.names():
+                m = self.cls(items, algo=algo)
+                expanded = []
+                for run in m.iter_runs():
+                    if self.cls is DenseMap:
+                        low_key, high_key, run_values = run
+                        assert len(run_values) == high_key - low_key + 1
+                        expanded.extend(zip(range(low_key, high_key + 1), run_values))
+                    else:
+                        low_key, high_key, value, is_delta = run
+                        for i, k in enumerate([low_key] if low_key == high_key else range(low_key, high_key + 1)):
+                            expanded.append((k, value + i if is_delta else value))
+                assert expanded == items
+                k, v = m.to_numpy()
+                assert isinstance(k, np.ndarray) and isinstance(v, np.ndarray)
+                assert k.tolist() == m.keys_array().tolist() == [k for k, _ in items]
+                assert v.tolist() == m.values_array().tolist() == [v for _, v in items]
+
     def cls_from_quads(self, quads):
         rv = self.cls()
         append_quad = self.append_quad
@@ -648,18 +1336,52 @@ class TestRangeSet(_TestSetBase):
 
     append_range = staticmethod(cls._append_range)
 
+    def test_from_ranges(self):
+        s = RangeSet.from_ranges([(10, 12), (0, 3), (3, 5), (2, 3), (11, 11), (20, 10**9)])
+        assert list(s._iter_tuples()) == [(0, 5), (10, 12), (20, 10**9)]
+        assert len(s) == 6 + 3 + (10**9 - 19)
+        assert [k for k in range(-1, 30) if k in s] == list(range(0, 6)) + list(range(10, 13)) + list(range(20, 30))
+        assert 10**9 in s and 10**9 + 1 not in s
+        assert not RangeSet.from_ranges([])
+        s = RangeSet.from_ranges([(1, 2)], freeze=False, compact=False)
+        s._freeze()
+        assert list(s) == [1, 2]
+        with self.assertRaises(ValueError):
+            RangeSet.from_ranges([(0, 3), (2, 1)])
+
+    def test_algebra_runs(self):
+        big = RangeSet.from_ranges([(0, 10**9)])
+        holes = RangeSet.from_ranges([(10, 20), (10**8, 10**9 - 1)])
+        assert list((big - holes)._iter_runs()) == [(0, 9), (21, 10**8 - 1), (10**9, 10**9)]
+        assert list((big ^ holes)._iter_runs()) == [(0, 9), (21, 10**8 - 1), (10**9, 10**9)]
+        assert list((big & holes)._iter_runs()) == [(10, 20), (10**8, 10**9 - 1)]
+        assert list((holes | AutoSet([9, 21, 22, 30]))._iter_runs()) == [(9, 22), (30, 30), (10**8, 10**9 - 1)]
+        assert holes <= big and not big <= holes and big > holes
+
 
 class TestAutoSet(_TestSetBase):
     cls = AutoSet
 
     @staticmethod
-    def convert_raw(key_dtype, simple_raw, compressed_raw):
-        simple_raw = TestSortedSet.convert_raw(key_dtype, *simple_raw)
-        compressed_raw = TestRangeSet.convert_raw(key_dtype, *compressed_raw)
-        return simple_raw, compressed_raw
+    def convert_raw(key_dtype, len, low_keys, high_keys):
+        return TestRangeSet.convert_raw(key_dtype, len, low_keys, high_keys)
 
     append_range = staticmethod(cls._append_range)
 
+    def test_parts_raw(self):
+        datasets = [[], [1, 2, 3, 5, 8, 13, 14, 15, 16, 17] + list(range(100, 200, 3)), ['bar', 'foo']]
+        for keys in datasets:
+            for algo in algos.names():
+                s = AutoSet(keys, algo=algo)
+                simple_raw, compressed_raw = s._to_raw(parts=True)
+                simple = SortedSet._from_raw(*simple_raw, algo=algo)
+                compressed = RangeSet._from_raw(*compressed_raw, algo=algo)
+                assert list(simple) == [k for k in keys if k in s and (not isinstance(k, int) or not (k - 1 in s or k + 1 in s))]
+                assert not (simple & compressed) and list(simple | compressed) == keys
+                t = AutoSet._from_raw(simple_raw, compressed_raw, algo=algo)
+                assert s == t and t._algo is s._algo
+                assert t._to_raw() == s._to_raw()
+
 
 class TestSortedMap(_TestMapBase):
     cls = SortedMap
@@ -701,6 +1423,19 @@ class TestRangeMap(_TestMapBase):
         for i, key in enumerate(range(low_key, high_key + 1)):
             self._append_range(key, key, value + i)
 
+    def test_from_ranges(self):
+        m = RangeMap.from_ranges([(10, 12, 'x'), (0, 3, 'y'), (3, 5, 'y'), (2, 3, 'y'), (6, 6, 'z'), (11, 11, 'x'), (20, 10**9, 'x')])
+        assert list(m._iter_tuples()) == [(0, 5, 'y'), (6, 6, 'z'), (10, 12, 'x'), (20, 10**9, 'x')]
+        assert len(m) == 7 + 3 + (10**9 - 19)
+        assert m[3] == 'y' and m[6] == 'z' and m[10**9] == 'x' and 10**9 + 1 not in m
+        m = RangeMap.from_ranges([(1, 2, 0), (3, 4, 0)], freeze=False)
+        m._freeze()
+        assert dict(m) == {1: 0, 2: 0, 3: 0, 4: 0}
+        with self.assertRaises(ValueError):
+            RangeMap.from_ranges([(0, 3, 'x'), (2, 1, 'x')])
+        with self.assertRaises(ValueError):
+            RangeMap.from_ranges([(0, 3, 'x'), (2, 5, 'y')])
+
 
 class TestDeltaMap(_TestMapBase):
     cls = DeltaMap
@@ -723,6 +1458,19 @@ class TestDeltaMap(_TestMapBase):
         for key in range(low_key, high_key + 1):
             self._append_range(key, key, value)
 
+    def test_from_ranges(self):
+        m = DeltaMap.from_ranges([(10, 12, 0), (0, 3, 100), (4, 5, 104), (2, 3, 102), (6, 6, 0), (11, 11, 1), (20, 10**9, 3)])
+        assert list(m._iter_tuples()) == [(0, 5, 100), (6, 6, 0), (10, 12, 0), (20, 10**9, 3)]
+        assert len(m) == 7 + 3 + (10**9 - 19)
+        assert m[3] == 103 and m[6] == 0 and m[12] == 2 and m[10**9] == 10**9 - 17
+        m = DeltaMap.from_ranges([(0, 5, 0), (3, 8, 3)], freeze=False)
+        m._freeze()
+        assert dict(m) == {k: k for k in range(9)}
+        with self.assertRaises(ValueError):
+            DeltaMap.from_ranges([(0, 3, 0), (2, 1, 2)])
+        with self.assertRaises(ValueError):
+            DeltaMap.from_ranges([(0, 3, 0), (2, 5, 0)])
+
 
 class TestDenseMap(_TestMapBase):
     cls = DenseMap
@@ -744,19 +1492,276 @@ class TestDenseMap(_TestMapBase):
         else:
             self._append_range(low_key, [value + i for i in range(nkeys)])
 
+    def test_from_blocks(self):
+        m = DenseMap.from_blocks([(10, 'abc'), (0, 'wxyz'), (4, ['u']), (2, 'y'), (7, []), (11, 'bcd'), (20, range(5))])
+        assert [(k, list(v)) for k, v in m._iter_tuples()] == [(0, list('wxyzu')), (10, list('abcd')), (20, list(range(5)))]
+        assert list(m.items()) == list(zip(range(5), 'wxyzu')) + list(zip(range(10, 14), 'abcd')) + list(zip(range(20, 25), range(5)))
+        assert not DenseMap.from_blocks([(1, [])])
+        m = DenseMap.from_blocks([(1, [5, 6])], freeze=False)
+        m._freeze()
+        assert dict(m) == {1: 5, 2: 6}
+        with self.assertRaises(ValueError):
+            DenseMap.from_blocks([(0, 'abc'), (2, 'x')])
+        # Blocks may be numpy arrays, which have no truth value.
+        for typecode in [None, 'q']:
+            m = DenseMap.from_blocks([(0, np.arange(3)), (5, np.array([], dtype=int)), (2, np.array([2, 9]))], typecode=typecode)
+            assert list(m.items()) == [(0, 0), (1, 1), (2, 2), (3, 9)]
+            assert all(type(v) is int for v in m.values())
+
+    def test_typed(self):
+        pairs = [(k, k / 2) for k in range(10)] + [(k, -1.0) for k in range(20, 25)]
+        for algo in algos.names():
+            for compact in [True, False]:
+                m = DenseMap(pairs, algo=algo, typecode='d', compact=compact)
+                assert list(m.items()) == pairs
+                assert m._value_data.typecode == 'd'
+                data = np.asarray(m._value_data)
+                for low_key, values in m._iter_tuples():
+                    assert isinstance(values, memoryview) and np.shares_memory(np.asarray(values), data)
+                assert [list(v) for k, v in m._iter_tuples()] == [[k / 2 for k in range(10)], [-1.0] * 5]
+                values = m.get_many([0, 3, 21])
+                assert values.dtype == np.float64 and values.tolist() == [0.0, 1.5, -1.0]
+                assert m.values_array().dtype == np.float64
+        m = DenseMap.from_blocks([(1, [1, 2]), (5, [3])], typecode='i')
+        assert list(m.items()) == [(1, 1), (2, 2), (5, 3)]
+        n = DenseMap.from_sorted(m.items(), typecode='i')
+        assert n == m and n._value_data == m._value_data
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'typed.o11c')
+            m.save(path)
+            n = DenseMap.load(path)
+            assert isinstance(n._value_data, memoryview) and n._value_data.format == 'i'
+            assert n == m and [list(v) for k, v in n._iter_tuples()] == [[1, 2], [3]]
+        with self.assertRaises(TypeError):
+            DenseMap({1: 'x'}, typecode='q')
+
 
 class TestAutoMap(_TestMapBase):
     cls = AutoMap
 
     @staticmethod
-    def convert_raw(key_dtype, value_dtype, simple_raw, compressed_raw, sequential_raw):
-        simple_raw = TestSortedMap.convert_raw(key_dtype, value_dtype, *simple_raw)
-        compressed_raw = TestRangeMap.convert_raw(key_dtype, value_dtype, *compressed_raw)
-        sequential_raw = TestDeltaMap.convert_raw(key_dtype, value_dtype, *sequential_raw)
-        return simple_raw, compressed_raw, sequential_raw
+    def convert_raw(key_dtype, value_dtype, len, low_keys, high_keys, tags, values):
+        low_keys = np.array(low_keys, dtype=key_dtype)
+        high_keys = np.array(high_keys, dtype=key_dtype)
+        tags = np.array(tags, dtype='u1')
+        values = np.array(values, dtype=value_dtype)
+        return len, low_keys, high_keys, tags, values
 
     append_quad = staticmethod(cls._append_range)
 
+    def test_from_unsorted_processes(self):
+        items = [(k, k // 3 if k % 5 else k) for k in range(2000)]
+        shuffled = random.Random(4).sample(items, len(items))
+        with ProcessPoolExecutor(2) as executor:
+            m = AutoMap.from_unsorted(shuffled, executor=executor, chunk_size=300, algo='stree')
+        assert m == AutoMap(items) and list(m.items()) == items
+        assert raw.dumps(m) == raw.dumps(AutoMap(items, algo='stree'))
+
+    def test_from_unsorted_split(self):
+        # Stitching the parts' runs would give (0, 1) CONSTANT, (2, 3) DELTA,
+        # but adding the keys one by one splits the runs elsewhere.
+        items = [(0, 1), (1, 1), (2, 2), (3, 3)]
+        m = AutoMap.from_unsorted(items, chunk_size=2)
+        assert list(m.iter_runs()) == [(0, 0, 1, False), (1, 3, 1, True)]
+        m = AutoMap.from_unsorted(items, chunk_size=2, freeze=False)
+        m._freeze()
+        assert list(m.iter_runs()) == [(0, 0, 1, False), (1, 3, 1, True)]
+
+    def test_parts_raw(self):
+        pairs = [(1, 'x'), (2, 'x'), (3, 'x'), (5, 5), (6, 6), (7, 7), (9, 'y'), (11, 'z')]
+        datasets = [[], pairs, [('bar', 1), ('foo', 2)]]
+        for items in datasets:
+            for algo in algos.names():
+                m = AutoMap(items, algo=algo)
+                simple_raw, compressed_raw, sequential_raw = m._to_raw(parts=True)
+                simple = SortedMap._from_raw(*simple_raw, algo=algo)
+                compressed = RangeMap._from_raw(*compressed_raw, algo=algo)
+                sequential = DeltaMap._from_raw(*sequential_raw, algo=algo)
+                if items is pairs:
+                    assert list(simple.items()) == [(9, 'y'), (11, 'z')]
+                    assert list(compressed.items()) == [(1, 'x'), (2, 'x'), (3, 'x')]
+                    assert list(sequential.items()) == [(5, 5), (6, 6), (7, 7)]
+                n = AutoMap._from_raw(simple_raw, compressed_raw, sequential_raw, algo=algo)
+                assert m == n and n._algo is m._algo
+                assert list(n.items()) == items
+                assert n._to_raw() == m._to_raw()
+
+
+class TestMutableSortedSet(unittest.TestCase):
+    def test_random(self):
+        rng = random.Random(1)
+        for algo in algos.names() + ['auto']:
+            for max_pending in [None, 0, 1, 7]:
+                s = MutableSortedSet(range(0, 100, 2), algo=algo, max_pending=max_pending)
+                expected = set(range(0, 100, 2))
+                for i in range(500):
+                    key = rng.randrange(120)
+                    if rng.random() < 0.5:
+                        s.add(key)
+                        expected.add(key)
+                    else:
+                        s.discard(key)
+                        expected.discard(key)
+                    assert len(s) == len(expected)
+                    assert (key in s) == (key in expected)
+                    if i % 50 == 0:
+                        assert list(s) == sorted(expected)
+                        assert list(reversed(s)) == sorted(expected, reverse=True)
+                assert list(s) == sorted(expected)
+                queries = list(range(-1, 125))
+                assert s.contains_many(queries).tolist() == [k in expected for k in queries]
+                s.add(-5)
+                expected.add(-5)
+                assert s.keys_array().tolist() == sorted(expected) and not s._pending
+                s.compact()
+                assert not s._pending and list(s) == sorted(expected)
+                assert s._base._algo is not algos.AUTO
+
+    def test_basic(self):
+        s = MutableSortedSet()
+        assert not s and list(s) == []
+        s.add('foo')
+        s.add('bar')
+        s.add('foo')
+        assert list(s) == ['bar', 'foo'] and len(s) == 2
+        s.remove('foo')
+        with self.assertRaises(KeyError):
+            s.remove('foo')
+        assert 'foo' not in s and 'bar' in s
+        t = s | {'baz', 'bar'}
+        assert type(t) is MutableSortedSet and list(t) == ['bar', 'baz']
+        assert list(t.iter_runs()) == [('bar', 'bar'), ('baz', 'baz')]
+        assert list(t.iter_runs(reverse=True)) == [('baz', 'baz'), ('bar', 'bar')]
+        assert t.to_numpy().tolist() == ['bar', 'baz']
+        repr(s)
+        u = pickle.loads(pickle.dumps(s))
+        assert list(u) == ['bar'] and u._pending == s._pending and u._base_algo is s._base_algo
+        s.compact()
+        assert list(s) == ['bar'] and not s._pending
+        s.compact()
+        assert list(s) == ['bar']
+
+    def test_compaction(self):
+        s = MutableSortedSet(range(1000))
+        for k in range(2000, 2000 + s._pending_limit()):
+            s.add(k)
+        assert len(s._pending) == s._pending_limit()
+        s.add(-1)
+        assert not s._pending and len(s._base) == len(s) == 1000 + 256 + 1
+
+
+class TestMutableSortedMap(unittest.TestCase):
+    def test_random(self):
+        rng = random.Random(2)
+        for algo in algos.names() + ['auto']:
+            for max_pending in [None, 0, 1, 7]:
+                m = MutableSortedMap({k: -k for k in range(0, 100, 2)}, algo=algo, max_pending=max_pending)
+                expected = {k: -k for k in range(0, 100, 2)}
+                for i in range(500):
+                    key = rng.randrange(120)
+                    if rng.random() < 0.5:
+                        m[key] = i
+                        expected[key] = i
+                    elif key in expected:
+                        del m[key]
+                        del expected[key]
+                    else:
+                        with self.assertRaises(KeyError):
+                            del m[key]
+                    assert len(m) == len(expected)
+                    assert m.get(key) == expected.get(key)
+                    if i % 50 == 0:
+                        assert list(m.items()) == sorted(expected.items())
+                        assert list(reversed(m)) == sorted(expected, reverse=True)
+                        assert list(m._iter_items(reverse=True)) == sorted(expected.items(), reverse=True)
+                assert list(m.items()) == sorted(expected.items())
+                queries = list(range(-1, 125))
+                assert m.get_many(queries).tolist() == [expected.get(k) for k in queries]
+                assert m.contains_many(queries).tolist() == [k in expected for k in queries]
+                m[-5] = 5
+                expected[-5] = 5
+                assert m.values_array().tolist() == [v for k, v in sorted(expected.items())]
+                m.compact()
+                assert not m._pending and list(m.items()) == sorted(expected.items())
+
+    def test_basic(self):
+        m = MutableSortedMap([('w', 'a'), ('w', 'b')])
+        assert dict(m) == {'w': 'b'}
+        m['x'] = 1
+        del m['w']
+        with self.assertRaises(KeyError):
+            m['w']
+        with self.assertRaises(KeyError):
+            del m['w']
+        assert list(m.items()) == [('x', 1)] and 'x' in m and 'w' not in m
+        repr(m)
+        n = pickle.loads(pickle.dumps(m))
+        assert list(n.items()) == [('x', 1)] and n._pending == m._pending and n._base_algo is m._base_algo
+        assert list(m.iter_runs()) == [('x', 'x', 1, False)]
+        assert [a.tolist() for a in m.to_numpy()] == [['x'], [1]]
+        assert m.get_many(['w', 'x', 'y'], 0).tolist() == [0, 1, 0]
+        m.compact()
+        assert m['x'] == 1 and not m._pending
+        assert m.get_many(['w', 'x'], mask=True)[1].tolist() == [False, True]
+
+
+class TestVersioned(unittest.TestCase):
+    def test_set(self):
+        v = VersionedSet()
+        assert v.version == 0 and len(v) == 0 and list(v) == []
+        snap = v.snapshot()
+        assert v.publish(AutoSet([1, 2, 3])) == 1
+        assert 2 in v and list(v) == [1, 2, 3] and len(v) == 3
+        assert list(reversed(v)) == [3, 2, 1]
+        assert list(snap) == [] and v.live_versions() == [0, 1]
+        assert not v.synchronize(timeout=0)
+        del snap
+        assert v.live_versions() == [1] and v.synchronize(timeout=0)
+        assert v.publish(v.snapshot()) == 2
+        # The same container again retires its old number.
+        assert v.live_versions() == [2] and v.synchronize(timeout=0)
+        snap = v.snapshot()
+        assert v.publish(AutoSet([4])) == 3 and v.publish(snap) == 4
+        assert v.live_versions() == [4] and v.synchronize(timeout=0)
+        del snap
+        repr(v)
+        with self.assertRaises(ValueError):
+            v.publish(AutoSet([1], freeze=False))
+        with self.assertRaises(ValueError):
+            v.publish({1, 2})
+        assert v.version == 4
+
+    def test_map(self):
+        v = VersionedMap(RangeMap({1: 'a', 2: 'a'}))
+        assert v[1] == 'a' and v.get(3) is None and v.get(3, 'z') == 'z'
+        with self.assertRaises(KeyError):
+            v[3]
+        v.publish(SortedMap({3: 'c'}))
+        assert list(v.keys()) == [3] and list(v.values()) == ['c'] and list(v.items()) == [(3, 'c')]
+        assert 3 in v and 1 not in v
+        assert VersionedMap().snapshot() == {}
+
+    def test_readers(self):
+        v = VersionedMap(SortedMap({'k': 0}))
+        have_snapshot = threading.Event()
+        done = threading.Event()
+        seen = []
+        def reader():
+            snap = v.snapshot()
+            have_snapshot.set()
+            done.wait()
+            seen.append(snap['k'])
+        thread = threading.Thread(target=reader)
+        thread.start()
+        have_snapshot.wait()
+        v.publish(SortedMap({'k': 1}))
+        assert v['k'] == 1 and v.live_versions() == [0, 1]
+        assert not v.synchronize(timeout=0.01)
+        done.set()
+        assert v.synchronize()
+        thread.join()
+        assert seen == [0] and v.live_versions() == [1]
+
 
 del _TestSetBase
 del _TestMapBase
@@ -15,30 +15,190 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import array
+import functools
+import heapq
+import itertools
+import operator
+
+
 class MinIter:
-    def __init__(self, *iterables):
-        self._iterators = []
-        self._values = []
-        for iterable in iterables:
+    ''' Merge several sorted iterables into one sorted iterator.
+
+        Equal values come out in the order of the iterables they came
+        from, like `heapq.merge`.
+
+        Up to 3 iterables are merged by direct comparison, which is what
+        the set operations need; more use a heap, so each value costs
+        O(log k) rather than O(k).
+
+        As for `sorted`, values are compared by `key(value)` if given,
+        and `reverse=True` merges iterables that are sorted descending.
+
+        With `dedup=True`, each run of equal values (or keys) is
+        collapsed into one value: the first, or `combine(a, b)` folded
+        over the run, if given.
+    '''
+    def __init__(self, *iterables, key=None, reverse=False, dedup=False, combine=None):
+        if combine is not None and not dedup:
+            raise ValueError('combine requires dedup')
+        decorated = key is not None or reverse
+        if decorated:
+            if reverse:
+                sort_key = _Reversed if key is None else lambda v: _Reversed(key(v))
+            else:
+                sort_key = key
+            iterables = [_decorate(iterable, sort_key, order) for order, iterable in enumerate(iterables)]
+        heads = []
+        for order, iterable in enumerate(iterables):
             iterator = iter(iterable)
-            try:
-                value = next(iterator)
-            except StopIteration:
-                continue
-            self._iterators.append(iterator)
-            self._values.append(value)
+            for value in iterator:
+                heads.append([value, order, iterator])
+                break
+        if len(heads) <= 3:
+            merged = _merge_few(heads)
+        else:
+            merged = _merge_heap(heads)
+        if decorated:
+            merged = map(operator.itemgetter(2), merged)
+        if dedup:
+            merged = _dedup(merged, key, combine)
+        self._merged = merged
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if not self._values:
-            raise StopIteration
-        idx = min(range(len(self._values)), key=lambda i: self._values[i])
-        rv = self._values[idx]
+        return next(self._merged)
+
+    def next_chunk(self, n, typecode=None):
+        ''' Return a list of the next `n` values, fewer only at the end.
+
+            With a `typecode`, return an `array.array` instead.
+        '''
+        chunk = itertools.islice(self._merged, n)
+        if typecode is None:
+            return list(chunk)
+        return array.array(typecode, chunk)
+
+    def iter_chunks(self, n, typecode=None):
+        ''' Yield `next_chunk(n, typecode)` until the values run out.
+        '''
+        while True:
+            chunk = self.next_chunk(n, typecode)
+            if not chunk:
+                return
+            yield chunk
+
+
+class _Reversed:
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def _decorate(iterable, sort_key, order):
+    # `order` differs between iterables, so values are never compared.
+    for value in iterable:
+        yield (sort_key(value), order, value)
+
+
+def _dedup(merged, key, combine):
+    for _, group in itertools.groupby(merged, key):
+        if combine is None:
+            yield next(group)
+        else:
+            yield functools.reduce(combine, group)
+
+
+_EMPTY = object()
+
+
+def _merge_few(heads):
+    if len(heads) == 3:
+        yield from _merge3(*heads)
+    elif len(heads) == 2:
+        yield from _merge2(*heads)
+    elif heads:
+        value, _, iterator = heads[0]
+        yield value
+        yield from iterator
+
+
+def _merge2(a_head, b_head):
+    a, _, a_iter = a_head
+    b, _, b_iter = b_head
+    while True:
+        # Ties go to `a`, which came first.
+        if b < a:
+            yield b
+            b = next(b_iter, _EMPTY)
+            if b is _EMPTY:
+                yield a
+                yield from a_iter
+                return
+        else:
+            yield a
+            a = next(a_iter, _EMPTY)
+            if a is _EMPTY:
+                yield b
+                yield from b_iter
+                return
+
+
+def _merge3(a_head, b_head, c_head):
+    a, _, a_iter = a_head
+    b, _, b_iter = b_head
+    c, _, c_iter = c_head
+    while True:
+        if b < a:
+            if c < b:
+                yield c
+                c = next(c_iter, _EMPTY)
+                if c is _EMPTY:
+                    break
+            else:
+                yield b
+                b = next(b_iter, _EMPTY)
+                if b is _EMPTY:
+                    break
+        elif c < a:
+            yield c
+            c = next(c_iter, _EMPTY)
+            if c is _EMPTY:
+                break
+        else:
+            yield a
+            a = next(a_iter, _EMPTY)
+            if a is _EMPTY:
+                break
+    a_head[0] = a
+    b_head[0] = b
+    c_head[0] = c
+    yield from _merge2(*[h for h in (a_head, b_head, c_head) if h[0] is not _EMPTY])
+
+
+def _merge_heap(heads):
+    # Entries are [value, order, iterator]; `order` is unique, so ties
+    # never compare iterators and stay in the order of the iterables.
+    heapq.heapify(heads)
+    heapreplace = heapq.heapreplace
+    while len(heads) > 3:
         try:
-            self._values[idx] = next(self._iterators[idx])
+            while True:
+                top = heads[0]
+                value, _, iterator = top
+                yield value
+                top[0] = next(iterator)
+                heapreplace(heads, top)
         except StopIteration:
-            del self._iterators[idx]
-            del self._values[idx]
-        return rv
+            heapq.heappop(heads)
+    heads.sort(key=operator.itemgetter(1))
+    yield from _merge_few(heads)
@@ -0,0 +1,81 @@
+#   python-o11c - generic utilities library
+#   Copyright © 2018  Ben Longbons
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import contextlib
+import io
+import json
+import random
+import unittest
+
+from o11c import benchmark
+from o11c.containers.sorted import DeltaMap, RangeSet
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_keys(self):
+        rng = random.Random(0)
+        for dist in benchmark.DISTRIBUTIONS:
+            keys = benchmark.int_keys(100, dist, rng)
+            assert len(keys) == 100
+            assert keys == sorted(set(keys))
+            misses = benchmark.miss_keys(keys, 50, rng)
+            assert len(misses) == 50 and not set(misses) & set(keys)
+            assert min(misses) >= keys[0] - 1 and max(misses) <= keys[-1] + 1
+            for key_type in benchmark.KEY_TYPES:
+                converted = [benchmark.convert_key(k, key_type) for k in keys]
+                assert converted == sorted(converted)
+        # Runs are consecutive, so the run-based containers compress them.
+        keys = benchmark.int_keys(10000, 'runs', rng)
+        assert len(RangeSet(keys)._low_keys) < len(keys) // 100
+        assert len(DeltaMap(zip(keys, keys))._low_keys) < len(keys) // 100
+        with self.assertRaises(ValueError):
+            benchmark.int_keys(10, 'bogus', rng)
+        with self.assertRaises(ValueError):
+            benchmark.convert_key(10, 'bogus')
+
+    def test_run(self):
+        messages = []
+        rv = benchmark.run(sizes=[10], merge_ways=[2, 5], lookups=5, repeat=1, progress=messages.append)
+        assert len(messages) == len({(r['class'], r['key_type'], r['distribution'], r['algo']) for r in rv['results']})
+        results = rv['results']
+        assert {r['class'] for r in results} == set(benchmark.SET_CLASSES + benchmark.MAP_CLASSES + list(benchmark.MERGE_CLASSES))
+        assert {r['operation'] for r in results} == set(benchmark.OPERATIONS)
+        assert not any(r['operation'].startswith('getitem_') for r in results if r['class'] in benchmark.SET_CLASSES)
+        assert not any(r['key_type'] != 'int' for r in results if r['class'] in benchmark.INT_KEY_CLASSES)
+        assert all(r['seconds'] >= 0 for r in results)
+        merges = [r for r in results if r['operation'] == 'merge']
+        assert {r['class'] for r in merges} == set(benchmark.MERGE_CLASSES)
+        assert {r['ways'] for r in merges} == {2, 5}
+        assert len(merges) == 2 * len(benchmark.MERGE_CLASSES) * len(benchmark.KEY_TYPES) * len(benchmark.DISTRIBUTIONS)
+
+    def test_main(self):
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            benchmark.main(['--classes', 'SortedSet,MinIter', '--algos', 'stree', '--sizes', '10', '--key-types', 'str', '--distributions', 'runs', '--operations', 'iterate', '--repeat', '1'])
+        rv = json.loads(out.getvalue())
+        assert [(r['class'], r['algo'], r['size'], r['key_type'], r['distribution'], r['operation']) for r in rv['results']] == [('SortedSet', 'stree', 10, 'str', 'runs', 'iterate')]
+        assert err.getvalue() == 'SortedSet algo=stree size=10 keys=str dist=runs\n'
+
+    def test_main_merge(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            benchmark.main(['--classes', 'MinIter,SortedSet', '--sizes', '10', '--key-types', 'int', '--distributions', 'uniform', '--operations', 'merge', '--merge-ways', '4', '--repeat', '1', '--quiet'])
+        rv = json.loads(out.getvalue())
+        assert rv['meta']['merge_ways'] == [4]
+        assert [(r['class'], r['algo'], r['ways'], r['operation']) for r in rv['results']] == [('MinIter', None, 4, 'merge')]
@@ -15,6 +15,9 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import array
+import itertools
+import operator
 import random
 import string
 import unittest
@@ -31,6 +34,10 @@ class TestMinIter(unittest.TestCase):
         assert list(MinIter([0, 2, 4, 6, 8], [1, 3, 5, 7, 9])) == lr10
         assert list(MinIter([1, 3, 5, 7, 9], [0, 2, 4, 6, 8])) == lr10
         assert list(MinIter([0], [0])) == [0, 0]
+        for perm in itertools.permutations([[0, 3], [1, 4], [2, 5]]):
+            assert list(MinIter(*perm)) == list(range(6))
+        for perm in itertools.permutations([[0], [1], [2]]):
+            assert list(MinIter(*perm)) == list(range(3))
 
     def test_random(self):
         for _ in range(100):
@@ -44,3 +51,71 @@ class TestMinIter(unittest.TestCase):
                 samples.append(s)
             expected.sort()
             assert list(MinIter(*samples)) == expected
+
+    def test_random_heap(self):
+        # More than 3 iterables take the heap path.
+        for _ in range(100):
+            num_samples = random.randint(4, 20)
+            samples = [ordered_sample(string.ascii_lowercase, random.randint(0, 26)) for _ in range(num_samples)]
+            expected = sorted(c for s in samples for c in s)
+            assert list(MinIter(*samples)) == expected
+
+    def test_stable(self):
+        class Key:
+            def __init__(self, key, tag):
+                self.key = key
+                self.tag = tag
+
+            def __eq__(self, other):
+                return self.key == other.key
+
+            def __lt__(self, other):
+                return self.key < other.key
+
+        for num_samples in range(1, 8):
+            samples = [[Key(k, i) for k in sorted(random.choices(range(10), k=random.randint(0, 20)))] for i in range(num_samples)]
+            expected = sorted([k for s in samples for k in s], key=lambda k: k.key)
+            assert [(k.key, k.tag) for k in MinIter(*samples)] == [(k.key, k.tag) for k in expected]
+
+    def test_next(self):
+        for num_samples in range(6):
+            it = MinIter(*[[i, i + 10] for i in range(num_samples)])
+            assert iter(it) is it
+            values = [next(it) for _ in range(2 * num_samples)]
+            assert values == sorted(list(range(num_samples)) + list(range(10, 10 + num_samples)))
+            with self.assertRaises(StopIteration):
+                next(it)
+
+    def test_key_reverse(self):
+        samples = [[-2, 3, 5], [1, -3], [2, -4, -5]]
+        assert list(MinIter(*samples, key=abs)) == [1, -2, 2, 3, -3, -4, 5, -5]
+        for num_samples in range(6):
+            samples = [sorted(random.choices(range(10), k=random.randint(0, 20)), reverse=True) for _ in range(num_samples)]
+            expected = sorted([v for s in samples for v in s], reverse=True)
+            assert list(MinIter(*samples, reverse=True)) == expected
+            tagged = [[(v, i) for v in s] for i, s in enumerate(samples)]
+            expected = sorted([t for s in tagged for t in s], key=operator.itemgetter(0), reverse=True)
+            assert list(MinIter(*tagged, key=operator.itemgetter(0), reverse=True)) == expected
+
+    def test_dedup(self):
+        samples = [[0, 1, 3], [1, 2, 3], [3, 4]]
+        assert list(MinIter(*samples, dedup=True)) == [0, 1, 2, 3, 4]
+        pairs = [[(k, 1) for k in s] for s in samples]
+        assert list(MinIter(*pairs, key=operator.itemgetter(0), dedup=True, combine=lambda a, b: (a[0], a[1] + b[1]))) == [(0, 1), (1, 2), (2, 1), (3, 3), (4, 1)]
+        assert list(MinIter(*pairs, key=operator.itemgetter(0), dedup=True)) == [(0, 1), (1, 1), (2, 1), (3, 1), (4, 1)]
+        assert list(MinIter([3, 1], [2, 1], reverse=True, dedup=True)) == [3, 2, 1]
+        with self.assertRaises(ValueError):
+            MinIter(*samples, combine=max)
+
+    def test_chunks(self):
+        samples = [range(0, 100, 3), range(1, 100, 3), range(2, 100, 3), range(100, 110)]
+        it = MinIter(*samples)
+        chunk = it.next_chunk(5)
+        assert chunk == [0, 1, 2, 3, 4]
+        chunk = it.next_chunk(5, 'q')
+        assert chunk == array.array('q', range(5, 10))
+        chunks = list(it.iter_chunks(40))
+        assert [len(c) for c in chunks] == [40, 40, 20]
+        chunk = it.next_chunk(5)
+        assert chunk == []
+        assert list(MinIter(range(10)).iter_chunks(5, 'b')) == [array.array('b', range(5)), array.array('b', range(5, 10))]